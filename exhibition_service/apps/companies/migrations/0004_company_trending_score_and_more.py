@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_update_company_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг "в тренде"'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['status', 'is_active', '-trending_score'], name='companies_status_36342f_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:57
+
+from django.db import migrations, models
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    """Geohash точки (копия apps.core.geo на момент миграции)"""
+    if latitude is None or longitude is None:
+        return ''
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    result = []
+    bits, bit_count, even = 0, 0, True
+    while len(result) < precision:
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            result.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(result)
+
+
+def fill_cells(apps, schema_editor):
+    Company = apps.get_model('companies', 'Company')
+    batch = []
+    for instance in Company.objects.only('pk', 'latitude', 'longitude').iterator(chunk_size=1000):
+        instance.geo_cell = encode_geohash(instance.latitude, instance.longitude)
+        if instance.geo_cell:
+            batch.append(instance)
+    Company.objects.bulk_update(batch, ['geo_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_company_trending_score_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='Geohash координат'),
+        ),
+        migrations.RunPython(fill_cells, migrations.RunPython.noop),
+    ]
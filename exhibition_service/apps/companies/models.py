@@ -3,11 +3,21 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.urls import reverse
-from django.utils.text import slugify
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
-from PIL import Image
-import os
+
+from apps.core.autocomplete import autocomplete
+from apps.core.counters import counters
+from apps.core.geo import geo_cells, in_bbox, near
+from apps.core.images import image_derivatives
+from apps.core.map_clusters import map_clusters
+from apps.core.metrics import metric_series, metric_totals, record_increment, upsert_increments
+from apps.core.search import ranked_search, search_indexes
+from apps.core.search_cache import cached_search, search_results
+from apps.core.slugs import slugs
+from apps.core.unique_visitors import unique_visitors
+from apps.core.trending import trending
+from apps.core.view_counters import view_counter_buffer
 
 
 class CompanyManager(models.Manager):
@@ -25,8 +35,27 @@ class CompanyManager(models.Manager):
         """Компании по категории"""
         return self.active().filter(category=category)
     
-    def search(self, query):
-        """Поиск компаний"""
+    def search(self, query, request=None, cached=True, record=True, limit=None):
+        """
+        Полнотекстовый поиск по компаниям, их продукции и тегам по убыванию релевантности.
+        cached - через кэш результатов с записью запроса в аналитику;
+        limit - предел выдачи (по умолчанию SEARCH_MAX_RESULTS, см. search_truncated)
+        """
+        fallback = lambda: self.search_icontains(query)
+        if not cached:
+            return ranked_search(self.active(), query, fallback=fallback, limit=limit)
+        return cached_search(self.active(), query, fallback=fallback, request=request, record=record, limit=limit)
+    
+    def near(self, latitude, longitude, km):
+        """Активные компании в радиусе km от точки по возрастанию расстояния (distance_km)"""
+        return near(self.active(), latitude, longitude, km)
+    
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Активные компании в прямоугольнике карты"""
+        return in_bbox(self.active(), min_lat, min_lon, max_lat, max_lon)
+    
+    def search_icontains(self, query):
+        """Поиск компаний по вхождению подстроки (без полнотекстового индекса)"""
         return self.active().filter(
             models.Q(name__icontains=query) |
             models.Q(description__icontains=query) |
@@ -38,6 +67,10 @@ class CompanyManager(models.Manager):
         """Популярные компании по просмотрам"""
         return self.active().order_by('-views_count', '-rating')[:limit]
     
+    def trending(self, limit=10):
+        """Компании "в тренде" по затухающему рейтингу активности"""
+        return self.active().order_by('-trending_score')[:limit]
+    
     def featured(self):
         """Рекомендуемые компании"""
         return self.active().filter(is_featured=True)
@@ -148,6 +181,7 @@ class Company(models.Model):
         null=True, 
         blank=True
     )
+    geo_cell = models.CharField(_('Geohash координат'), max_length=12, blank=True, db_index=True, editable=False)
     
     # Дополнительная информация
     founded_year = models.PositiveIntegerField(
@@ -188,6 +222,7 @@ class Company(models.Model):
     views_count = models.PositiveIntegerField(_('Количество просмотров'), default=0)
     favorites_count = models.PositiveIntegerField(_('Количество добавлений в избранное'), default=0)
     contact_requests_count = models.PositiveIntegerField(_('Количество обращений'), default=0)
+    trending_score = models.FloatField(_('Рейтинг "в тренде"'), default=0, editable=False)
     
     # Рейтинг
     rating = models.DecimalField(
@@ -225,6 +260,7 @@ class Company(models.Model):
             models.Index(fields=['category']),
             models.Index(fields=['city', 'country']),
             models.Index(fields=['-views_count']),
+            models.Index(fields=['status', 'is_active', '-trending_score']),
             models.Index(fields=['-rating']),
             models.Index(fields=['-created_at']),
         ]
@@ -233,53 +269,21 @@ class Company(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        # Автоматическое создание slug
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Company.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        
         # Устанавливаем дату публикации при активации
         if self.status == self.Status.ACTIVE and not self.published_at:
             self.published_at = timezone.now()
         
-        super().save(*args, **kwargs)
-        
-        # Обрабатываем изображения после сохранения
-        self._process_images()
-
-    def _process_images(self):
-        """Обработка загруженных изображений"""
-        if self.logo and os.path.exists(self.logo.path):
-            self._resize_image(self.logo.path, (300, 300))
-        if self.banner_image and os.path.exists(self.banner_image.path):
-            self._resize_image(self.banner_image.path, (1200, 400))
-
-    def _resize_image(self, image_path, size):
-        """Изменяет размер изображения"""
-        try:
-            with Image.open(image_path) as img:
-                img.thumbnail(size, Image.Resampling.LANCZOS)
-                img.save(image_path, optimize=True, quality=85)
-        except Exception as e:
-            print(f"Error processing image {image_path}: {e}")
+        # Автоматическое создание slug (apps.core.slugs)
+        # Производные логотипа и баннера строятся в фоне (apps.core.images)
+        slugs.save(self, super().save, *args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('companies:detail', kwargs={'slug': self.slug})
 
     def increment_views(self):
-        """Увеличивает счетчик просмотров"""
+        """Увеличивает счетчик просмотров (запись в БД - через буфер)"""
+        view_counter_buffer.increment(self)
         self.views_count += 1
-        self.save(update_fields=['views_count'])
-
-    def increment_contact_requests(self):
-        """Увеличивает счетчик обращений"""
-        self.contact_requests_count += 1
-        self.save(update_fields=['contact_requests_count'])
 
     def update_rating(self):
         """Обновляет рейтинг на основе отзывов"""
@@ -370,9 +374,7 @@ class CompanyTag(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        slugs.save(self, super().save, *args, **kwargs)
 
     @property
     def companies_count(self):
@@ -462,17 +464,8 @@ class CompanyProduct(models.Model):
         return f"{self.company.name} - {self.name}"
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while CompanyProduct.objects.filter(
-                company=self.company, slug=slug
-            ).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        # slug уникален в пределах компании
+        slugs.save(self, super().save, *args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('companies:product_detail', kwargs={
@@ -481,9 +474,9 @@ class CompanyProduct(models.Model):
         })
 
     def increment_views(self):
-        """Увеличивает счетчик просмотров"""
+        """Увеличивает счетчик просмотров (запись в БД - через буфер)"""
+        view_counter_buffer.increment(self)
         self.views_count += 1
-        self.save(update_fields=['views_count'])
 
     def increment_inquiries(self):
         """Увеличивает счетчик запросов"""
@@ -862,11 +855,8 @@ class CompanyContact(models.Model):
         if self.status == self.Status.REPLIED and not self.replied_at:
             self.replied_at = timezone.now()
         
+        # Счетчик обращений компании обновляется через apps.core.counters
         super().save(*args, **kwargs)
-        
-        # Увеличиваем счетчик обращений к компании
-        if self._state.adding:  # Только при создании
-            self.company.increment_contact_requests()
 
     def mark_as_replied(self, reply_message, replied_by):
         """Отмечает обращение как отвеченное"""
@@ -926,43 +916,61 @@ class CompanyAnalytics(models.Model):
 
     @classmethod
     def record_metric(cls, company, metric_type, value=1, date=None, **kwargs):
-        """Записывает метрику"""
+        """
+        Записывает метрику. В рамках HTTP-запроса запись откладывается
+        до конца ответа и выполняется одной пачкой
+        """
         if date is None:
             date = timezone.now().date()
         
-        metric, created = cls.objects.get_or_create(
-            company=company,
-            metric_type=metric_type,
-            date=date,
-            defaults={'value': value, **kwargs}
+        record_increment(
+            cls,
+            {'company': company, 'metric_type': metric_type, 'date': date, 'value': value, **kwargs},
+            conflict_fields=('company', 'metric_type', 'date')
         )
-        
-        if not created:
-            metric.value += value
-            metric.save(update_fields=['value'])
-        
-        return metric
+
+    @classmethod
+    def record_metrics_bulk(cls, metrics):
+        """
+        Записывает пачку метрик одним upsert-запросом.
+        metrics - словари с ключами company, metric_type, value (по умолчанию 1),
+        date (по умолчанию сегодня) и необязательными source, user_agent, ip_address
+        """
+        today = timezone.now().date()
+        rows = [
+            {'value': 1, **metric, 'date': metric.get('date') or today}
+            for metric in metrics
+        ]
+        return upsert_increments(cls, rows, conflict_fields=('company', 'metric_type', 'date'))
 
     @classmethod
     def get_company_stats(cls, company, start_date=None, end_date=None):
-        """Получает статистику компании за период"""
-        queryset = cls.objects.filter(company=company)
-        
-        if start_date:
-            queryset = queryset.filter(date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(date__lte=end_date)
-        
-        stats = {}
-        for metric_type, _ in cls.MetricType.choices:
-            stats[metric_type] = queryset.filter(
-                metric_type=metric_type
-            ).aggregate(
-                total=models.Sum('value')
-            )['total'] or 0
-        
+        """Получает статистику компании за период (с оценкой уникальных посетителей, см. UniqueVisitors.stats)"""
+        stats = metric_totals(
+            cls.objects.filter(company=company),
+            cls.MetricType.values,
+            start_date=start_date,
+            end_date=end_date
+        )
+        stats.update(unique_visitors.stats(company, start_date, end_date))
         return stats
 
+    @classmethod
+    def get_stats_series(cls, companies, start_date=None, end_date=None, period='day'):
+        """
+        Итоги и ряды по дням/неделям/месяцам (period: day, week, month)
+        для одной или нескольких компаний одним запросом
+        """
+        return metric_series(
+            cls.objects.all(),
+            'company',
+            companies,
+            cls.MetricType.values,
+            start_date=start_date,
+            end_date=end_date,
+            period=period
+        )
+
 
 class CompanyCertificate(models.Model):
     """Сертификаты и награды компании"""
@@ -1066,11 +1074,7 @@ def company_post_save(sender, instance, created, **kwargs):
 def favorite_company_post_save(sender, instance, created, **kwargs):
     """Действия после добавления в избранное"""
     if created:
-        # Увеличиваем счетчик
-        instance.company.favorites_count += 1
-        instance.company.save(update_fields=['favorites_count'])
-        
-        # Логируем активность
+        # Логируем активность (счетчик обновляется через apps.core.counters)
         try:
             from apps.users.models import UserActivity
             UserActivity.log_activity(
@@ -1084,12 +1088,7 @@ def favorite_company_post_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=FavoriteCompany)
 def favorite_company_post_delete(sender, instance, **kwargs):
     """Действия после удаления из избранного"""
-    # Уменьшаем счетчик
-    if instance.company.favorites_count > 0:
-        instance.company.favorites_count -= 1
-        instance.company.save(update_fields=['favorites_count'])
-    
-    # Логируем активность
+    # Логируем активность (счетчик обновляется через apps.core.counters)
     try:
         from apps.users.models import UserActivity
         UserActivity.log_activity(
@@ -1114,6 +1113,94 @@ def company_review_post_save(sender, instance, created, **kwargs):
         )
 
 
+# Уникальные slug
+slugs.register('companies.Company', source='name')
+slugs.register('companies.CompanyTag', source='name')
+slugs.register('companies.CompanyProduct', source='name', scope=('company_id',))
+
+# Денормализованные счетчики компаний
+counters.register('companies.Company', 'favorites_count', 'companies.FavoriteCompany', 'company')
+counters.register('companies.Company', 'contact_requests_count', 'companies.CompanyContact', 'company')
+
+
+# Рейтинг "в тренде"
+trending.register(
+    'companies.Company',
+    weights={'view': 1, 'favorite': 5, 'contact': 10},
+    sources={
+        'favorite': ('companies.FavoriteCompany', 'company'),
+        'contact': ('companies.CompanyContact', 'company'),
+    },
+)
+
+
+# Полнотекстовый поиск: документ компании включает продукцию, характеристики и теги
+def _flatten_specifications(value):
+    """Ключи и значения технических характеристик (JSON любой вложенности)"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield str(key)
+            yield from _flatten_specifications(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _flatten_specifications(item)
+    elif value not in (None, ''):
+        yield str(value)
+
+
+def company_search_document(company):
+    """Тексты поискового документа компании по весам"""
+    products = [product for product in company.products.all() if product.is_active]
+    tags = [tag.name for tag in company.tags.all() if tag.is_active]
+    specifications = [
+        text for product in products
+        for text in _flatten_specifications(product.specifications)
+    ]
+    return {
+        'a': ' '.join([company.name, *tags]),
+        'b': ' '.join([company.short_description, company.city, *(product.name for product in products)]),
+        'c': ' '.join([
+            company.description,
+            *(f'{product.short_description} {product.description}' for product in products),
+            *specifications,
+        ]),
+    }
+
+
+search_indexes.register(
+    'companies.Company',
+    document=company_search_document,
+    condition={'is_active': True, 'status': 'active'},
+    prefetch=['products', 'tags'],
+    related={
+        'companies.CompanyProduct': lambda product: [product.company_id],
+        'companies.CompanyTag': lambda tag: tag.companies.values_list('pk', flat=True),
+    },
+    m2m=['companies.Company_tags'],
+)
+search_results.register('companies.Company')
+
+autocomplete.register(
+    'companies.Company',
+    kind='company',
+    label='name',
+    weight='views_count',
+    condition={'is_active': True, 'status': 'active'},
+    city='city',
+)
+
+# Производные изображения (превью, карточки, баннеры)
+image_derivatives.register('companies.Company', 'logo', 'banner_image')
+image_derivatives.register('companies.CompanyGallery', 'image')
+
+# Геоячейки: поиск по координатам и кластеры карты
+geo_cells.register('companies.Company')
+map_clusters.register(
+    'companies.Company',
+    kind='company',
+    condition={'is_active': True, 'status': 'active'},
+)
+
 # Дополнительные менеджеры и методы
 class CompanyQuerySet(models.QuerySet):
     """Дополнительные методы для запросов компаний"""
@@ -1,3 +1,158 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.core.slugs import MAX_ATTEMPTS, SlugAllocator
+from apps.core.unique_visitors import unique_visitors
+from apps.exhibitions.models import Category
+
+from .models import Company, CompanyAnalytics, CompanyProduct, CompanyTag
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SYNC_INGESTION = {'BACKEND': 'sync'}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class CompanySlugTests(TestCase):
+    """Выделение уникальных slug компаний"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.category = Category.objects.create(name='Build')
+
+    def create(self, name):
+        return Company.objects.create(
+            name=name, description='-', created_by=self.user, category=self.category, status='active',
+        )
+
+    def test_cyrillic_names_are_transliterated(self):
+        self.assertEqual(self.create('Стройёмкость').slug, 'strojemkost')
+        self.assertEqual(self.create('Щит и Меч').slug, 'shchit-i-mech')
+        self.assertEqual(self.create('Стройёмкость').slug, 'strojemkost-1')
+
+    def test_race_for_slug_retries_with_next_free(self):
+        self.create('Acme')
+        taken = SlugAllocator.taken
+
+        def stale_first(allocator, *args, **kwargs):
+            # Первое чтение не видит slug, занятый "другим процессом"
+            return set() if patched.call_count == 1 else taken(allocator, *args, **kwargs)
+
+        with mock.patch.object(SlugAllocator, 'taken', autospec=True, side_effect=stale_first) as patched:
+            company = self.create('Acme')
+        self.assertEqual(company.slug, 'acme-1')
+        self.assertEqual(patched.call_count, 2)
+
+    def test_race_gives_up_after_max_attempts(self):
+        self.create('Acme')
+        with mock.patch.object(SlugAllocator, 'taken', return_value=set()) as patched, \
+                self.assertRaises(IntegrityError):
+            self.create('Acme')
+        self.assertEqual(patched.call_count, MAX_ATTEMPTS)
+        self.assertEqual(Company.objects.filter(name='Acme').count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class CompanySearchDocumentTests(TestCase):
+    """Поисковый документ компании с продукцией и тегами"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.company = Company.objects.create(
+            name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+            status='active',
+        )
+
+    def search(self, query):
+        return list(Company.objects.search(query, cached=False, record=False))
+
+    def test_products_specifications_and_tags_are_indexed(self):
+        product = CompanyProduct.objects.create(
+            company=self.company, name='Экскаватор',
+            specifications={'Двигатель': {'мощность': '120 кВт'}, 'Материалы': ['нержавейка']},
+        )
+        self.assertEqual(self.search('экскаватор'), [self.company])
+        self.assertEqual(self.search('нержавейка'), [self.company])
+
+        tag = CompanyTag.objects.create(name='Спецтехника')
+        self.company.tags.add(tag)
+        self.assertEqual(self.search('спецтехника'), [self.company])
+        self.company.tags.remove(tag)
+        self.assertEqual(self.search('спецтехника'), [])
+
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.search('экскаватор'), [])
+
+    def test_inactive_company_leaves_index(self):
+        self.assertEqual(self.search('acme'), [self.company])
+        self.company.status = Company.Status.SUSPENDED
+        self.company.save()
+        self.assertEqual(self.search('acme'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class CompanyStatsTests(TestCase):
+    """Статистика компании за период"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.company = Company.objects.create(
+            name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+            status='active',
+        )
+        today = timezone.localdate()
+        for days_ago in (0, 40):
+            CompanyAnalytics.objects.create(
+                company=self.company, metric_type=CompanyAnalytics.MetricType.VIEWS,
+                date=today - timedelta(days=days_ago), value=1,
+            )
+
+    def test_unique_visitors_use_requested_period(self):
+        start_date = timezone.localdate() - timedelta(days=7)
+        with mock.patch.object(unique_visitors, 'count', return_value=3) as count:
+            stats = CompanyAnalytics.get_company_stats(self.company, start_date=start_date)
+        count.assert_called_once_with(self.company, start_date, None)
+        self.assertEqual(stats[CompanyAnalytics.MetricType.VIEWS], 1)
+        self.assertEqual(stats['unique_visitors'], 3)
+
+    def test_all_time_stats_label_unique_visitor_window(self):
+        with mock.patch.object(unique_visitors, 'count', return_value=3):
+            stats = CompanyAnalytics.get_company_stats(self.company)
+        self.assertEqual(stats[CompanyAnalytics.MetricType.VIEWS], 2)
+        self.assertEqual(stats['unique_visitors_30d'], 3)
+        self.assertNotIn('unique_visitors', stats)
+
+    def test_series_by_week_for_several_companies(self):
+        other = Company.objects.create(
+            name='Other', description='-', created_by=self.company.created_by, category=self.company.category,
+            status='active',
+        )
+        views, clicks = CompanyAnalytics.MetricType.VIEWS, CompanyAnalytics.MetricType.CLICKS
+        CompanyAnalytics.record_metrics_bulk([
+            {'company': self.company, 'metric_type': views, 'date': date(2025, 1, 6), 'value': 2},
+            {'company': self.company, 'metric_type': views, 'date': date(2025, 1, 8)},
+            {'company': self.company, 'metric_type': views, 'date': date(2025, 1, 21)},
+            {'company': other, 'metric_type': clicks, 'date': date(2025, 1, 14), 'value': 5},
+        ])
+
+        result = CompanyAnalytics.get_stats_series(
+            [self.company, other], start_date=date(2025, 1, 6), end_date=date(2025, 1, 26), period='week',
+        )
+        weeks = [date(2025, 1, 6), date(2025, 1, 13), date(2025, 1, 20)]
+        self.assertEqual(
+            result[self.company.pk]['series'][views],
+            [{'date': week, 'value': value} for week, value in zip(weeks, [3, 0, 1])],
+        )
+        self.assertEqual(result[self.company.pk]['totals'][views], 4)
+        self.assertEqual(result[self.company.pk]['totals'][clicks], 0)
+        self.assertEqual(result[other.pk]['totals'], {**dict.fromkeys(CompanyAnalytics.MetricType.values, 0), clicks: 5})
+
+    def test_series_rejects_unknown_period(self):
+        with self.assertRaises(ValueError):
+            CompanyAnalytics.get_stats_series(self.company, period='year')
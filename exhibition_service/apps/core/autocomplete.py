@@ -0,0 +1,654 @@
+# exhibition_service/apps/core/autocomplete.py
+"""
+Автодополнение по префиксу: названия выставок, компаний и города.
+
+Подсказки отдаются из снимка - бинарного файла, который отображается
+в память (mmap) всеми воркерами, поэтому запрос не обращается к БД.
+Для каждого объекта в снимок попадают ключи, начинающиеся с каждого
+слова названия ("выставка строительства", "строительства"), так что
+находится и вхождение с середины названия. Ключи нормализованы
+(normalize_text): регистр, ё -> е, пунктуация.
+
+Формат файла:
+    заголовок: MAGIC, uint32 число записей, uint32 число префиксов со списками,
+               uint32 длина списков, uint32 длина короткого префикса, uint32 MAX_SCAN
+    записи (по возрастанию ключа в UTF-8): uint32 смещение ключа,
+               uint16 длина ключа, uint32 смещение payload, uint16 длина, float вес
+    префиксы: uint32 смещение, uint16 длина, uint32 начало списка, uint32 длина списка
+    списки: uint32 номера записей (лучшие по весу для префикса)
+    данные: ключи и JSON payload подряд
+
+Для коротких префиксов (1-2 символа) и для любых префиксов, с которых
+начинается больше MAX_SCAN записей, лучшие подсказки посчитаны заранее.
+Остальные префиксы совпадают не более чем с MAX_SCAN записями подряд,
+и запрос ранжирует их все.
+
+Снимок целиком строит команда build_autocomplete. Изменения выставок
+и компаний накапливаются UPDATE_DELAY секунд и пишутся фоновым потоком
+в небольшой файл дельты рядом со снимком (<снимок>.delta): удаленные
+из снимка объекты и их новые ключи. Подсказки снимка и дельты
+сливаются при запросе. Когда дельта превышает DELTA_MAX_ENTRIES, она
+вливается в снимок, при полной пересборке - отбрасывается. Файлы
+заменяются атомарно, воркеры переоткрывают их при смене mtime. Веса
+городов пересчитываются только при полной пересборке.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+
+from .search import normalize_text
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PPAC2\x00\x00\x00'
+HEADER = struct.Struct('<8sIIIII')
+RECORD = struct.Struct('<IHIHf')
+PREFIX = struct.Struct('<IHII')
+INDEX = struct.Struct('<I')
+
+DEFAULT_SETTINGS = {
+    'SNAPSHOT_PATH': '',
+    'SHORT_PREFIX_LENGTH': 2,
+    'TOP_K': 20,
+    'MAX_WORDS': 6,  # ключей на объект не больше, чем слов в начале названия
+    'MAX_SCAN': 1000,  # записей, просматриваемых на один запрос; для более частых префиксов - списки
+    'UPDATE_DELAY': 2,  # секунды накопления изменений перед записью дельты
+    'DELTA_MAX_ENTRIES': 5000,  # ключей и удалений в дельте, после которых она вливается в снимок
+    'RELOAD_CHECK_INTERVAL': 1,  # секунды между проверками mtime
+}
+
+CITY = 'city'
+
+
+def get_autocomplete_settings():
+    """Настройки автодополнения с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'AUTOCOMPLETE', {})}
+
+
+def _payload_bytes(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _listed_prefixes(texts, short_prefix_length, max_scan):
+    """
+    {префикс: (первая запись, последняя + 1)} для префиксов, которым нужен
+    список лучших: короткие и совпадающие больше чем с max_scan записями.
+    texts упорядочены, поэтому записи с общим префиксом идут подряд
+    """
+    result = {}
+    ranges, length = [(0, len(texts))], 1
+    while ranges:
+        deeper = []
+        for start, end in ranges:
+            number = start
+            while number < end:
+                if len(texts[number]) < length:
+                    number += 1
+                    continue
+                prefix = texts[number][:length]
+                stop = number + 1
+                while stop < end and texts[stop].startswith(prefix):
+                    stop += 1
+                if length <= short_prefix_length or stop - number > max_scan:
+                    result[prefix] = (number, stop)
+                if length < short_prefix_length or stop - number > max_scan:
+                    deeper.append((number, stop))
+                number = stop
+        ranges, length = deeper, length + 1
+    return result
+
+
+def write_snapshot(entries, path, short_prefix_length=2, top_k=20, max_scan=1000):
+    """
+    Записывает снимок из (ключ, вес, payload). Файл заменяется атомарно:
+    открытые в воркерах отображения остаются валидными. Возвращает число записей
+    """
+    blob = bytearray()
+    payload_offsets = {}
+    records = []
+    for key, weight, payload in entries:
+        if not key:
+            continue
+        data = payload if isinstance(payload, bytes) else _payload_bytes(payload)
+        if data not in payload_offsets:
+            payload_offsets[data] = len(blob)
+            blob += data
+        records.append((key.encode('utf-8'), float(weight), payload_offsets[data], len(data)))
+    records.sort(key=lambda record: (record[0], -record[1]))
+
+    packed_records = bytearray()
+    for key, weight, payload_offset, payload_length in records:
+        packed_records += RECORD.pack(len(blob), len(key), payload_offset, payload_length, weight)
+        blob += key
+
+    texts = [record[0].decode('utf-8') for record in records]
+    listed = _listed_prefixes(texts, short_prefix_length, max_scan)
+    packed_prefixes = bytearray()
+    lists = bytearray()
+    list_length = 0
+    for prefix in sorted(listed, key=lambda value: value.encode('utf-8')):
+        start, end = listed[prefix]
+        best, seen = [], set()
+        for number in sorted(range(start, end), key=lambda item: -records[item][1]):
+            if records[number][2] in seen:
+                continue
+            seen.add(records[number][2])
+            best.append(number)
+            if len(best) >= top_k:
+                break
+        encoded = prefix.encode('utf-8')
+        packed_prefixes += PREFIX.pack(len(blob), len(encoded), list_length, len(best))
+        blob += encoded
+        for number in best:
+            lists += INDEX.pack(number)
+        list_length += len(best)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as output:
+        output.write(HEADER.pack(
+            MAGIC, len(records), len(packed_prefixes) // PREFIX.size, list_length, short_prefix_length, max_scan
+        ))
+        output.write(packed_records)
+        output.write(packed_prefixes)
+        output.write(lists)
+        output.write(blob)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class AutocompleteSnapshot:
+    """Снимок автодополнения, отображенный в память"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as source:
+            self._mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, self.prefix_count, list_length, self.short_prefix_length, self.max_scan = (
+            HEADER.unpack_from(self._mmap, 0)
+        )
+        if magic != MAGIC:
+            raise ValueError('Неверный формат снимка автодополнения')
+        self._records_start = HEADER.size
+        self._prefixes_start = self._records_start + self.size * RECORD.size
+        self._lists_start = self._prefixes_start + self.prefix_count * PREFIX.size
+        self._blob_start = self._lists_start + list_length * INDEX.size
+
+    def close(self):
+        self._mmap.close()
+
+    def _bytes(self, offset, length):
+        start = self._blob_start + offset
+        return self._mmap[start:start + length]
+
+    def _record(self, number):
+        return RECORD.unpack_from(self._mmap, self._records_start + number * RECORD.size)
+
+    def _key(self, number):
+        key_offset, key_length = self._record(number)[:2]
+        return self._bytes(key_offset, key_length)
+
+    def _lower_bound(self, key):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _prefix_list(self, key):
+        """Номера лучших записей для префикса со списком; None, если списка нет"""
+        low, high = 0, self.prefix_count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, start, length = PREFIX.unpack_from(
+                self._mmap, self._prefixes_start + middle * PREFIX.size
+            )
+            current = self._bytes(key_offset, key_length)
+            if current == key:
+                return [
+                    INDEX.unpack_from(self._mmap, self._lists_start + (start + item) * INDEX.size)[0]
+                    for item in range(length)
+                ]
+            if current < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def ranked(self, query, limit=10):
+        """[(вес, payload в байтах)] для префикса query по убыванию веса"""
+        prefix = normalize_text(query)
+        if not prefix or not self.size:
+            return []
+        key = prefix.encode('utf-8')
+
+        best = {}
+        numbers = self._prefix_list(key)
+        if numbers is None:
+            # Без списка префикс совпадает не более чем с max_scan записями подряд
+            start = self._lower_bound(key)
+            numbers = range(start, min(start + self.max_scan, self.size))
+        for number in numbers:
+            key_offset, key_length, payload_offset, payload_length, weight = self._record(number)
+            if not self._bytes(key_offset, key_length).startswith(key):
+                break
+            if best.get((payload_offset, payload_length), -1.0) < weight:
+                best[(payload_offset, payload_length)] = weight
+
+        ranked = sorted(best.items(), key=lambda item: -item[1])[:limit]
+        return [(weight, self._bytes(offset, length)) for (offset, length), weight in ranked]
+
+    def lookup(self, query, limit=10):
+        """Подсказки для префикса query по убыванию веса"""
+        return [json.loads(payload) for _, payload in self.ranked(query, limit)]
+
+    def contains(self, key, payload):
+        """Есть ли запись с ключом key и payload (в байтах)"""
+        encoded = key.encode('utf-8')
+        number = self._lower_bound(encoded)
+        while number < self.size:
+            key_offset, key_length, payload_offset, payload_length, _ = self._record(number)
+            if self._bytes(key_offset, key_length) != encoded:
+                return False
+            if self._bytes(payload_offset, payload_length) == payload:
+                return True
+            number += 1
+        return False
+
+    def entries(self):
+        """Все записи снимка: (ключ, вес, payload в байтах)"""
+        for number in range(self.size):
+            key_offset, key_length, payload_offset, payload_length, weight = self._record(number)
+            yield (
+                self._bytes(key_offset, key_length).decode('utf-8'),
+                weight,
+                self._bytes(payload_offset, payload_length),
+            )
+
+
+class AutocompleteDelta:
+    """
+    Изменения после записи снимка: объекты (тип, id), чьи ключи в снимке
+    устарели, и их новые ключи. Хранится в JSON рядом со снимком
+    """
+
+    def __init__(self, removed=(), entries=()):
+        self.removed = {(kind, pk) for kind, pk in removed}
+        self.entries = sorted(entries, key=lambda entry: (entry[0], -entry[1]))
+        self._keys = [key for key, _, _ in self.entries]
+
+    def __len__(self):
+        return len(self.removed) + len(self.entries)
+
+    @classmethod
+    def load(cls, path):
+        """Дельта из файла; пустая, если файла нет"""
+        try:
+            with open(path, 'rb') as source:
+                data = json.loads(source.read())
+        except FileNotFoundError:
+            return cls()
+        return cls(
+            data['removed'],
+            [(key, weight, payload.encode('utf-8')) for key, weight, payload in data['entries']],
+        )
+
+    def save(self, path):
+        """Записывает дельту атомарно"""
+        data = {
+            'removed': sorted(self.removed, key=lambda item: (item[0], str(item[1]))),
+            'entries': [(key, weight, payload.decode('utf-8')) for key, weight, payload in self.entries],
+        }
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as output:
+            output.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        os.replace(tmp_path, path)
+
+    def replace(self, changes, fresh):
+        """Дельта, в которой ключи объектов из changes заменены на fresh"""
+        changed = {(kind, pk) for kind, pks in changes.items() for pk in pks}
+        entries = [entry for entry in self.entries if _payload_id(entry[2]) not in changed]
+        return AutocompleteDelta(self.removed | changed, entries + list(fresh))
+
+    def contains(self, key, payload):
+        """Есть ли ключ key с payload (в байтах)"""
+        number = bisect_left(self._keys, key)
+        while number < len(self._keys) and self._keys[number] == key:
+            if self.entries[number][2] == payload:
+                return True
+            number += 1
+        return False
+
+    def ranked(self, query):
+        """[(вес, payload в байтах)] ключей дельты с префиксом query"""
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+        result = []
+        for number in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if not self._keys[number].startswith(prefix):
+                break
+            result.append((self.entries[number][1], self.entries[number][2]))
+        return result
+
+
+def _payload_id(payload):
+    """(тип, id) объекта по payload в байтах; у городов id нет"""
+    data = json.loads(payload)
+    return data['type'], data.get('id')
+
+
+class AutocompleteSource:
+    """Модель, названия объектов которой попадают в подсказки"""
+
+    def __init__(self, target, kind, label, weight=None, condition=None, city=None):
+        self.target_label = target
+        self.kind = kind
+        self.label_field = label
+        self.weight_field = weight
+        self.condition = condition or {}
+        self.city_field = city
+
+    @property
+    def model(self):
+        return apps.get_model(self.target_label)
+
+    def matches(self, instance):
+        return all(getattr(instance, name) == value for name, value in self.condition.items())
+
+    def queryset(self):
+        return self.model._base_manager.filter(**self.condition)
+
+    def entries(self, instance, max_words):
+        """Ключи объекта: с каждого из первых max_words слов названия"""
+        label = getattr(instance, self.label_field)
+        words = normalize_text(label).split()
+        weight = getattr(instance, self.weight_field) if self.weight_field else 0
+        payload = _payload_bytes({
+            'type': self.kind,
+            'id': instance.pk,
+            'slug': getattr(instance, 'slug', ''),
+            'label': label,
+        })
+        return [(' '.join(words[start:]), weight, payload) for start in range(min(len(words), max_words))]
+
+    def cities(self):
+        """{город: число объектов}"""
+        if not self.city_field:
+            return {}
+        rows = (
+            self.queryset()
+            .exclude(**{self.city_field: ''})
+            .values(self.city_field)
+            .annotate(total=Count('pk'))
+        )
+        return {row[self.city_field]: row['total'] for row in rows}
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
+
+
+def _city_entry(city, weight):
+    return normalize_text(city), weight, _payload_bytes({'type': CITY, 'label': city})
+
+
+class AutocompleteService:
+    """Источники подсказок, сборка снимка и фоновое применение изменений"""
+
+    def __init__(self):
+        self._sources = {}
+        self._snapshot = None
+        self._snapshot_mtime = None
+        self._delta = AutocompleteDelta()
+        self._delta_mtime = None
+        self._last_check = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def path(self):
+        return str(get_autocomplete_settings()['SNAPSHOT_PATH'] or '')
+
+    @property
+    def delta_path(self):
+        return f'{self.path}.delta'
+
+    def register(self, target, kind, label, weight=None, condition=None, city=None):
+        """Регистрирует источник и подключает обновление снимка при изменениях"""
+        source = AutocompleteSource(target, kind, label, weight, condition, city)
+        self._sources[kind] = source
+
+        def on_change(sender, instance, raw=False, **kwargs):
+            if not raw:
+                pk = instance.pk
+                transaction.on_commit(lambda: self.schedule(kind, pk))
+
+        post_save.connect(on_change, sender=target, weak=False, dispatch_uid=f'autocomplete:{kind}:save')
+        post_delete.connect(on_change, sender=target, weak=False, dispatch_uid=f'autocomplete:{kind}:delete')
+        return source
+
+    # Чтение
+
+    def get_snapshot(self):
+        """Снимок из SNAPSHOT_PATH; переоткрывается при замене файла. None, если файла нет"""
+        interval = get_autocomplete_settings()['RELOAD_CHECK_INTERVAL']
+        now = time.monotonic()
+        if self._last_check and now - self._last_check < interval:
+            return self._snapshot
+
+        with self._lock:
+            self._last_check = now
+            path = self.path
+            mtime = _mtime(path)
+            if mtime is None:
+                self._snapshot, self._snapshot_mtime = None, None
+            elif self._snapshot is None or mtime != self._snapshot_mtime:
+                try:
+                    self._snapshot = AutocompleteSnapshot(path)
+                    self._snapshot_mtime = mtime
+                except (OSError, ValueError, struct.error):
+                    logger.exception('Не удалось открыть снимок автодополнения %s', path)
+                    self._snapshot = None
+
+            mtime = _mtime(self.delta_path) if path else None
+            if mtime != self._delta_mtime:
+                try:
+                    self._delta = AutocompleteDelta.load(self.delta_path)
+                except (OSError, ValueError, KeyError, TypeError):
+                    logger.exception('Не удалось прочитать дельту автодополнения %s', self.delta_path)
+                    self._delta = AutocompleteDelta()
+                self._delta_mtime = mtime
+        return self._snapshot
+
+    def suggest(self, query, limit=10):
+        """Подсказки для префикса: [{type, id, slug, label}, ...]; города без id"""
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return []
+        delta = self._delta
+        best = {}
+        # Устаревшие записи снимка отбрасываются, поэтому их берется с запасом
+        for weight, payload in snapshot.ranked(query, limit + len(delta.removed)):
+            if not delta.removed or _payload_id(payload) not in delta.removed:
+                best[payload] = weight
+        for weight, payload in delta.ranked(query):
+            if best.get(payload, -1.0) < weight:
+                best[payload] = weight
+        ranked = sorted(best.items(), key=lambda item: -item[1])[:limit]
+        return [json.loads(payload) for payload, _ in ranked]
+
+    # Запись
+
+    @contextmanager
+    def _write_lock(self):
+        """Межпроцессная блокировка записи снимка"""
+        if fcntl is None:
+            yield
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(f'{self.path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, entries):
+        options = get_autocomplete_settings()
+        written = write_snapshot(
+            entries, self.path, options['SHORT_PREFIX_LENGTH'], options['TOP_K'], options['MAX_SCAN']
+        )
+        # Записи дельты вошли в снимок
+        try:
+            os.remove(self.delta_path)
+        except FileNotFoundError:
+            pass
+        self._last_check = 0
+        return written
+
+    def rebuild(self, batch_size=2000):
+        """Пересобирает снимок из БД. Возвращает число записей"""
+        if not self.path:
+            raise ValueError('AUTOCOMPLETE["SNAPSHOT_PATH"] не задан')
+        max_words = get_autocomplete_settings()['MAX_WORDS']
+        entries = []
+        cities = defaultdict(int)
+        for source in self._sources.values():
+            for instance in source.queryset().iterator(chunk_size=batch_size):
+                entries.extend(source.entries(instance, max_words))
+            for city, total in source.cities().items():
+                cities[city] += total
+        entries.extend(_city_entry(city, total) for city, total in cities.items())
+        with self._write_lock():
+            return self._write(entries)
+
+    def apply_changes(self, changes):
+        """
+        Заменяет ключи измененных объектов: пишет их в дельту, а при
+        превышении DELTA_MAX_ENTRIES вливает дельту в снимок.
+        changes - {kind: {pk, ...}}. Без снимка ничего не делает.
+        Возвращает число новых ключей
+        """
+        path = self.path
+        if not path or not os.path.exists(path):
+            return 0
+        options = get_autocomplete_settings()
+
+        fresh, cities = [], set()
+        for kind, pks in changes.items():
+            source = self._sources[kind]
+            for instance in source.queryset().filter(pk__in=pks):
+                fresh.extend(source.entries(instance, options['MAX_WORDS']))
+                if source.city_field and getattr(instance, source.city_field):
+                    cities.add(getattr(instance, source.city_field))
+
+        with self._write_lock():
+            delta = AutocompleteDelta.load(self.delta_path)
+            snapshot = AutocompleteSnapshot(path)
+            try:
+                # Новые города до полной пересборки получают минимальный вес
+                for city in cities:
+                    key, weight, payload = _city_entry(city, 1)
+                    if not snapshot.contains(key, payload) and not delta.contains(key, payload):
+                        fresh.append((key, weight, payload))
+                delta = delta.replace(changes, fresh)
+                if len(delta) <= options['DELTA_MAX_ENTRIES']:
+                    delta.save(self.delta_path)
+                    self._last_check = 0
+                    return len(fresh)
+
+                entries, stale = [], {}
+                for key, weight, payload in snapshot.entries():
+                    if payload not in stale:
+                        stale[payload] = _payload_id(payload) in delta.removed
+                    if not stale[payload]:
+                        entries.append((key, weight, payload))
+            finally:
+                snapshot.close()
+            entries.extend(delta.entries)
+            self._write(entries)
+            return len(fresh)
+
+    def schedule(self, kind, pk):
+        """Ставит объект в очередь на обновление снимка"""
+        delay = get_autocomplete_settings()['UPDATE_DELAY']
+        with self._pending_lock:
+            self._pending.add((kind, pk))
+            if delay <= 0:
+                timer = None
+            elif self._timer is None:
+                self._timer = timer = threading.Timer(delay, self._run_pending)
+                timer.daemon = True
+            else:
+                return
+        if timer is None:
+            self.flush()
+        else:
+            timer.start()
+
+    def _run_pending(self):
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        """Применяет накопленные изменения"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+            self._timer = None
+        if not pending:
+            return 0
+        changes = defaultdict(set)
+        for kind, pk in pending:
+            changes[kind].add(pk)
+        try:
+            return self.apply_changes(changes)
+        except Exception:
+            logger.exception('Не удалось обновить снимок автодополнения')
+            return 0
+
+    def reset(self):
+        """Закрывает снимок и сбрасывает очередь (для тестов)"""
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+            self._snapshot, self._snapshot_mtime, self._last_check = None, None, 0
+            self._delta, self._delta_mtime = AutocompleteDelta(), None
+        with self._pending_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._pending, self._timer = set(), None
+
+
+autocomplete = AutocompleteService()
@@ -0,0 +1,94 @@
+# exhibition_service/apps/core/caching.py
+"""
+Инвалидация кэша через счетчик поколений.
+
+Ключи кэша включают номер поколения; чтобы сбросить все записи группы,
+достаточно увеличить счетчик (один INCR) - старые ключи перестают
+читаться и истекают по таймауту. Перебирать и удалять ключи не нужно.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+def make_signature(value):
+    """Короткий стабильный хэш JSON-сериализуемого значения для ключа кэша"""
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+class CacheGeneration:
+    """Счетчик поколений группы ключей кэша"""
+
+    def __init__(self, namespace, alias='default'):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def counter_key(self):
+        return f'{self.namespace}:generation'
+
+    def _seed(self):
+        """
+        Создает счетчик. Начальное значение - время в наносекундах:
+        после вытеснения счетчика оно больше всех выданных раньше
+        поколений, и старые записи группы не оживают
+        """
+        seed = time.time_ns()
+        self.cache.add(self.counter_key, seed, timeout=None)
+        return self.cache.get(self.counter_key, seed)
+
+    def current(self):
+        """Текущее поколение; счетчик создается при первом обращении"""
+        generation = self.cache.get(self.counter_key)
+        if generation is None:
+            generation = self._seed()
+        return generation
+
+    def bump(self):
+        """Начинает новое поколение: все ключи группы становятся недействительными"""
+        try:
+            return self.cache.incr(self.counter_key)
+        except ValueError:
+            # Счетчик вытеснен из кэша: новое начальное значение больше прежних
+            self._seed()
+            return self.cache.incr(self.counter_key)
+
+    def key(self, *parts):
+        """Ключ записи в текущем поколении"""
+        suffix = ':'.join(str(part) for part in parts)
+        return f'{self.namespace}:g{self.current()}:{suffix}'
+
+    def get_or_set(self, parts, compute, timeout=None):
+        """Значение из кэша текущего поколения или результат compute()"""
+        key = self.key(*parts)
+        value = self.cache.get(key)
+        if value is None:
+            value = compute()
+            self.cache.set(key, value, timeout)
+        return value
+
+    def bump_on_change(self, sender, condition=None):
+        """
+        Начинает новое поколение после коммита сохранения или удаления sender.
+        condition(instance, created) - нужно ли сбрасывать кэш (по умолчанию всегда)
+        """
+        def on_save(sender, instance, created=False, raw=False, **kwargs):
+            if raw or (condition is not None and not condition(instance, created)):
+                return
+            transaction.on_commit(self.bump)
+
+        def on_delete(sender, instance, **kwargs):
+            transaction.on_commit(self.bump)
+
+        uid = f'cache_generation:{self.namespace}:{sender}'
+        post_save.connect(on_save, sender=sender, weak=False, dispatch_uid=f'{uid}:save')
+        post_delete.connect(on_delete, sender=sender, weak=False, dispatch_uid=f'{uid}:delete')
@@ -0,0 +1,209 @@
+# exhibition_service/apps/core/counters.py
+"""
+Декларативные денормализованные счетчики.
+
+Счетчик описывается как "target.field = количество строк source,
+ссылающихся на target через fk". При создании/удалении строк source
+счетчик меняется атомарным UPDATE ... SET field = field +/- 1 в той же
+транзакции, а reconcile() пересчитывает значения одним запросом.
+
+condition - учитываются только строки source с этими значениями полей
+(например, опубликованные; список/кортеж - любое из значений); тогда счетчик следит и за изменением
+условия или fk при сохранении. rollup - имя поля материализованного
+пути target ("1/5/12/"): строка учитывается у target и всех его предков.
+"""
+from django.apps import apps
+from django.db.models import Count, F, Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+
+
+class DenormalizedCounter:
+    """Описание одного денормализованного счетчика"""
+
+    def __init__(self, target, field, source, fk, condition=None, rollup=None):
+        self.target_label = target
+        self.field = field
+        self.source_label = source
+        self.fk = fk
+        self.condition = condition or {}
+        self.rollup = rollup
+
+    def __str__(self):
+        return f'{self.target_label}.{self.field}'
+
+    @property
+    def target_model(self):
+        return apps.get_model(self.target_label)
+
+    @property
+    def source_model(self):
+        return apps.get_model(self.source_label)
+
+    def connect(self):
+        """
+        Подключает обработчики сигналов модели-источника (прежнюю строку
+        для счетчиков с условием читает CounterRegistry - один запрос
+        на сохранение для всех счетчиков модели)
+        """
+        post_save.connect(
+            self._on_save,
+            sender=self.source_label,
+            weak=False,
+            dispatch_uid=f'counter:{self}:save',
+        )
+        post_delete.connect(
+            self._on_delete,
+            sender=self.source_label,
+            weak=False,
+            dispatch_uid=f'counter:{self}:delete',
+        )
+
+    def counted_target(self, instance):
+        """pk объекта, в счетчике которого учтена строка source, или None"""
+        if not all(_matches(getattr(instance, name), value) for name, value in self.condition.items()):
+            return None
+        return getattr(instance, f'{self.fk}_id')
+
+    def condition_lookups(self):
+        """condition в виде аргументов filter()"""
+        return {
+            f'{name}__in' if isinstance(value, (list, tuple, set, frozenset)) else name: value
+            for name, value in self.condition.items()
+        }
+
+    def _on_save(self, sender, instance, created, raw=False, **kwargs):
+        if raw:
+            return
+        if not self.condition:
+            if created:
+                self.apply(getattr(instance, f'{self.fk}_id'), 1)
+            return
+        old = None if created else getattr(instance, '_counter_old', {}).get(str(self))
+        new = self.counted_target(instance)
+        if old != new:
+            self.apply(old, -1)
+            self.apply(new, 1)
+
+    def _on_delete(self, sender, instance, **kwargs):
+        self.apply(self.counted_target(instance), -1)
+
+    def _targets(self, target_id):
+        """Объекты, счетчики которых меняются: target и, для rollup, его предки"""
+        queryset = self.target_model._base_manager
+        if not self.rollup:
+            return queryset.filter(pk=target_id)
+        path = queryset.filter(pk=target_id).values_list(self.rollup, flat=True).first()
+        if not path:
+            return queryset.filter(pk=target_id)
+        return queryset.filter(pk__in=[int(pk) for pk in path.split('/') if pk])
+
+    def apply(self, target_id, delta):
+        """Атомарно изменяет счетчик объекта (и его предков для rollup) на delta"""
+        if target_id is None or not delta:
+            return 0
+        queryset = self._targets(target_id)
+        if delta < 0:
+            # Счетчики неотрицательные: не уходим ниже нуля
+            queryset = queryset.filter(**{f'{self.field}__gte': -delta})
+        return queryset.update(**{self.field: F(self.field) + delta})
+
+    def actual_count_subquery(self):
+        """Подзапрос с фактическим количеством строк для OuterRef('pk')"""
+        if self.rollup:
+            # Строки всего поддерева: путь target - префикс пути объекта fk
+            # (LIKE path || '%' не зависит от правил сортировки БД)
+            counts = (
+                self.source_model._base_manager
+                .filter(**{
+                    f'{self.fk}__{self.rollup}__startswith': OuterRef(self.rollup),
+                    **self.condition_lookups(),
+                })
+                .order_by()
+                .annotate(total=Func(F('pk'), function='COUNT'))
+                .values('total')
+            )
+            return Coalesce(Subquery(counts), 0)
+        counts = (
+            self.source_model._base_manager
+            .filter(**{self.fk: OuterRef('pk')}, **self.condition_lookups())
+            .order_by()
+            .values(self.fk)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    def drifted(self):
+        """Объекты, у которых сохраненное значение расходится с фактическим"""
+        return (
+            self.target_model._base_manager
+            .annotate(actual_count=self.actual_count_subquery())
+            .exclude(**{self.field: F('actual_count')})
+        )
+
+    def reconcile(self, pks=None):
+        """Пересчитывает счетчик для всех объектов (или только pks) одним UPDATE"""
+        queryset = self.target_model._base_manager.all()
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        return queryset.update(**{self.field: self.actual_count_subquery()})
+
+
+def _matches(actual, expected):
+    if isinstance(expected, (list, tuple, set, frozenset)):
+        return actual in expected
+    return actual == expected
+
+
+class CounterRegistry:
+    """Реестр денормализованных счетчиков проекта"""
+
+    def __init__(self):
+        self._counters = {}
+
+    def register(self, target, field, source, fk, condition=None, rollup=None):
+        """Регистрирует счетчик и подключает его сигналы"""
+        counter = DenormalizedCounter(target, field, source, fk, condition, rollup)
+        self._counters[str(counter)] = counter
+        counter.connect()
+        if condition:
+            pre_save.connect(
+                self._on_pre_save,
+                sender=source,
+                weak=False,
+                dispatch_uid=f'counter:{source}:pre_save',
+            )
+        return counter
+
+    def _on_pre_save(self, sender, instance, raw=False, **kwargs):
+        """Одним запросом запоминает, в каких счетчиках учтена прежняя строка"""
+        if raw or instance.pk is None:
+            return
+        conditioned = [
+            counter for counter in self._counters.values()
+            if counter.condition and counter.source_model is sender
+        ]
+        if not conditioned:
+            return
+        fields = {f'{counter.fk}_id' for counter in conditioned}
+        for counter in conditioned:
+            fields.update(counter.condition)
+        old = sender._base_manager.filter(pk=instance.pk).only(*fields).first()
+        instance._counter_old = {
+            str(counter): counter.counted_target(old) if old is not None else None
+            for counter in conditioned
+        }
+
+    def get(self, name):
+        return self._counters[name]
+
+    def all(self):
+        return list(self._counters.values())
+
+    def for_target(self, target):
+        """Счетчики модели target"""
+        return [counter for counter in self._counters.values() if counter.target_label == target]
+
+
+counters = CounterRegistry()
@@ -0,0 +1,243 @@
+# exhibition_service/apps/core/geo.py
+"""
+Поиск по координатам без PostGIS: "рядом со мной" и прямоугольник карты.
+
+В колонке geo_cell хранится geohash координат объекта (STORED_PRECISION
+символов, ячейка ~5 м). У близких точек общий префикс geohash, поэтому
+область поиска покрывается несколькими ячейками меньшей точности, а
+каждая ячейка - это условие geo_cell LIKE 'ucfv%', которое выбирается по
+индексу (в PostgreSQL - varchar_pattern_ops, его Django создает для
+db_index-поля) и не зависит от правил сортировки БД.
+
+Кандидаты из ячеек затем фильтруются по точному расстоянию (haversine).
+"""
+import math
+
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.signals import post_save, pre_save
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+STORED_PRECISION = 9
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode_geohash(latitude, longitude, precision=STORED_PRECISION):
+    """Geohash точки; '' для пустых координат"""
+    if latitude is None or longitude is None:
+        return ''
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    result = []
+    bits, bit_count, even = 0, 0, True
+    while len(result) < precision:
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            result.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(result)
+
+
+def cell_size(precision):
+    """(высота, ширина) ячейки geohash в градусах"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def longitude_ranges(min_lon, max_lon):
+    """Диапазоны долгот с учетом перехода через антимеридиан"""
+    if max_lon - min_lon >= 360:
+        return [(-180.0, 180.0)]
+    min_lon = (min_lon + 180) % 360 - 180
+    max_lon = (max_lon + 180) % 360 - 180
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def _cell_count(min_lat, max_lat, longitudes, precision):
+    height, width = cell_size(precision)
+    rows = math.floor((max_lat + 90) / height) - math.floor((min_lat + 90) / height) + 1
+    columns = sum(
+        math.floor((high + 180) / width) - math.floor((low + 180) / width) + 1
+        for low, high in longitudes
+    )
+    return rows * columns
+
+
+def _cells(min_lat, max_lat, longitudes, precision):
+    height, width = cell_size(precision)
+    cells = set()
+    row = math.floor((min_lat + 90) / height)
+    while row * height - 90 <= max_lat and row * height < 180:
+        latitude = row * height - 90 + height / 2
+        for low, high in longitudes:
+            column = math.floor((low + 180) / width)
+            while column * width - 180 <= high and column * width < 360:
+                cells.add(encode_geohash(latitude, column * width - 180 + width / 2, precision))
+                column += 1
+        row += 1
+    return sorted(cells)
+
+
+def cells_at_precision(min_lat, min_lon, max_lat, max_lon, precision):
+    """Ячейки geohash заданной точности, пересекающие прямоугольник"""
+    if precision <= 0:
+        return ['']
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    return _cells(min_lat, max_lat, longitude_ranges(min_lon, max_lon), precision)
+
+
+def count_cells(min_lat, min_lon, max_lat, max_lon, precision):
+    """Число ячеек заданной точности, пересекающих прямоугольник (без их построения)"""
+    if precision <= 0:
+        return 1
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    return _cell_count(min_lat, max_lat, longitude_ranges(min_lon, max_lon), precision)
+
+
+def cover_cells(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Префиксы geohash наибольшей точности, покрывающие прямоугольник
+    не более чем max_cells ячейками
+    """
+    precision = 1
+    while (
+        precision < STORED_PRECISION
+        and count_cells(min_lat, min_lon, max_lat, max_lon, precision + 1) <= max_cells
+    ):
+        precision += 1
+    if count_cells(min_lat, min_lon, max_lat, max_lon, precision) > max_cells:
+        return ['']  # область больше нескольких ячеек первого уровня
+    return cells_at_precision(min_lat, min_lon, max_lat, max_lon, precision)
+
+
+def cells_filter(cells, field='geo_cell'):
+    """Q: geo_cell начинается с одного из префиксов"""
+    condition = Q()
+    for cell in cells:
+        if not cell:
+            return ~Q(**{field: ''})
+        condition |= Q(**{f'{field}__startswith': cell})
+    return condition
+
+
+def bounding_box(latitude, longitude, km):
+    """(min_lat, min_lon, max_lat, max_lon) квадрата вокруг точки"""
+    lat_delta = km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(latitude))
+    lon_delta = 360.0 if cos_lat < 1e-6 else min(km / (KM_PER_DEGREE * cos_lat), 360.0)
+    return latitude - lat_delta, longitude - lon_delta, latitude + lat_delta, longitude + lon_delta
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Расстояния в км от точки до списка точек"""
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat2, lon2 in zip(latitudes, longitudes):
+        lat2, lon2 = math.radians(lat2), math.radians(lon2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+def in_bbox(queryset, min_lat, min_lon, max_lat, max_lon):
+    """Объекты queryset внутри прямоугольника (с переходом через антимеридиан)"""
+    longitude = Q()
+    for low, high in longitude_ranges(min_lon, max_lon):
+        longitude |= Q(longitude__gte=low, longitude__lte=high)
+    return queryset.filter(
+        cells_filter(cover_cells(min_lat, min_lon, max_lat, max_lon)),
+        longitude,
+        latitude__gte=min_lat,
+        latitude__lte=max_lat,
+    )
+
+
+def near(queryset, latitude, longitude, km):
+    """
+    Объекты queryset в радиусе km от точки по возрастанию расстояния
+    (аннотация distance_km)
+    """
+    latitude, longitude, km = float(latitude), float(longitude), float(km)
+    min_lat, min_lon, max_lat, max_lon = bounding_box(latitude, longitude, km)
+    candidates = list(
+        queryset.filter(cells_filter(cover_cells(min_lat, min_lon, max_lat, max_lon)))
+        .order_by()
+        .values_list('pk', 'latitude', 'longitude')
+    )
+    if not candidates:
+        return queryset.none()
+
+    pks, latitudes, longitudes = zip(*candidates)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    found = [(pk, distance) for pk, distance in zip(pks, distances) if distance <= km]
+    if not found:
+        return queryset.none()
+
+    distance = Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in found],
+        output_field=FloatField(),
+    )
+    return (
+        queryset.filter(pk__in=[pk for pk, _ in found])
+        .annotate(distance_km=distance)
+        .order_by('distance_km')
+    )
+
+
+class GeoCellRegistry:
+    """Модели, у которых geo_cell заполняется из latitude/longitude при сохранении"""
+
+    def __init__(self):
+        self._targets = {}
+
+    def register(self, target, field='geo_cell'):
+        def on_pre_save(sender, instance, raw=False, **kwargs):
+            setattr(instance, field, encode_geohash(instance.latitude, instance.longitude))
+
+        def on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+            # save(update_fields=[...]) с координатами, но без geo_cell
+            if raw or not update_fields or field in update_fields:
+                return
+            if {'latitude', 'longitude'} & set(update_fields):
+                sender._base_manager.filter(pk=instance.pk).update(**{field: getattr(instance, field)})
+
+        self._targets[target] = field
+        pre_save.connect(on_pre_save, sender=target, weak=False, dispatch_uid=f'geo_cell:{target}:pre_save')
+        post_save.connect(on_save, sender=target, weak=False, dispatch_uid=f'geo_cell:{target}:save')
+
+
+def fill_geo_cells(model, field='geo_cell', batch_size=1000):
+    """Пересчитывает geo_cell модели пачками bulk_update (после импорта через update())"""
+    batch = []
+    updated = 0
+    for instance in model._base_manager.only('pk', 'latitude', 'longitude', field).iterator(chunk_size=batch_size):
+        value = encode_geohash(instance.latitude, instance.longitude)
+        if getattr(instance, field) != value:
+            setattr(instance, field, value)
+            batch.append(instance)
+        if len(batch) >= batch_size:
+            model._base_manager.bulk_update(batch, [field])
+            updated += len(batch)
+            batch = []
+    if batch:
+        model._base_manager.bulk_update(batch, [field])
+        updated += len(batch)
+    return updated
+
+
+geo_cells = GeoCellRegistry()
@@ -0,0 +1,228 @@
+# exhibition_service/apps/core/geoip.py
+"""
+Офлайн-определение страны и города по IP (без обращений к сети).
+
+База - бинарный файл с отсортированными диапазонами IPv4, который
+отображается в память (mmap): страницы файла делятся между всеми
+воркерами через page cache, поэтому RSS процесса не растет с размером базы.
+Поиск - бинарный поиск по диапазонам, результаты кэшируются по /24.
+
+Формат файла:
+    заголовок: MAGIC, uint32 число диапазонов, uint32 число строк
+    диапазоны: uint32 start, uint32 end, uint32 country, uint32 city
+    таблица строк: uint32 смещения, затем UTF-8 строки подряд
+"""
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PPGEO1\x00\x00'
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<IIII')
+OFFSET = struct.Struct('<I')
+
+DEFAULT_PREFIX_CACHE_SIZE = 65536
+RELOAD_CHECK_INTERVAL = 60
+
+
+def _ip_to_int(ip):
+    """IPv4 в число; None для IPv6 и некорректных адресов"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if address.version != 4:
+        return None
+    return int(address)
+
+
+def build_database(rows, path):
+    """
+    Записывает базу из строк (start_ip, end_ip, country, city).
+    Файл заменяется атомарно: открытые в воркерах отображения остаются валидными.
+    """
+    strings = ['']
+    string_ids = {'': 0}
+    records = []
+    for start_ip, end_ip, country, city in rows:
+        start, end = _ip_to_int(start_ip), _ip_to_int(end_ip)
+        if start is None or end is None or start > end:
+            continue
+        ids = []
+        for value in (country, city):
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            ids.append(string_ids[value])
+        records.append((start, end, *ids))
+    records.sort()
+
+    encoded = [value.encode('utf-8') for value in strings]
+    tmp_path = f'{path}.tmp'
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp_path, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, len(records), len(encoded)))
+        for record in records:
+            handle.write(RECORD.pack(*record))
+        offset = 0
+        for value in encoded:
+            handle.write(OFFSET.pack(offset))
+            offset += len(value)
+        handle.write(OFFSET.pack(offset))
+        for value in encoded:
+            handle.write(value)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class GeoIPDatabase:
+    """Отображенная в память база диапазонов IPv4"""
+
+    def __init__(self, path, prefix_cache_size=DEFAULT_PREFIX_CACHE_SIZE):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.size, self._string_count = HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f'{path}: неизвестный формат базы GeoIP')
+
+        self._records_offset = HEADER.size
+        self._offsets_offset = self._records_offset + self.size * RECORD.size
+        self._strings_offset = self._offsets_offset + (self._string_count + 1) * OFFSET.size
+        if len(self._map) < self._strings_offset:
+            self._map.close()
+            raise ValueError(f'{path}: файл базы GeoIP обрезан')
+        self._strings = {}
+
+        self._prefix_cache = OrderedDict()
+        self._prefix_cache_size = prefix_cache_size
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._map.close()
+
+    def _string(self, index):
+        value = self._strings.get(index)
+        if value is None:
+            start, = OFFSET.unpack_from(self._map, self._offsets_offset + index * OFFSET.size)
+            end, = OFFSET.unpack_from(self._map, self._offsets_offset + (index + 1) * OFFSET.size)
+            value = self._map[self._strings_offset + start:self._strings_offset + end].decode('utf-8')
+            self._strings[index] = value
+        return value
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._map, self._records_offset + index * RECORD.size)
+
+    def _search(self, value):
+        """Бинарный поиск диапазона, содержащего value"""
+        low, high = 0, self.size - 1
+        while low <= high:
+            middle = (low + high) // 2
+            start, end, country, city = self._record(middle)
+            if value < start:
+                high = middle - 1
+            elif value > end:
+                low = middle + 1
+            else:
+                return start, end, country, city
+        return None
+
+    def lookup(self, ip):
+        """(страна, город) для адреса или None"""
+        value = _ip_to_int(ip)
+        if value is None:
+            return None
+
+        prefix = value >> 8
+        with self._lock:
+            if prefix in self._prefix_cache:
+                self._prefix_cache.move_to_end(prefix)
+                return self._prefix_cache[prefix]
+
+        try:
+            record = self._search(value)
+            result = (self._string(record[2]), self._string(record[3])) if record else None
+
+            # Кэшируем только если весь /24 лежит в одном диапазоне (или вне всех)
+            prefix_start, prefix_end = prefix << 8, (prefix << 8) | 0xFF
+            if record is None:
+                cacheable = self._search(prefix_start) is None and self._search(prefix_end) is None
+            else:
+                cacheable = record[0] <= prefix_start and record[1] >= prefix_end
+        except ValueError:
+            if self._map.closed:
+                return None  # база закрыта при переоткрытии файла во время поиска
+            raise
+        if cacheable:
+            with self._lock:
+                self._prefix_cache[prefix] = result
+                if len(self._prefix_cache) > self._prefix_cache_size:
+                    self._prefix_cache.popitem(last=False)
+        return result
+
+
+_database = None
+_database_mtime = None
+_last_check = 0
+_database_lock = threading.Lock()
+
+
+def get_database():
+    """База из GEOIP_DATABASE_PATH; переоткрывается при замене файла. None, если файла нет"""
+    global _database, _database_mtime, _last_check
+
+    now = time.monotonic()
+    if _last_check and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _database
+
+    with _database_lock:
+        _last_check = now
+        path = getattr(settings, 'GEOIP_DATABASE_PATH', '')
+        try:
+            mtime = os.stat(path).st_mtime if path else None
+        except OSError:
+            mtime = None
+        if mtime is None:
+            previous, _database, _database_mtime = _database, None, None
+        elif _database is None or mtime != _database_mtime:
+            try:
+                database = GeoIPDatabase(path, getattr(
+                    settings, 'GEOIP_PREFIX_CACHE_SIZE', DEFAULT_PREFIX_CACHE_SIZE
+                ))
+            except (OSError, ValueError, struct.error):
+                # Остается прежняя база (ее отображение ссылается на старый файл)
+                logger.exception('Не удалось открыть базу GeoIP %s', path)
+                return _database
+            previous, _database, _database_mtime = _database, database, mtime
+        else:
+            return _database
+        if previous is not None:
+            previous.close()
+    return _database
+
+
+def apply_geoip(instance):
+    """Заполняет country и city события по ip_address, если они пустые"""
+    if instance.country or not instance.ip_address:
+        return instance
+    database = get_database()
+    if database is None:
+        return instance
+    result = database.lookup(instance.ip_address)
+    if result:
+        instance.country, instance.city = result[0][:100], result[1][:100]
+    return instance
@@ -0,0 +1,297 @@
+# exhibition_service/apps/core/images.py
+"""
+Производные изображения (превью, карточка, баннер в JPEG и WebP).
+
+Оригинал загруженного файла не изменяется. После коммита сохранения,
+в котором поменялось имя файла в зарегистрированном поле, файл ставится
+в пул фоновых потоков; сохранения без нового файла (счетчики,
+update_fields) изображения не трогают.
+
+Производные хранятся по хэшу содержимого оригинала:
+derivatives/<hh>/<sha256>/<вариант>.<jpg|webp>. Если для хэша уже есть
+manifest.json, файл не перекодируется (повторная загрузка того же
+изображения, пересохранение). Соответствие имени оригинала хэшу
+записывается в derivatives/names/ и кэшируется, поэтому url() не читает
+оригинал.
+
+Backend "sync" обрабатывает файл сразу (команды, тесты).
+"""
+import atexit
+import hashlib
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'thread',
+    'WORKERS': 2,
+    'CACHE_ALIAS': 'default',
+    'ROOT': 'derivatives',
+    # Вариант -> (ширина, высота): вписывается с сохранением пропорций, без увеличения
+    'VARIANTS': {
+        'thumbnail': (300, 300),
+        'card': (600, 400),
+        'banner': (1600, 600),
+    },
+    'JPEG_QUALITY': 85,
+    'WEBP_QUALITY': 80,
+}
+
+FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def get_image_settings():
+    """Настройки производных изображений с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'IMAGE_DERIVATIVES', {})}
+
+
+def _file_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+def content_hash(file):
+    """sha256 содержимого файла; файл читается частями"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derivative_dir(digest):
+    return f"{get_image_settings()['ROOT']}/{digest[:2]}/{digest}"
+
+
+def derivative_name(digest, variant, image_format='jpeg'):
+    return f'{derivative_dir(digest)}/{variant}.{FORMATS[image_format]}'
+
+
+def _index_name(name):
+    return f"{get_image_settings()['ROOT']}/names/{hashlib.md5(name.encode('utf-8')).hexdigest()}"
+
+
+def _cache_key(name):
+    return f"image_derivatives:{hashlib.md5(name.encode('utf-8')).hexdigest()}"
+
+
+def encode_image(image, image_format, options):
+    """Байты изображения в формате JPEG или WebP"""
+    buffer = io.BytesIO()
+    if image_format == 'jpeg':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Прозрачность JPEG не поддерживает: белый фон
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(buffer, 'JPEG', quality=options['JPEG_QUALITY'], optimize=True, progressive=True)
+    else:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        image.save(buffer, 'WEBP', quality=options['WEBP_QUALITY'], method=4)
+    return buffer.getvalue()
+
+
+def render_derivatives(file, options=None):
+    """{(вариант, формат): байты} для открытого файла оригинала"""
+    options = options or get_image_settings()
+    variants = options['VARIANTS']
+    result = {}
+    with Image.open(file) as source:
+        # JPEG декодируется сразу в уменьшенном масштабе, если это возможно
+        largest = max(width for width, _ in variants.values()), max(height for _, height in variants.values())
+        source.draft('RGB', largest)
+        image = ImageOps.exif_transpose(source)
+        for variant, size in sorted(variants.items(), key=lambda item: -item[1][0] * item[1][1]):
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+            for image_format in FORMATS:
+                result[(variant, image_format)] = encode_image(resized, image_format, options)
+            # Следующий (меньший) вариант уменьшается из текущего
+            image = resized
+    return result
+
+
+class ImageDerivativePipeline:
+    """Фоновая генерация производных изображений по хэшу содержимого"""
+
+    def __init__(self, storage=None):
+        self._storage = storage
+        self._fields = {}
+        self._executor = None
+        self._start_lock = threading.Lock()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    @property
+    def storage(self):
+        return self._storage or default_storage
+
+    @property
+    def cache(self):
+        return caches[get_image_settings()['CACHE_ALIAS']]
+
+    # Регистрация моделей
+
+    def register(self, target, *fields):
+        """Подключает поля-изображения модели target"""
+        self._fields[target] = fields
+        uid = f'image_derivatives:{target}'
+
+        def on_init(sender, instance, **kwargs):
+            # Без обращения к дескриптору: отложенные поля не загружаются
+            instance._image_derivative_names = {
+                field: _file_name(instance.__dict__.get(field)) for field in fields
+            }
+
+        def on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+            if raw:
+                return
+            previous = getattr(instance, '_image_derivative_names', {})
+            for field in fields:
+                if update_fields is not None and field not in update_fields:
+                    continue
+                name = _file_name(instance.__dict__.get(field))
+                if name and name != previous.get(field):
+                    transaction.on_commit(lambda name=name: self.enqueue(name))
+                previous[field] = name
+            instance._image_derivative_names = previous
+
+        post_init.connect(on_init, sender=target, weak=False, dispatch_uid=f'{uid}:init')
+        post_save.connect(on_save, sender=target, weak=False, dispatch_uid=f'{uid}:save')
+
+    def registered(self):
+        """{метка модели: поля}"""
+        return dict(self._fields)
+
+    # Очередь
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return self._executor
+        with self._start_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=get_image_settings()['WORKERS'],
+                    thread_name_prefix='image-derivatives',
+                )
+        return self._executor
+
+    def enqueue(self, name):
+        """Ставит файл в обработку; повторная постановка до окончания игнорируется"""
+        if get_image_settings()['BACKEND'] == 'sync':
+            return self.process(name)
+        with self._pending_lock:
+            if name in self._pending:
+                return None
+            self._pending.add(name)
+        return self._ensure_started().submit(self._run, name)
+
+    def _run(self, name):
+        try:
+            return self.process(name)
+        except Exception:
+            logger.exception('Не удалось построить производные изображения %s', name)
+        finally:
+            with self._pending_lock:
+                self._pending.discard(name)
+
+    def process(self, name, force=False):
+        """
+        Строит производные файла name. Возвращает хэш содержимого
+        или None, если файла нет
+        """
+        storage = self.storage
+        if not storage.exists(name):
+            return None
+        with storage.open(name, 'rb') as original:
+            digest = content_hash(original)
+            manifest = f'{derivative_dir(digest)}/manifest.json'
+
+            if force or not storage.exists(manifest):
+                original.seek(0)
+                files = {}
+                for (variant, image_format), content in render_derivatives(original).items():
+                    path = derivative_name(digest, variant, image_format)
+                    files.setdefault(variant, {})[image_format] = self._replace(path, content)
+                # Манифест пишется последним: его наличие означает готовые файлы
+                self._replace(manifest, json.dumps(files).encode('utf-8'))
+
+        self._replace(_index_name(name), digest.encode('ascii'))
+        self.cache.set(_cache_key(name), digest, timeout=None)
+        return digest
+
+    def _replace(self, path, content):
+        """
+        Записывает файл ровно под именем path. Если параллельная обработка
+        того же содержимого успела создать path, storage.save() выберет
+        другое имя - такая копия удаляется: содержимое по этому пути
+        определяется хэшем и совпадает
+        """
+        storage = self.storage
+        if storage.exists(path):
+            storage.delete(path)
+        saved = storage.save(path, ContentFile(content))
+        if saved != path:
+            storage.delete(saved)
+        return path
+
+    # Чтение
+
+    def digest(self, name):
+        """Хэш содержимого обработанного файла или None"""
+        if not name:
+            return None
+        digest = self.cache.get(_cache_key(name))
+        if digest is None:
+            index = _index_name(name)
+            if not self.storage.exists(index):
+                return None
+            with self.storage.open(index, 'rb') as stored:
+                digest = stored.read().decode('ascii')
+            self.cache.set(_cache_key(name), digest, timeout=None)
+        return digest
+
+    def url(self, file, variant='card', image_format='jpeg'):
+        """URL производного изображения; пока его нет - URL оригинала"""
+        name = _file_name(file)
+        if not name:
+            return ''
+        digest = self.digest(name)
+        if digest is None:
+            return self.storage.url(name)
+        return self.storage.url(derivative_name(digest, variant, image_format))
+
+    def flush(self):
+        """Дожидается обработки поставленных файлов"""
+        with self._start_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+image_derivatives = ImageDerivativePipeline()
+
+
+@atexit.register
+def _finish_on_exit():
+    """Дожидается начатой обработки изображений при остановке воркера"""
+    try:
+        image_derivatives.flush()
+    except Exception:
+        logger.exception('Ошибка обработки изображений при завершении процесса')
@@ -0,0 +1,322 @@
+# exhibition_service/apps/core/ingestion.py
+"""
+Асинхронная запись событий (Analytics, ViewHistory, UserActivity).
+
+В запросе событие только кладется в ограниченную очередь процесса,
+фоновый поток забирает события пачками и пишет их через bulk_create.
+При переполнении очереди новые события отбрасываются (политика "drop")
+или, начиная с порога заполнения, сохраняется только их доля ("sample").
+Backend "sync" пишет события сразу (команды, тесты).
+Внутри транзакции событие ставится в очередь только после ее коммита:
+откаченные действия не оставляют записей.
+Разбор User-Agent и определение геолокации выполняются при записи,
+вне пути запроса.
+
+created_at проставляется при записи пачки, поэтому может отставать
+от момента события на FLUSH_INTERVAL.
+"""
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .geoip import apply_geoip
+from .user_agents import apply_user_agent
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'thread',
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2,
+    'OVERFLOW_POLICY': 'drop',
+    'HIGH_WATER_MARK': 0.8,
+    'SAMPLE_RATE': 0.1,
+}
+
+
+def get_ingestion_settings():
+    """Настройки очереди с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'EVENT_INGESTION', {})}
+
+
+class EventIngestionQueue:
+    """Ограниченная очередь событий с фоновой пакетной записью"""
+
+    def __init__(self):
+        self._queue = None
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = defaultdict(int)
+
+    @property
+    def options(self):
+        return get_ingestion_settings()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        """Счетчики: enqueued, dropped, sampled_out, flushed, failed, pending"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    def _ensure_started(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=self.options['MAX_QUEUE_SIZE'])
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(
+                    target=self._run, name='event-ingestion', daemon=True
+                )
+                self._worker.start()
+
+    def put(self, instance):
+        """
+        Ставит несохраненный экземпляр модели в очередь на запись.
+        Возвращает False, если событие отброшено. Внутри транзакции
+        событие откладывается до ее коммита и put() возвращает True.
+        """
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(partial(self._put, instance))
+            return True
+        return self._put(instance)
+
+    def _put(self, instance):
+        options = self.options
+        if options['BACKEND'] == 'sync':
+            self._write([instance])
+            return True
+
+        self._ensure_started()
+        if options['OVERFLOW_POLICY'] == 'sample':
+            fill = self._queue.qsize() / max(options['MAX_QUEUE_SIZE'], 1)
+            if fill >= options['HIGH_WATER_MARK'] and random.random() >= options['SAMPLE_RATE']:
+                self._count('sampled_out')
+                return False
+
+        try:
+            self._queue.put_nowait(instance)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _run(self):
+        """
+        Цикл фонового потока: собирает пачку и записывает ее. Ошибка
+        записи не останавливает поток, а пачка всегда отмечается
+        обработанной - иначе flush() ждал бы ее бесконечно
+        """
+        while not self._stopping.is_set():
+            batch = []
+            try:
+                batch = self._collect()
+                if batch:
+                    # Соединение фонового потока живет дольше запросов
+                    close_old_connections()
+                    self._write(batch)
+            except Exception:
+                logger.exception('Ошибка фоновой записи пачки событий')
+                self._count('failed', len(batch))
+            finally:
+                self._done(batch)
+
+    def _collect(self):
+        """Ждет события до FLUSH_INTERVAL и набирает пачку до BATCH_SIZE"""
+        options = self.options
+        deadline = time.monotonic() + options['FLUSH_INTERVAL']
+        batch = []
+        while len(batch) < options['BATCH_SIZE']:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _done(self, batch):
+        for _ in batch:
+            self._queue.task_done()
+
+    def _write(self, batch):
+        """
+        Записывает пачку: один bulk_create на модель. Если bulk_create
+        не прошел, события модели пишутся по одному, чтобы одна
+        некорректная строка не теряла всю пачку
+        """
+        by_model = defaultdict(list)
+        for instance in batch:
+            try:
+                _enrich(instance)
+            except Exception:
+                # Событие записывается без производных полей
+                logger.exception('Не удалось дополнить событие %s', type(instance)._meta.label)
+            by_model[type(instance)].append(instance)
+
+        with self._write_lock:
+            for model, instances in by_model.items():
+                try:
+                    with transaction.atomic():
+                        model.objects.bulk_create(instances, batch_size=self.options['BATCH_SIZE'])
+                    self._count('flushed', len(instances))
+                except Exception:
+                    logger.exception('Не удалось записать пачку событий %s, запись по одному', model._meta.label)
+                    self._write_each(model, instances)
+
+    def _write_each(self, model, instances):
+        for instance in instances:
+            try:
+                with transaction.atomic():
+                    instance.save(force_insert=True)
+                self._count('flushed')
+            except Exception:
+                logger.exception('Не удалось записать событие %s', model._meta.label)
+                self._count('failed')
+
+    def flush(self):
+        """
+        Синхронно записывает все события из очереди, включая пачку,
+        которую уже забрал фоновый поток. Возвращает количество записанных здесь.
+        """
+        if self._queue is None:
+            return 0
+        batch = self._drain()
+        if batch:
+            try:
+                self._write(batch)
+            finally:
+                self._done(batch)
+        self._queue.join()
+        return len(batch)
+
+    def shutdown(self, timeout=5):
+        """Останавливает фоновый поток и дописывает оставшиеся события"""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        flushed = self.flush()
+        stats = self.stats()
+        if stats.get('dropped') or stats.get('sampled_out') or stats.get('failed'):
+            logger.warning('Очередь событий: %s', stats)
+        return flushed
+
+
+def _enrich(instance):
+    """Дополняет событие производными полями перед записью"""
+    if hasattr(instance, 'device_type'):
+        apply_user_agent(instance)
+    if hasattr(instance, 'country'):
+        apply_geoip(instance)
+    return instance
+
+
+ingestion_queue = EventIngestionQueue()
+
+
+@atexit.register
+def _flush_on_exit():
+    """Дописывает очередь событий при остановке воркера"""
+    try:
+        ingestion_queue.shutdown()
+    except Exception:
+        logger.exception('Ошибка записи очереди событий при завершении процесса')
+
+
+# Построение событий из запроса
+
+def _request_context(request):
+    """Общие поля события из HTTP-запроса"""
+    if request is None:
+        return {}
+    from apps.users.models import UserActivity
+
+    user = getattr(request, 'user', None)
+    session = getattr(request, 'session', None)
+    return {
+        'user': user if user is not None and user.is_authenticated else None,
+        'session_key': (session.session_key or '') if session is not None else '',
+        'ip_address': UserActivity.get_client_ip(request),
+        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+        'referrer': request.META.get('HTTP_REFERER', '')[:200],
+    }
+
+
+def record_event(obj, event_type, request=None, **metadata):
+    """Ставит в очередь событие Analytics для объекта"""
+    from django.contrib.contenttypes.models import ContentType
+    from .models import Analytics
+
+    event = Analytics(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_id=obj.pk,
+        event_type=event_type,
+        metadata=metadata,
+        **_request_context(request),
+    )
+    ingestion_queue.put(event)
+    return event
+
+
+def record_view(obj, request=None):
+    """Ставит в очередь запись истории просмотров и событие просмотра"""
+    from django.contrib.contenttypes.models import ContentType
+    from .models import Analytics, ViewHistory
+
+    context = _request_context(request)
+    view = ViewHistory(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_id=obj.pk,
+        **context,
+    )
+    ingestion_queue.put(view)
+    record_event(obj, Analytics.EventType.VIEW, request)
+    return view
+
+
+def record_search(model, query, request=None, **metadata):
+    """
+    Ставит в очередь событие поиска по модели. Событие не относится
+    к конкретному объекту: object_id = 0, запрос - в metadata['query']
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from .models import Analytics
+
+    event = Analytics(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id=0,
+        event_type=Analytics.EventType.SEARCH,
+        metadata={'query': query, **metadata},
+        **_request_context(request),
+    )
+    ingestion_queue.put(event)
+    return event
@@ -0,0 +1,38 @@
+# exhibition_service/apps/core/management/commands/backfill_geoip.py
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.geoip import apply_geoip, get_database
+from apps.core.models import Analytics
+
+
+class Command(BaseCommand):
+    help = 'Заполняет страну и город для событий аналитики без геолокации'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество событий в одной пачке',
+        )
+
+    def handle(self, *args, **options):
+        if get_database() is None:
+            raise CommandError('База GeoIP не найдена (GEOIP_DATABASE_PATH)')
+
+        batch_size = options['batch_size']
+        queryset = Analytics.objects.filter(country='', ip_address__isnull=False).order_by('pk')
+        last_pk = 0
+        updated = 0
+        while True:
+            events = list(
+                queryset.filter(pk__gt=last_pk).only('pk', 'ip_address', 'country', 'city')[:batch_size]
+            )
+            if not events:
+                break
+            last_pk = events[-1].pk
+            resolved = [event for event in events if apply_geoip(event).country]
+            Analytics.objects.bulk_update(resolved, ['country', 'city'], batch_size=batch_size)
+            updated += len(resolved)
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено событий: {updated}'))
@@ -0,0 +1,127 @@
+# exhibition_service/apps/core/management/commands/benchmark_search.py
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.core.search import ENGINES, search_indexes
+from apps.core.slugs import slugs
+from apps.exhibitions.models import Category, Exhibition
+
+
+SYLLABLES = [
+    'про', 'мы', 'шлен', 'ност', 'тех', 'но', 'ло', 'гия', 'строй', 'ма', 'ши', 'на',
+    'энер', 'го', 'ме', 'ди', 'ци', 'ауто', 'агро', 'пак', 'ро', 'бот', 'экс', 'по',
+]
+
+
+def build_vocabulary(rng, size=5000):
+    """Синтетический словарь: слова из слогов, частоты по закону Ципфа"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+
+ENGINE_NAMES = {'postgresql': 'tsvector + GIN', 'sqlite': 'FTS5'}
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург', 'Новосибирск', 'Сочи']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полнотекстовый поиск выставок с поиском через icontains '
+        'на синтетических данных (все изменения откатываются). Измеряется '
+        'движок текущей СУБД: PostgreSQL - tsvector + GIN, SQLite - FTS5; '
+        'для сравнения движков запустите команду на каждой из СУБД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=100000, help='Количество выставок')
+        parser.add_argument('--queries', type=int, default=200, help='Количество запросов')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def _populate(self, count, rng, words, weights):
+        user = get_user_model().objects.create_user(
+            email=f'bench-{uuid.uuid4().hex}@example.com',
+            username=f'bench-{uuid.uuid4().hex[:12]}',
+            password=None,
+        )
+        category = Category.objects.create(name=f'Benchmark {uuid.uuid4().hex[:8]}')
+        now = timezone.now()
+        batch = []
+        for number in range(count):
+            title = ' '.join(rng.choices(words, weights=weights, k=3)).capitalize()
+            batch.append(Exhibition(
+                title=title,
+                description=' '.join(rng.choices(words, weights=weights, k=60)),
+                short_description=' '.join(rng.choices(words, weights=weights, k=10)),
+                organizer=user,
+                category=category,
+                start_date=now + timedelta(days=rng.randint(1, 365)),
+                end_date=now + timedelta(days=rng.randint(366, 400)),
+                venue_name=f'Экспоцентр {number % 50}',
+                address='-',
+                city=rng.choice(CITIES),
+                status=Exhibition.Status.PUBLISHED,
+            ))
+            if len(batch) >= 5000:
+                Exhibition.objects.bulk_create(slugs.assign(batch))
+                batch = []
+        if batch:
+            Exhibition.objects.bulk_create(slugs.assign(batch))
+
+    def _measure(self, queries, run):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+    def handle(self, *args, **options):
+        engine = ENGINES.get(connection.vendor)
+        if engine is None or not engine.available(connection):
+            raise CommandError(f'Полнотекстовый индекс недоступен для СУБД {connection.vendor}')
+
+        rng = random.Random(options['seed'])
+        words, weights = build_vocabulary(rng)
+        queries = [
+            ' '.join(rng.choices(words[:1000], k=rng.randint(1, 2)))
+            for _ in range(options['queries'])
+        ]
+
+        try:
+            with transaction.atomic():
+                self._populate(options['objects'], rng, words, weights)
+                started = time.perf_counter()
+                search_indexes.get('exhibitions.Exhibition').rebuild()
+                self.stdout.write(f'Индексация: {time.perf_counter() - started:.1f} с')
+
+                fulltext = self._measure(
+                    queries, lambda query: list(Exhibition.objects.search(query, cached=False).values_list('pk', flat=True)[:20])
+                )
+                icontains = self._measure(
+                    queries, lambda query: list(Exhibition.objects.search_icontains(query).values_list('pk', flat=True)[:20])
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f'СУБД: {connection.vendor}, выставок: {options["objects"]}, запросов: {len(queries)}')
+        self.stdout.write(f'Полнотекстовый поиск ({ENGINE_NAMES[connection.vendor]}): медиана {fulltext[0]:.2f} мс, p99 {fulltext[1]:.2f} мс')
+        self.stdout.write(f'icontains: медиана {icontains[0]:.2f} мс, p99 {icontains[1]:.2f} мс')
@@ -0,0 +1,90 @@
+# exhibition_service/apps/core/management/commands/benchmark_user_agents.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.user_agents import parse_user_agent, parse_user_agent_uncached
+
+
+# Шаблоны распространенных User-Agent; версии подставляются, чтобы получить
+# длинный хвост редких строк, как в реальном трафике
+TEMPLATES = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{major}.0.{build}.{patch} Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{major}.0.{build}.{patch} YaBrowser/{minor}.1.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{major}.0.{build}.{patch} Safari/537.36 Edg/{major}.0.{build}.{patch}',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:{major}.0) Gecko/20100101 Firefox/{major}.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/{minor}.{patch} Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS {minor}_{patch} like Mac OS X) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/{minor}.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (iPad; CPU OS {minor}_{patch} like Mac OS X) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/{minor}.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android {minor}; SM-G{build}) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{major}.0.{build}.{patch} Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android {minor}; SM-T{build}) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{major}.0.{build}.{patch} Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{major}.0.{build}.{patch} Safari/537.36',
+    'Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+]
+
+
+def build_corpus(unique, seed):
+    """Набор уникальных строк User-Agent"""
+    rng = random.Random(seed)
+    corpus = set()
+    while len(corpus) < unique:
+        corpus.add(rng.choice(TEMPLATES).format(
+            major=rng.randint(100, 125),
+            minor=rng.randint(10, 17),
+            build=rng.randint(1000, 6999),
+            patch=rng.randint(0, 200),
+        ))
+    return sorted(corpus)
+
+
+def build_events(corpus, events, skew, seed):
+    """Поток событий с распределением Ципфа по строкам корпуса"""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, len(corpus) + 1)]
+    return rng.choices(corpus, weights=weights, k=events)
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость разбора User-Agent с кэшем и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000, help='Количество событий')
+        parser.add_argument('--unique', type=int, default=20000, help='Количество уникальных строк')
+        parser.add_argument('--skew', type=float, default=1.1, help='Параметр распределения Ципфа')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def _measure(self, parse, events):
+        started = time.perf_counter()
+        for user_agent in events:
+            parse(user_agent)
+        elapsed = time.perf_counter() - started
+        return len(events) / elapsed if elapsed else float('inf')
+
+    def handle(self, *args, **options):
+        corpus = build_corpus(options['unique'], options['seed'])
+        events = build_events(corpus, options['events'], options['skew'], options['seed'])
+
+        uncached = self._measure(parse_user_agent_uncached, events)
+        parse_user_agent.cache_clear()
+        cached = self._measure(parse_user_agent, events)
+        info = parse_user_agent.cache_info()
+        hit_rate = info.hits / (info.hits + info.misses) if info.hits + info.misses else 0
+
+        self.stdout.write(f'Событий: {len(events)}, уникальных строк: {len(corpus)}')
+        self.stdout.write(f'Без кэша: {uncached:,.0f} событий/с')
+        self.stdout.write(
+            f'С кэшем (размер {info.maxsize}): {cached:,.0f} событий/с, '
+            f'попаданий {hit_rate:.1%}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{cached / uncached:.1f}'))
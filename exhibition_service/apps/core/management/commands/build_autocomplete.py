@@ -0,0 +1,17 @@
+# exhibition_service/apps/core/management/commands/build_autocomplete.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.autocomplete import autocomplete
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает снимок автодополнения (выставки, компании, города)'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = autocomplete.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано ключей: {count} в {autocomplete.path} за {time.perf_counter() - started:.1f} с'
+        ))
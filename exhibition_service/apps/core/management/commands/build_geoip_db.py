@@ -0,0 +1,30 @@
+# exhibition_service/apps/core/management/commands/build_geoip_db.py
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.core.geoip import build_database
+
+
+class Command(BaseCommand):
+    help = 'Собирает бинарную базу GeoIP из CSV (start_ip,end_ip,country,city)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='CSV-файл с диапазонами IPv4')
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Путь к базе (по умолчанию GEOIP_DATABASE_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.GEOIP_DATABASE_PATH
+        with open(options['source'], newline='', encoding='utf-8') as handle:
+            rows = (
+                (row[0], row[1], row[2], row[3] if len(row) > 3 else '')
+                for row in csv.reader(handle)
+                if len(row) >= 3 and not row[0].startswith('#')
+            )
+            count = build_database(rows, output)
+        self.stdout.write(self.style.SUCCESS(f'Записано диапазонов: {count} в {output}'))
@@ -0,0 +1,46 @@
+# exhibition_service/apps/core/management/commands/build_image_derivatives.py
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.images import image_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Строит производные изображений (превью, карточки, баннеры) для уже загруженных файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            help='Модели в формате app_label.Model (по умолчанию - все зарегистрированные)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перекодировать, даже если производные для содержимого уже есть',
+        )
+
+    def handle(self, *args, **options):
+        registered = image_derivatives.registered()
+        targets = options['models'] or list(registered)
+        unknown = [target for target in targets if target not in registered]
+        if unknown:
+            raise CommandError(f'Модель без изображений: {", ".join(unknown)}')
+
+        for target in targets:
+            model = apps.get_model(target)
+            processed = failed = 0
+            for field in registered[target]:
+                names = (
+                    model._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                    .values_list(field, flat=True).distinct().iterator()
+                )
+                for name in names:
+                    try:
+                        if image_derivatives.process(name, force=options['force']):
+                            processed += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'{name}: {e}')
+            self.stdout.write(f'{target}: обработано файлов {processed}, ошибок {failed}')
+        self.stdout.write(self.style.SUCCESS('Производные изображения построены'))
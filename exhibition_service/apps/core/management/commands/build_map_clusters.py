@@ -0,0 +1,13 @@
+# exhibition_service/apps/core/management/commands/build_map_clusters.py
+from django.core.management.base import BaseCommand
+
+from apps.core.map_clusters import map_clusters
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает в кэше сетки кластеров карты для всех уровней масштаба'
+
+    def handle(self, *args, **options):
+        for kind, total in map_clusters.rebuild().items():
+            self.stdout.write(f'{kind}: объектов на карте {total}')
+        self.stdout.write(self.style.SUCCESS('Кластеры карты пересобраны'))
@@ -0,0 +1,29 @@
+# exhibition_service/apps/core/management/commands/compact_analytics.py
+from django.core.management.base import BaseCommand
+
+from apps.core.rollups import DEFAULT_BATCH_SIZE, compact_analytics
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает новые события аналитики в почасовые и дневные агрегаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество id событий, обрабатываемых в одной транзакции',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Ограничение числа пачек за один запуск',
+        )
+
+    def handle(self, *args, **options):
+        processed = compact_analytics(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Свернуто событий: {processed}'))
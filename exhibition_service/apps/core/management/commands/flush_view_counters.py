@@ -0,0 +1,22 @@
+# exhibition_service/apps/core/management/commands/flush_view_counters.py
+from django.core.management.base import BaseCommand
+
+from apps.core.unique_visitors import unique_visitors
+from apps.core.view_counters import get_buffer_settings, view_counter_buffer
+
+
+class Command(BaseCommand):
+    help = 'Принудительно сбрасывает буферы счетчиков просмотров и уникальных посетителей в БД'
+
+    def handle(self, *args, **options):
+        backend = get_buffer_settings()['BACKEND']
+        if backend == 'memory':
+            self.stdout.write(self.style.WARNING(
+                'Backend "memory" хранит буфер в памяти каждого воркера: '
+                'команда сбросит только буфер текущего процесса.'
+            ))
+
+        updated = view_counter_buffer.flush()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено объектов: {updated}'))
+        sketches = unique_visitors.flush()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено скетчей посетителей: {sketches}'))
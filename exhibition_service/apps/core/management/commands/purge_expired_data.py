@@ -0,0 +1,48 @@
+# exhibition_service/apps/core/management/commands/purge_expired_data.py
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.retention import ensure_monthly_partitions, get_policies, purge_policy
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие записи аналитики и журналов согласно DATA_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            help='Метки моделей (например, core.Analytics); по умолчанию - все политики',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Количество строк, удаляемых в одной транзакции',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать устаревшие записи',
+        )
+
+    def handle(self, *args, **options):
+        policies = get_policies()
+        if options['models']:
+            known = {policy.model_label: policy for policy in policies}
+            unknown = set(options['models']) - set(known)
+            if unknown:
+                raise CommandError(f'Нет политики хранения: {", ".join(sorted(unknown))}')
+            policies = [known[label] for label in options['models']]
+
+        for policy in policies:
+            if not options['dry_run']:
+                for name in ensure_monthly_partitions(policy.model):
+                    self.stdout.write(f'Создана секция {name}')
+
+            count = purge_policy(
+                policy,
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+            )
+            verb = 'К удалению' if options['dry_run'] else 'Удалено'
+            self.stdout.write(self.style.SUCCESS(f'{policy.model_label}: {verb} {count}'))
@@ -0,0 +1,28 @@
+# exhibition_service/apps/core/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.search import search_indexes
+
+
+class Command(BaseCommand):
+    help = 'Пересоздает поисковые документы для полнотекстового поиска'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            help='Метки моделей (например, exhibitions.Exhibition); по умолчанию - все',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexes = search_indexes.all()
+        if options['models']:
+            try:
+                indexes = [search_indexes.get(label) for label in options['models']]
+            except KeyError as error:
+                raise CommandError(f'Нет поискового индекса: {error}')
+
+        for index in indexes:
+            count = index.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{index.target_label}: документов {count}'))
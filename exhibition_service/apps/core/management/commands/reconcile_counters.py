@@ -0,0 +1,42 @@
+# exhibition_service/apps/core/management/commands/reconcile_counters.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.core.counters import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики (избранное, регистрации, обращения)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'counters',
+            nargs='*',
+            help='Счетчики в формате app_label.Model.field (по умолчанию - все)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество расхождений',
+        )
+
+    def handle(self, *args, **options):
+        if options['counters']:
+            try:
+                selected = [counters.get(name) for name in options['counters']]
+            except KeyError as e:
+                raise CommandError(f'Неизвестный счетчик: {e}')
+        else:
+            selected = counters.all()
+
+        for counter in selected:
+            drifted = counter.drifted().count()
+            if options['dry_run']:
+                self.stdout.write(f'{counter}: расхождений {drifted}')
+                continue
+
+            with transaction.atomic():
+                counter.reconcile()
+            self.stdout.write(self.style.SUCCESS(
+                f'{counter}: пересчитан, исправлено расхождений {drifted}'
+            ))
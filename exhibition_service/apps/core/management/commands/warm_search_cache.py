@@ -0,0 +1,54 @@
+# exhibition_service/apps/core/management/commands/warm_search_cache.py
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from apps.core.models import Analytics
+from apps.core.search_cache import search_results
+
+
+class Command(BaseCommand):
+    help = 'Прогревает кэш результатов для популярных поисковых запросов и выводит долю попаданий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='За сколько дней учитывать запросы')
+        parser.add_argument('--top', type=int, default=100, help='Сколько запросов прогреть')
+        parser.add_argument('--dry-run', action='store_true', help='Только вывести статистику')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        events = Analytics.objects.filter(event_type=Analytics.EventType.SEARCH, created_at__gte=since)
+
+        totals = events.values('content_type').annotate(
+            total=Count('id'),
+            hits=Count('id', filter=Q(metadata__cache_hit=True)),
+        )
+        for row in totals:
+            model = ContentType.objects.get_for_id(row['content_type']).model_class()
+            rate = row['hits'] / row['total'] * 100 if row['total'] else 0
+            self.stdout.write(
+                f'{model._meta.label}: запросов {row["total"]}, попаданий в кэш {rate:.1f}%'
+            )
+
+        popular = (
+            events.values('content_type', 'metadata__query')
+            .annotate(total=Count('id'))
+            .order_by('-total')[:options['top']]
+        )
+        warmed = 0
+        for row in popular:
+            model = ContentType.objects.get_for_id(row['content_type']).model_class()
+            query = row['metadata__query']
+            if model is None or not query or search_results.get(model._meta.label) is None:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'  {row["total"]:>6}  {model._meta.label}: {query}')
+                continue
+            list(model.objects.search(query, record=False).values_list('pk', flat=True))
+            warmed += 1
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Прогрето запросов: {warmed}'))
@@ -0,0 +1,361 @@
+# exhibition_service/apps/core/map_clusters.py
+"""
+Кластеры маркеров карты по уровням масштаба.
+
+Уровню масштаба карты соответствует точность geohash (ZOOM_PRECISION);
+кластер - ячейка geohash этой точности с числом объектов, суммой
+координат (центроид = сумма / число) и несколькими примерами pk.
+
+Сетка каждой точности хранится в кэше шардами по префиксу ячейки
+на SHARD_DEPTH символов короче: экран карты пересекает немного шардов,
+и запрос кластеров - одно чтение get_many (MGET в Redis).
+
+Сетка строится одним проходом по координатам (команда build_map_clusters
+или фоновый поток после первого обращения), а сохранение и удаление
+объекта после коммита меняют только счетчики его старой и новой ячеек
+на каждом уровне. Изменения через QuerySet.update() сетку не обновляют -
+их исправляет периодическая пересборка.
+
+Изменения и пересборка идут под блокировкой в кэше. Если блокировку
+не удалось получить, изменение пропускается, а сетка помечается
+устаревшей: запросы продолжают читать прежние шарды, а пересборку
+запускает фоновый поток. Запрос карты сам сетку никогда не строит.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .geo import cells_at_precision, count_cells, longitude_ranges
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'CACHE_ALIAS': 'default',
+    'MAX_PRECISION': 7,  # ячейка ~150 м
+    'SHARD_DEPTH': 2,
+    'MAX_SHARDS': 64,  # шардов на запрос; при большем числе точность снижается
+    'SAMPLE_SIZE': 5,
+    'REBUILD_LOCK_TIMEOUT': 300,  # секунды; срок блокировки на время пересборки
+    'REBUILD_IN_BACKGROUND': True,  # False - пересборка при чтении в вызывающем потоке (тесты)
+}
+
+# Масштаб карты (0 - весь мир) -> точность geohash
+ZOOM_PRECISION = [1, 1, 1, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5, 6, 6, 7]
+
+COUNT, SUM_LAT, SUM_LON, SAMPLES = range(4)
+
+
+def get_map_cluster_settings():
+    """Настройки кластеров карты с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'MAP_CLUSTERS', {})}
+
+
+def zoom_precision(zoom):
+    options = get_map_cluster_settings()
+    zoom = max(0, min(int(zoom), len(ZOOM_PRECISION) - 1))
+    return min(ZOOM_PRECISION[zoom], options['MAX_PRECISION'])
+
+
+def _shard(cell, precision):
+    return cell[:max(0, precision - get_map_cluster_settings()['SHARD_DEPTH'])]
+
+
+class ClusterSource:
+    """Модель, объекты которой показываются на карте"""
+
+    def __init__(self, target, kind, condition=None, field='geo_cell'):
+        self.target_label = target
+        self.kind = kind
+        self.condition = condition or {}
+        self.field = field
+
+    @property
+    def model(self):
+        return apps.get_model(self.target_label)
+
+    @property
+    def cache(self):
+        return caches[get_map_cluster_settings()['CACHE_ALIAS']]
+
+    def key(self, precision, shard):
+        return f'map_clusters:{self.kind}:{precision}:{shard}'
+
+    @property
+    def built_key(self):
+        return f'map_clusters:{self.kind}:built'
+
+    @property
+    def stale_key(self):
+        """Признак пропущенного изменения: сетку нужно пересобрать"""
+        return f'map_clusters:{self.kind}:stale'
+
+    @property
+    def shards_key(self):
+        """Список ключей шардов (нужен только при записи)"""
+        return f'map_clusters:{self.kind}:shards'
+
+    def matches(self, instance):
+        return all(getattr(instance, name) == value for name, value in self.condition.items())
+
+    def point(self, instance):
+        """(pk, широта, долгота, ячейка) объекта на карте или None"""
+        cell = getattr(instance, self.field)
+        if not cell or instance.latitude is None or not self.matches(instance):
+            return None
+        return instance.pk, float(instance.latitude), float(instance.longitude), cell
+
+    # Полная сборка
+
+    def rebuild(self, batch_size=2000):
+        """
+        Строит сетки всех уровней одним проходом под блокировкой.
+        Возвращает число объектов или None, если блокировка занята
+        """
+        options = get_map_cluster_settings()
+        with self._lock(expire=options['REBUILD_LOCK_TIMEOUT']) as acquired:
+            if not acquired:
+                logger.warning('Сетка кластеров %s не пересобрана: блокировка занята', self.kind)
+                return None
+            # Изменения, пропущенные во время сборки, снова пометят сетку устаревшей
+            self.cache.delete(self.stale_key)
+            return self._build(options, batch_size)
+
+    def _build(self, options, batch_size):
+        grids = defaultdict(dict)
+        total = 0
+        rows = (
+            self.model._base_manager.filter(**self.condition)
+            .exclude(**{self.field: ''})
+            .exclude(latitude=None)
+            .order_by('pk')
+            .values_list('pk', 'latitude', 'longitude', self.field)
+        )
+        for pk, latitude, longitude, cell in rows.iterator(chunk_size=batch_size):
+            total += 1
+            for precision in range(1, options['MAX_PRECISION'] + 1):
+                shard = grids[(precision, _shard(cell, precision))]
+                _add(shard, cell[:precision], pk, float(latitude), float(longitude), options['SAMPLE_SIZE'])
+
+        values = {self.key(precision, shard): cells for (precision, shard), cells in grids.items()}
+        previous = set(self.cache.get(self.shards_key) or [])
+        self.cache.set_many(values, timeout=None)
+        self.cache.delete_many(list(previous - set(values)))
+        self.cache.set(self.shards_key, list(values), timeout=None)
+        self.cache.set(self.built_key, time.time(), timeout=None)
+        return total
+
+    # Инкрементальные изменения
+
+    def apply(self, old, new):
+        """Переносит точку из old в new: (pk, широта, долгота, ячейка) или None"""
+        if old == new:
+            return
+        options = get_map_cluster_settings()
+        if self.cache.get(self.built_key) is None:
+            return  # сетка будет построена целиком при первом чтении
+        with self._lock() as acquired:
+            if not acquired:
+                # Без блокировки запись затерла бы изменения другого воркера:
+                # прежние шарды остаются, сетка пересобирается в фоне
+                logger.warning('Сетка кластеров %s не обновлена: блокировка занята', self.kind)
+                self.cache.set(self.stale_key, time.time(), timeout=None)
+                return
+            changed = {}
+            for precision in range(1, options['MAX_PRECISION'] + 1):
+                for point, sign in ((old, -1), (new, 1)):
+                    if point is None:
+                        continue
+                    key = self.key(precision, _shard(point[3], precision))
+                    if key not in changed:
+                        changed[key] = self.cache.get(key) or {}
+                    pk, latitude, longitude, cell = point
+                    if sign > 0:
+                        _add(changed[key], cell[:precision], pk, latitude, longitude, options['SAMPLE_SIZE'])
+                    else:
+                        _remove(changed[key], cell[:precision], pk, latitude, longitude)
+            self.cache.set_many(changed, timeout=None)
+            shards = self.cache.get(self.shards_key) or []
+            new_keys = set(changed) - set(shards)
+            if new_keys:
+                self.cache.set(self.shards_key, shards + sorted(new_keys), timeout=None)
+
+    @contextmanager
+    def _lock(self, timeout=5, expire=None):
+        """
+        Блокировка чтения-изменения-записи шардов между воркерами.
+        Отдает False, если за timeout захватить ее не удалось;
+        expire - срок жизни ключа блокировки (по умолчанию timeout)
+        """
+        key = f'map_clusters:{self.kind}:lock'
+        expire = expire or timeout
+        deadline = time.monotonic() + timeout
+        acquired = self.cache.add(key, 1, timeout=expire)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.01)
+            acquired = self.cache.add(key, 1, timeout=expire)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.cache.delete(key)
+
+    def connect(self):
+        def on_pre_save(sender, instance, raw=False, **kwargs):
+            if raw or instance.pk is None:
+                return
+            old = (
+                sender._base_manager.filter(pk=instance.pk)
+                .only(self.field, 'latitude', 'longitude', *self.condition)
+                .first()
+            )
+            instance._map_cluster_old = self.point(old) if old is not None else None
+
+        def on_save(sender, instance, raw=False, **kwargs):
+            if raw:
+                return
+            old, new = getattr(instance, '_map_cluster_old', None), self.point(instance)
+            transaction.on_commit(lambda: self.apply(old, new))
+
+        def on_delete(sender, instance, **kwargs):
+            old = self.point(instance)
+            if old is not None:
+                transaction.on_commit(lambda: self.apply(old, None))
+
+        uid = f'map_clusters:{self.kind}'
+        pre_save.connect(on_pre_save, sender=self.target_label, weak=False, dispatch_uid=f'{uid}:pre_save')
+        post_save.connect(on_save, sender=self.target_label, weak=False, dispatch_uid=f'{uid}:save')
+        post_delete.connect(on_delete, sender=self.target_label, weak=False, dispatch_uid=f'{uid}:delete')
+
+
+def _add(grid, cell, pk, latitude, longitude, sample_size):
+    entry = grid.setdefault(cell, [0, 0.0, 0.0, []])
+    entry[COUNT] += 1
+    entry[SUM_LAT] += latitude
+    entry[SUM_LON] += longitude
+    if len(entry[SAMPLES]) < sample_size and pk not in entry[SAMPLES]:
+        entry[SAMPLES].append(pk)
+
+
+def _remove(grid, cell, pk, latitude, longitude):
+    entry = grid.get(cell)
+    if entry is None:
+        return
+    entry[COUNT] -= 1
+    if entry[COUNT] <= 0:
+        del grid[cell]
+        return
+    entry[SUM_LAT] -= latitude
+    entry[SUM_LON] -= longitude
+    if pk in entry[SAMPLES]:
+        entry[SAMPLES].remove(pk)
+
+
+class MapClusterRegistry:
+    """Источники маркеров карты"""
+
+    def __init__(self):
+        self._sources = {}
+        self._rebuilding = set()
+        self._rebuilding_lock = threading.Lock()
+
+    def register(self, target, kind, condition=None, field='geo_cell'):
+        source = ClusterSource(target, kind, condition, field)
+        self._sources[kind] = source
+        source.connect()
+        return source
+
+    def get(self, kind):
+        return self._sources[kind]
+
+    def kinds(self):
+        return list(self._sources)
+
+    def rebuild(self):
+        return {kind: source.rebuild() for kind, source in self._sources.items()}
+
+    def rebuild_in_background(self, source):
+        """Пересобирает сетку источника в отдельном потоке; не больше одного потока на источник"""
+        if not get_map_cluster_settings()['REBUILD_IN_BACKGROUND']:
+            source.rebuild()
+            return
+        with self._rebuilding_lock:
+            if source.kind in self._rebuilding:
+                return
+            self._rebuilding.add(source.kind)
+        threading.Thread(
+            target=self._run_rebuild, args=(source,), name=f'map-clusters-{source.kind}', daemon=True
+        ).start()
+
+    def _run_rebuild(self, source):
+        close_old_connections()
+        try:
+            source.rebuild()
+        except Exception:
+            logger.exception('Не удалось пересобрать сетку кластеров %s', source.kind)
+        finally:
+            close_old_connections()
+            with self._rebuilding_lock:
+                self._rebuilding.discard(source.kind)
+
+    def clusters(self, min_lat, min_lon, max_lat, max_lon, zoom, kinds=None):
+        """
+        Кластеры в прямоугольнике для масштаба zoom:
+        [{type, cell, count, latitude, longitude, ids}, ...]
+        """
+        options = get_map_cluster_settings()
+        sources = [self._sources[kind] for kind in (kinds or self._sources) if kind in self._sources]
+        precision = zoom_precision(zoom)
+        while precision > 1 and count_cells(
+            min_lat, min_lon, max_lat, max_lon, precision - options['SHARD_DEPTH']
+        ) * len(sources) > options['MAX_SHARDS']:
+            precision -= 1
+
+        shards = cells_at_precision(min_lat, min_lon, max_lat, max_lon, precision - options['SHARD_DEPTH'])
+        keys = {source.key(precision, shard): source for source in sources for shard in shards}
+        if not sources:
+            return []
+        # Шарды и признаки построенных и устаревших сеток - одним чтением
+        cache = sources[0].cache
+        grids = cache.get_many(
+            list(keys)
+            + [source.built_key for source in sources]
+            + [source.stale_key for source in sources]
+        )
+        for source in sources:
+            # Отдаются имеющиеся шарды; сетка строится вне запроса
+            if source.built_key not in grids or source.stale_key in grids:
+                self.rebuild_in_background(source)
+        longitudes = longitude_ranges(min_lon, max_lon)
+
+        result = []
+        for key, grid in grids.items():
+            if key not in keys:
+                continue
+            kind = keys[key].kind
+            for cell, (count, sum_lat, sum_lon, samples) in grid.items():
+                latitude, longitude = sum_lat / count, sum_lon / count
+                if not (min_lat <= latitude <= max_lat):
+                    continue
+                if not any(low <= longitude <= high for low, high in longitudes):
+                    continue
+                result.append({
+                    'type': kind,
+                    'cell': cell,
+                    'count': count,
+                    'latitude': round(latitude, 6),
+                    'longitude': round(longitude, 6),
+                    'ids': samples,
+                })
+        return result
+
+
+map_clusters = MapClusterRegistry()
@@ -0,0 +1,298 @@
+# exhibition_service/apps/core/metrics.py
+"""
+Пакетная запись агрегированных метрик (CompanyAnalytics, ExhibitionAnalytics).
+
+Инкременты пишутся одним INSERT ... ON CONFLICT DO UPDATE
+SET value = value + excluded.value на пачку строк (PostgreSQL и SQLite).
+Внутри HTTP-запроса метрики копятся в аккумуляторе и сбрасываются
+один раз в конце ответа (см. MetricsAccumulatorMiddleware). Инкременты,
+записанные внутри транзакции, попадают в аккумулятор только после ее
+коммита; сброс выполняется после коммита внешней транзакции и
+пропускается, если контекст завершился исключением.
+
+Чтение: metric_totals() и metric_series() строят итоги и временные ряды
+одним GROUP BY-запросом вместо отдельного aggregate() на каждую метрику.
+"""
+import contextvars
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+UPSERT_BATCH_SIZE = 200
+
+_current_accumulator = contextvars.ContextVar('metric_accumulator', default=None)
+
+
+def _normalize_row(model, row):
+    """Заменяет объекты в FK-полях на их первичные ключи"""
+    normalized = {}
+    for name, value in row.items():
+        field = model._meta.get_field(name)
+        if field.is_relation and hasattr(value, 'pk'):
+            value = value.pk
+        normalized[field.attname] = value
+    return normalized
+
+
+def _merge_rows(model, rows, conflict_fields, value_field):
+    """Складывает строки с одинаковым ключом (ON CONFLICT не может обновить строку дважды)"""
+    key_attnames = [model._meta.get_field(name).attname for name in conflict_fields]
+    merged = OrderedDict()
+    for row in rows:
+        row = _normalize_row(model, row)
+        key = tuple(row[attname] for attname in key_attnames)
+        if key in merged:
+            merged[key][value_field] += row[value_field]
+        else:
+            merged[key] = dict(row)
+    return list(merged.values())
+
+
+def _fill_auto_fields(model, row):
+    """Заполняет auto_now/auto_now_add поля, которые не проставит сырой SQL"""
+    now = timezone.now()
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now_add', False) or getattr(field, 'auto_now', False):
+            row.setdefault(field.attname, now)
+    return row
+
+
+def upsert_increments(model, rows, conflict_fields, value_field='value'):
+    """
+    Атомарно прибавляет value_field для пачки строк.
+    rows - словари {поле: значение}; поля вне conflict_fields
+    записываются только при вставке новой строки.
+    """
+    rows = _merge_rows(model, rows, conflict_fields, value_field)
+    if not rows:
+        return 0
+
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if connection.vendor not in UPSERT_VENDORS:
+        return _fallback_increments(model, rows, conflict_fields, value_field, using)
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    value_column = qn(model._meta.get_field(value_field).column)
+    conflict_columns = ', '.join(
+        qn(model._meta.get_field(name).column) for name in conflict_fields
+    )
+
+    with transaction.atomic(using=using):
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = [_fill_auto_fields(model, dict(row)) for row in rows[start:start + UPSERT_BATCH_SIZE]]
+            # Django не задает DEFAULT на уровне БД: вставляем все колонки, кроме автоинкремента
+            fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+
+            params = []
+            for row in batch:
+                for field in fields:
+                    value = row.get(field.attname, field.get_default())
+                    params.append(field.get_db_prep_save(value, connection))
+
+            placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+            sql = (
+                f'INSERT INTO {table} ({", ".join(qn(field.column) for field in fields)}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT ({conflict_columns}) DO UPDATE '
+                f'SET {value_column} = {table}.{value_column} + excluded.{value_column}'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    return len(rows)
+
+
+def _fallback_increments(model, rows, conflict_fields, value_field, using):
+    """Запасной путь для СУБД без ON CONFLICT: UPDATE c F(), затем INSERT"""
+    key_attnames = [model._meta.get_field(name).attname for name in conflict_fields]
+    with transaction.atomic(using=using):
+        for row in rows:
+            lookup = {attname: row[attname] for attname in key_attnames}
+            updated = model._base_manager.using(using).filter(**lookup).update(
+                **{value_field: F(value_field) + row[value_field]}
+            )
+            if not updated:
+                model._base_manager.using(using).create(**row)
+    return len(rows)
+
+
+class MetricAccumulator:
+    """Копит инкременты метрик и записывает их одной пачкой на модель"""
+
+    def __init__(self):
+        self._pending = OrderedDict()
+
+    def add(self, model, row, conflict_fields, value_field='value'):
+        key = (model, tuple(conflict_fields), value_field)
+        # Инкремент из откаченной транзакции не записывается
+        transaction.on_commit(lambda: self._pending.setdefault(key, []).append(row))
+
+    def __len__(self):
+        return sum(len(rows) for rows in self._pending.values())
+
+    def flush(self):
+        """Записывает накопленные метрики. Возвращает количество строк"""
+        pending, self._pending = self._pending, OrderedDict()
+        written = 0
+        for (model, conflict_fields, value_field), rows in pending.items():
+            written += upsert_increments(model, rows, conflict_fields, value_field)
+        return written
+
+    def flush_safely(self):
+        """flush() для вызова после ответа: ошибка записи не роняет запрос"""
+        pending = len(self)
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception('Не удалось записать метрики, потеряно строк: %s', pending)
+            return 0
+
+
+def record_increment(model, row, conflict_fields, value_field='value'):
+    """
+    Записывает инкремент метрики: в рамках запроса - через аккумулятор,
+    вне запроса (команды, фоновые задачи) - сразу в БД.
+    """
+    accumulator = _current_accumulator.get()
+    if accumulator is not None:
+        accumulator.add(model, row, conflict_fields, value_field)
+    else:
+        upsert_increments(model, [row], conflict_fields, value_field)
+
+
+@contextmanager
+def accumulate_metrics():
+    """
+    Контекст, в котором метрики копятся и записываются при успешном
+    выходе (после коммита, если выход внутри транзакции)
+    """
+    accumulator = MetricAccumulator()
+    token = _current_accumulator.set(accumulator)
+    try:
+        yield accumulator
+    finally:
+        _current_accumulator.reset(token)
+    transaction.on_commit(accumulator.flush_safely)
+
+
+# Чтение статистики
+
+PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def _bucket_start(date, period):
+    """Начало интервала, в который попадает дата"""
+    if period == 'week':
+        return date - timedelta(days=date.weekday())
+    if period == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def _next_bucket(date, period):
+    if period == 'week':
+        return date + timedelta(days=7)
+    if period == 'month':
+        return (date.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return date + timedelta(days=1)
+
+
+def bucket_range(start_date, end_date, period='day'):
+    """Все интервалы между датами (для заполнения пропусков нулями)"""
+    buckets = []
+    current = _bucket_start(start_date, period)
+    while current <= end_date:
+        buckets.append(current)
+        current = _next_bucket(current, period)
+    return buckets
+
+
+def _filter_dates(queryset, start_date, end_date):
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    return queryset
+
+
+def metric_totals(queryset, metric_types, start_date=None, end_date=None):
+    """Суммы по каждому типу метрики одним запросом"""
+    totals = dict.fromkeys(metric_types, 0)
+    rows = (
+        _filter_dates(queryset, start_date, end_date)
+        .order_by()
+        .values('metric_type')
+        .annotate(total=Sum('value'))
+    )
+    for row in rows:
+        totals[row['metric_type']] = row['total'] or 0
+    return totals
+
+
+def metric_series(queryset, owner_field, owners, metric_types,
+                  start_date=None, end_date=None, period='day'):
+    """
+    Итоги и временные ряды метрик для одного или нескольких объектов
+    одним запросом GROUP BY owner, metric_type, bucket.
+
+    Возвращает {owner_id: {'totals': {metric: n},
+                           'series': {metric: [{'date': d, 'value': n}, ...]}}}
+    с нулями для интервалов без данных.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Неизвестный период: {period}')
+    if not isinstance(owners, (list, tuple, set)) and not hasattr(owners, 'model'):
+        owners = [owners]
+    owner_ids = [getattr(owner, 'pk', owner) for owner in owners]
+
+    rows = list(
+        _filter_dates(queryset, start_date, end_date)
+        .filter(**{f'{owner_field}__in': owner_ids})
+        .order_by()
+        .annotate(bucket=PERIODS[period]('date'))
+        .values(owner_field, 'metric_type', 'bucket')
+        .annotate(total=Sum('value'))
+    )
+
+    if rows:
+        start_date = start_date or min(row['bucket'] for row in rows)
+        end_date = end_date or max(row['bucket'] for row in rows)
+    buckets = bucket_range(start_date, end_date, period) if start_date and end_date else []
+
+    values = {}
+    for row in rows:
+        values[(row[owner_field], row['metric_type'], row['bucket'])] = row['total'] or 0
+
+    result = {}
+    for owner_id in owner_ids:
+        series = {
+            metric_type: [
+                {'date': bucket, 'value': values.get((owner_id, metric_type, bucket), 0)}
+                for bucket in buckets
+            ]
+            for metric_type in metric_types
+        }
+        result[owner_id] = {
+            'totals': {
+                metric_type: sum(point['value'] for point in points)
+                for metric_type, points in series.items()
+            },
+            'series': series,
+        }
+    return result
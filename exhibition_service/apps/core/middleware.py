@@ -0,0 +1,13 @@
+# exhibition_service/apps/core/middleware.py
+from .metrics import accumulate_metrics
+
+
+class MetricsAccumulatorMiddleware:
+    """Копит метрики аналитики за время запроса и записывает их одной пачкой"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with accumulate_metrics():
+            return self.get_response(request)
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0003_contactmessage_alter_favorite_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название')),
+                ('last_event_id', models.BigIntegerField(default=0, verbose_name='ID последнего обработанного события')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Позиция свертки аналитики',
+                'verbose_name_plural': 'Позиции свертки аналитики',
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('event_type', models.CharField(choices=[('view', 'Просмотр'), ('click', 'Клик'), ('contact', 'Обращение'), ('favorite', 'Добавление в избранное'), ('share', 'Поделиться'), ('search', 'Поиск'), ('download', 'Скачивание'), ('registration', 'Регистрация')], max_length=20, verbose_name='Тип события')),
+                ('granularity', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], max_length=10, verbose_name='Интервал')),
+                ('period_start', models.DateTimeField(verbose_name='Начало интервала')),
+                ('device_type', models.CharField(blank=True, max_length=20, verbose_name='Тип устройства')),
+                ('country', models.CharField(blank=True, max_length=100, verbose_name='Страна')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество событий')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Тип объекта')),
+            ],
+            options={
+                'verbose_name': 'Агрегат аналитики',
+                'verbose_name_plural': 'Агрегаты аналитики',
+                'ordering': ['-period_start'],
+                'indexes': [models.Index(fields=['content_type', 'object_id', 'granularity', 'period_start'], name='core_analyt_content_c7f998_idx'), models.Index(fields=['granularity', 'period_start'], name='core_analyt_granula_d30ea0_idx')],
+                'unique_together': {('content_type', 'object_id', 'event_type', 'granularity', 'period_start', 'device_type', 'country')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0004_analyticsrollup_rollupwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueVisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('sketch', models.BinaryField(verbose_name='Скетч')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Тип объекта')),
+            ],
+            options={
+                'verbose_name': 'Уникальные посетители',
+                'verbose_name_plural': 'Уникальные посетители',
+                'ordering': ['-date'],
+                'unique_together': {('content_type', 'object_id', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        text_a, text_b, text_c,
+        content='core_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_ai AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(rowid, text_a, text_b, text_c)
+        VALUES (new.id, new.text_a, new.text_b, new.text_c);
+    END
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_ad AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, text_a, text_b, text_c)
+        VALUES ('delete', old.id, old.text_a, old.text_b, old.text_c);
+    END
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_au AFTER UPDATE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, text_a, text_b, text_c)
+        VALUES ('delete', old.id, old.text_a, old.text_b, old.text_c);
+        INSERT INTO core_searchdocument_fts(rowid, text_a, text_b, text_c)
+        VALUES (new.id, new.text_a, new.text_b, new.text_c);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_au',
+    'DROP TRIGGER IF EXISTS core_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS core_searchdocument_ai',
+    'DROP TABLE IF EXISTS core_searchdocument_fts',
+]
+
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE core_searchdocument ADD COLUMN search_vector tsvector',
+    'CREATE INDEX core_searchdocument_search_vector_idx ON core_searchdocument USING GIN (search_vector)',
+    """
+    CREATE FUNCTION core_searchdocument_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.text_a, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.text_a, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.text_b, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.text_b, '')), 'B') ||
+            setweight(to_tsvector('russian', coalesce(NEW.text_c, '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(NEW.text_c, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_vector_update
+    BEFORE INSERT OR UPDATE OF text_a, text_b, text_c ON core_searchdocument
+    FOR EACH ROW EXECUTE FUNCTION core_searchdocument_vector()
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_vector_update ON core_searchdocument',
+    'DROP FUNCTION IF EXISTS core_searchdocument_vector()',
+    'DROP INDEX IF EXISTS core_searchdocument_search_vector_idx',
+    'ALTER TABLE core_searchdocument DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(schema_editor, statements_by_vendor):
+    for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    """Полнотекстовый индекс: tsvector + GIN в PostgreSQL, FTS5 в SQLite"""
+    _run(schema_editor, {'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD})
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0005_uniquevisitorsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('text_a', models.TextField(blank=True, verbose_name='Текст (вес A)')),
+                ('text_b', models.TextField(blank=True, verbose_name='Текст (вес B)')),
+                ('text_c', models.TextField(blank=True, verbose_name='Текст (вес C)')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Тип объекта')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -179,6 +179,154 @@ class Analytics(TimeStampedModel):
         return f'{self.event_type} - {self.content_object} ({self.created_at})'
 
 
+class AnalyticsRollup(models.Model):
+    """Агрегаты событий аналитики по часам и дням"""
+    class Granularity(models.TextChoices):
+        HOUR = 'hour', _('Час')
+        DAY = 'day', _('День')
+
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name=_('Тип объекта')
+    )
+    object_id = models.PositiveIntegerField(
+        verbose_name=_('ID объекта')
+    )
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    event_type = models.CharField(
+        max_length=20,
+        choices=Analytics.EventType.choices,
+        verbose_name=_('Тип события')
+    )
+    granularity = models.CharField(
+        max_length=10,
+        choices=Granularity.choices,
+        verbose_name=_('Интервал')
+    )
+    period_start = models.DateTimeField(
+        verbose_name=_('Начало интервала')
+    )
+
+    # Измерения
+    device_type = models.CharField(_('Тип устройства'), max_length=20, blank=True)
+    country = models.CharField(_('Страна'), max_length=100, blank=True)
+
+    count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Количество событий')
+    )
+
+    class Meta:
+        verbose_name = _('Агрегат аналитики')
+        verbose_name_plural = _('Агрегаты аналитики')
+        ordering = ['-period_start']
+        unique_together = (
+            'content_type', 'object_id', 'event_type', 'granularity',
+            'period_start', 'device_type', 'country'
+        )
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'granularity', 'period_start']),
+            models.Index(fields=['granularity', 'period_start']),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} - {self.content_object} ({self.period_start}): {self.count}'
+
+
+class RollupWatermark(models.Model):
+    """Позиция, до которой сырые события уже свернуты в агрегаты"""
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name=_('Название')
+    )
+    last_event_id = models.BigIntegerField(
+        default=0,
+        verbose_name=_('ID последнего обработанного события')
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Дата обновления')
+    )
+
+    class Meta:
+        verbose_name = _('Позиция свертки аналитики')
+        verbose_name_plural = _('Позиции свертки аналитики')
+
+    def __str__(self):
+        return f'{self.name}: {self.last_event_id}'
+
+
+class UniqueVisitorSketch(models.Model):
+    """Скетч HyperLogLog уникальных посетителей объекта за день"""
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name=_('Тип объекта')
+    )
+    object_id = models.PositiveIntegerField(
+        verbose_name=_('ID объекта')
+    )
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    date = models.DateField(
+        verbose_name=_('Дата')
+    )
+    sketch = models.BinaryField(
+        verbose_name=_('Скетч')
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Дата обновления')
+    )
+
+    class Meta:
+        verbose_name = _('Уникальные посетители')
+        verbose_name_plural = _('Уникальные посетители')
+        ordering = ['-date']
+        unique_together = ('content_type', 'object_id', 'date')
+
+    def __str__(self):
+        return f'{self.content_object} ({self.date})'
+
+
+class SearchDocument(models.Model):
+    """
+    Поисковый документ объекта. Полнотекстовый индекс над таблицей
+    (tsvector в PostgreSQL, FTS5 в SQLite) создается миграцией и
+    обновляется триггерами СУБД
+    """
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name=_('Тип объекта')
+    )
+    object_id = models.PositiveIntegerField(
+        verbose_name=_('ID объекта')
+    )
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    # Текст по весам релевантности: A - заголовок, B - важные поля, C - остальное
+    text_a = models.TextField(_('Текст (вес A)'), blank=True)
+    text_b = models.TextField(_('Текст (вес B)'), blank=True)
+    text_c = models.TextField(_('Текст (вес C)'), blank=True)
+
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Дата обновления')
+    )
+
+    class Meta:
+        verbose_name = _('Поисковый документ')
+        verbose_name_plural = _('Поисковые документы')
+        unique_together = ('content_type', 'object_id')
+
+    def __str__(self):
+        return f'{self.content_object}'
+
+
 class Notification(TimeStampedModel):
     """Уведомления пользователей"""
     class Type(models.TextChoices):
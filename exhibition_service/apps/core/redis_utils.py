@@ -0,0 +1,23 @@
+# exhibition_service/apps/core/redis_utils.py
+from django.core.cache import caches
+
+
+def get_redis_client(alias='default'):
+    """
+    Возвращает "сырой" клиент redis-py для кэша с указанным алиасом.
+    Поддерживает встроенный RedisCache Django и django-redis.
+    Возвращает None, если кэш не работает поверх Redis.
+    """
+    cache = caches[alias]
+
+    # django-redis
+    client = getattr(cache, 'client', None)
+    if client is not None and hasattr(client, 'get_client'):
+        return client.get_client(write=True)
+
+    # django.core.cache.backends.redis.RedisCache
+    backend_client = getattr(cache, '_cache', None)
+    if backend_client is not None and hasattr(backend_client, 'get_client'):
+        return backend_client.get_client(write=True)
+
+    return None
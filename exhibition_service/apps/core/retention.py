@@ -0,0 +1,209 @@
+# exhibition_service/apps/core/retention.py
+"""
+Политики хранения для append-only таблиц (Analytics, ViewHistory, UserActivity).
+
+Устаревшие строки удаляются пачками по первичному ключу в отдельных
+коротких транзакциях, чтобы не держать долгих блокировок. Если таблица
+в PostgreSQL секционирована по месяцам (секции <table>_pYYYYMM),
+целиком устаревшие секции удаляются через DROP TABLE.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_BATCH_PAUSE = 0.05
+
+
+@dataclass
+class RetentionPolicy:
+    """Срок хранения для модели, с переопределениями по типу события"""
+    model_label: str
+    default_days: int
+    type_field: str = ''
+    overrides: dict = field(default_factory=dict)
+    date_field: str = 'created_at'
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def max_days(self):
+        return max([self.default_days, *self.overrides.values()])
+
+    def rules(self, now=None):
+        """Пары (фильтр, исключение): по правилу на каждый переопределенный тип и общее"""
+        now = now or timezone.now()
+        date_lookup = f'{self.date_field}__lt'
+        rules = []
+        for value, days in self.overrides.items():
+            rules.append((
+                {self.type_field: value, date_lookup: now - timedelta(days=days)},
+                {},
+            ))
+        rules.append((
+            {date_lookup: now - timedelta(days=self.default_days)},
+            {f'{self.type_field}__in': list(self.overrides)} if self.overrides else {},
+        ))
+        return rules
+
+
+def get_retention_settings():
+    return getattr(settings, 'DATA_RETENTION', {})
+
+
+def get_policies():
+    """Политики из настроек DATA_RETENTION['POLICIES']"""
+    policies = []
+    for model_label, options in get_retention_settings().get('POLICIES', {}).items():
+        policies.append(RetentionPolicy(
+            model_label=model_label,
+            default_days=options['default'],
+            type_field=options.get('type_field', ''),
+            overrides=options.get('overrides', {}),
+        ))
+    return policies
+
+
+def _protected_filter(policy):
+    """Исключения из удаления: несвернутые события аналитики"""
+    if policy.model_label == 'core.Analytics':
+        from .models import RollupWatermark
+        from .rollups import WATERMARK_NAME
+
+        watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+        return {'pk__lte': watermark.last_event_id if watermark else 0}
+    return {}
+
+
+def purge_policy(policy, batch_size=None, pause=None, dry_run=False, now=None):
+    """Удаляет устаревшие строки модели пачками. Возвращает число удаленных строк"""
+    options = get_retention_settings()
+    batch_size = batch_size or options.get('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    pause = options.get('BATCH_PAUSE', DEFAULT_BATCH_PAUSE) if pause is None else pause
+
+    model = policy.model
+    manager = model._base_manager
+    protected = _protected_filter(policy)
+    deleted = 0
+
+    # Секции целиком удаляются только по наибольшему сроку; для аналитики
+    # не удаляем их вовсе, чтобы не потерять несвернутые события
+    if not dry_run and not protected:
+        deleted += drop_expired_partitions(model, policy.max_days, now=now)
+
+    for lookup, exclude in policy.rules(now=now):
+        queryset = manager.filter(**lookup, **protected)
+        if exclude:
+            queryset = queryset.exclude(**exclude)
+        if dry_run:
+            deleted += queryset.count()
+            continue
+
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic(using=router.db_for_write(model)):
+                count, _ = manager.filter(pk__in=pks).delete()
+            deleted += count
+            if len(pks) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+
+    return deleted
+
+
+# Секционирование PostgreSQL
+
+def _partition_name(table, year, month):
+    return f'{table}_p{year:04d}{month:02d}'
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def is_partitioned(model):
+    """Секционирована ли таблица модели (только PostgreSQL)"""
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table pt '
+            'JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s',
+            [model._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def ensure_monthly_partitions(model, months_ahead=2, now=None):
+    """Создает секции на текущий и следующие месяцы. Возвращает имена созданных"""
+    if not is_partitioned(model):
+        return []
+
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    now = now or timezone.now()
+    year, month = now.year, now.month
+    created = []
+
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            next_year, next_month = _next_month(year, month)
+            name = _partition_name(table, year, month)
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is None:
+                cursor.execute(
+                    f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} '
+                    f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') "
+                    f"TO ('{next_year:04d}-{next_month:02d}-01')"
+                )
+                created.append(name)
+            year, month = next_year, next_month
+    return created
+
+
+def drop_expired_partitions(model, days, now=None):
+    """Удаляет секции, все строки которых старше срока хранения"""
+    if not is_partitioned(model):
+        return 0
+
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    prefix = f'{table}_p'
+    dropped_rows = 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s',
+            [table],
+        )
+        for (name,) in cursor.fetchall():
+            suffix = name[len(prefix):]
+            if not name.startswith(prefix) or len(suffix) != 6 or not suffix.isdigit():
+                continue
+            upper_year, upper_month = _next_month(int(suffix[:4]), int(suffix[4:]))
+            upper = cutoff.replace(
+                year=upper_year, month=upper_month, day=1,
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            if upper <= cutoff:
+                cursor.execute(f'SELECT count(*) FROM {qn(name)}')
+                dropped_rows += cursor.fetchone()[0]
+                cursor.execute(f'DROP TABLE {qn(name)}')
+    return dropped_rows
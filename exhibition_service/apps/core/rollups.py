@@ -0,0 +1,112 @@
+# exhibition_service/apps/core/rollups.py
+"""
+Инкрементальная свертка сырых событий Analytics в AnalyticsRollup.
+
+Обрабатываются только события с id больше сохраненной позиции
+(RollupWatermark), поэтому стоимость свертки зависит от числа новых
+событий, а не от размера таблицы. Отчеты читают агрегаты.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .metrics import upsert_increments
+from .models import Analytics, AnalyticsRollup, RollupWatermark
+
+
+WATERMARK_NAME = 'analytics'
+DEFAULT_BATCH_SIZE = 50000
+
+# События моложе этого порога не сворачиваются: транзакции, которые
+# получили меньшие id, могут быть еще не зафиксированы
+SAFETY_LAG = timedelta(minutes=1)
+
+GRANULARITY_TRUNC = {
+    AnalyticsRollup.Granularity.HOUR: TruncHour,
+    AnalyticsRollup.Granularity.DAY: TruncDay,
+}
+
+ROLLUP_DIMENSIONS = ('content_type', 'object_id', 'event_type', 'device_type', 'country')
+ROLLUP_KEY = ROLLUP_DIMENSIONS + ('granularity', 'period_start')
+
+
+def _rollup_rows(events):
+    """Строки агрегатов для диапазона событий (один GROUP BY на интервал)"""
+    rows = []
+    for granularity, trunc in GRANULARITY_TRUNC.items():
+        grouped = (
+            events.order_by()
+            .annotate(period_start=trunc('created_at'))
+            .values(*ROLLUP_DIMENSIONS, 'period_start')
+            .annotate(total=Count('id'))
+        )
+        for group in grouped:
+            total = group.pop('total')
+            rows.append({**group, 'granularity': granularity, 'count': total})
+    return rows
+
+
+def compact_analytics(batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """
+    Сворачивает новые события в агрегаты.
+    Возвращает количество обработанных событий.
+    """
+    upper_bound = Analytics.objects.filter(
+        created_at__lte=timezone.now() - SAFETY_LAG
+    ).aggregate(max_id=Max('id'))['max_id']
+    if upper_bound is None:
+        return 0
+
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+                name=WATERMARK_NAME
+            )
+            if watermark.last_event_id >= upper_bound:
+                break
+
+            batch_end = min(watermark.last_event_id + batch_size, upper_bound)
+            events = Analytics.objects.filter(
+                id__gt=watermark.last_event_id,
+                id__lte=batch_end
+            )
+            processed += events.count()
+            upsert_increments(AnalyticsRollup, _rollup_rows(events), ROLLUP_KEY, value_field='count')
+
+            watermark.last_event_id = batch_end
+            watermark.save(update_fields=['last_event_id', 'updated_at'])
+        batches += 1
+
+    return processed
+
+
+def rollup_totals(start=None, end=None, granularity=AnalyticsRollup.Granularity.DAY, **filters):
+    """Суммы событий по типам из агрегатов"""
+    queryset = AnalyticsRollup.objects.filter(granularity=granularity, **filters)
+    if start:
+        queryset = queryset.filter(period_start__gte=start)
+    if end:
+        queryset = queryset.filter(period_start__lt=end)
+
+    totals = dict.fromkeys(Analytics.EventType.values, 0)
+    for row in queryset.order_by().values('event_type').annotate(total=Sum('count')):
+        totals[row['event_type']] = row['total']
+    return totals
+
+
+def rollup_top_objects(event_type, start=None, limit=10, granularity=AnalyticsRollup.Granularity.DAY):
+    """Объекты с наибольшим числом событий заданного типа"""
+    queryset = AnalyticsRollup.objects.filter(granularity=granularity, event_type=event_type)
+    if start:
+        queryset = queryset.filter(period_start__gte=start)
+    return list(
+        queryset.order_by()
+        .values('content_type', 'object_id')
+        .annotate(total=Sum('count'))
+        .order_by('-total')[:limit]
+    )
@@ -0,0 +1,391 @@
+# exhibition_service/apps/core/search.py
+"""
+Полнотекстовый поиск с ранжированием по релевантности.
+
+Для каждой зарегистрированной модели хранится SearchDocument с текстом
+по весам A/B/C. Индекс над документами строит СУБД (миграция core 0006):
+- PostgreSQL: колонка search_vector (русская и английская конфигурации)
+  с GIN-индексом, ранжирование ts_rank_cd;
+- SQLite: FTS5-таблица core_searchdocument_fts, ранжирование bm25,
+  термы ищутся по префиксу (замена стемминга).
+
+Документы обновляются при сохранении и удалении объектов, а также
+связанных моделей (например, продуктов и тегов компании). Буква ё
+в документах и запросах заменяется на е. Если
+полнотекстовый индекс недоступен, менеджеры используют прежний поиск
+через icontains.
+
+Изменение таблицы core_searchdocument миграциями в SQLite пересоздает
+таблицу и удаляет триггеры FTS5 - после таких миграций их нужно создать
+заново и выполнить rebuild_search_index.
+
+Выдача ограничена SEARCH_MAX_RESULTS лучшими совпадениями. У queryset
+с результатами ranked_search и cached_search есть атрибуты search_limit
+(предел) и search_truncated (совпадений больше предела); при
+клонировании queryset (filter, values и т.д.) они не сохраняются.
+"""
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router, transaction
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+
+DEFAULT_MAX_RESULTS = 500
+WEIGHTS = ('a', 'b', 'c')
+SQLITE_BM25_WEIGHTS = (10.0, 4.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def max_results():
+    return getattr(settings, 'SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+
+
+class SearchHits(list):
+    """
+    (pk, ранг) по убыванию релевантности, не больше limit.
+    truncated - совпадений было больше limit
+    """
+
+    def __init__(self, results, limit):
+        super().__init__(results[:limit])
+        self.limit = limit
+        self.truncated = len(results) > limit
+
+
+def tokenize(query):
+    """Слова запроса в нижнем регистре"""
+    return TOKEN_RE.findall((query or '').lower())
+
+
+def normalize_text(text):
+    """Нормализованная строка для ключей: нижний регистр, ё -> е, слова через пробел"""
+    return fold_yo(' '.join(tokenize(text)))
+
+
+def fold_yo(text):
+    """ё -> е (в документах и запросах, чтобы "ёмкость" находила "емкость")"""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def _join(values):
+    return ' '.join(str(value) for value in values if value)
+
+
+class SearchIndex:
+    """
+    Описание индексируемой модели.
+    fields - {вес: [поля]}; document - функция instance -> {вес: текст},
+    заменяющая fields; condition - {поле: значение} для индексируемых объектов
+    """
+
+    def __init__(self, target, fields=None, document=None, condition=None, prefetch=None):
+        self.target_label = target
+        self.fields = fields or {}
+        self.document_builder = document
+        self.condition = condition or {}
+        self.prefetch = prefetch or []
+        self._listeners = []
+
+    @property
+    def model(self):
+        return apps.get_model(self.target_label)
+
+    @property
+    def content_type(self):
+        return ContentType.objects.get_for_model(self.model)
+
+    def matches(self, instance):
+        """Должен ли объект быть в индексе"""
+        return all(getattr(instance, name) == value for name, value in self.condition.items())
+
+    def queryset(self):
+        """Все объекты, которые должны быть в индексе"""
+        return self.model._base_manager.filter(**self.condition).prefetch_related(*self.prefetch)
+
+    def document(self, instance):
+        """Тексты документа по весам"""
+        if self.document_builder is not None:
+            texts = self.document_builder(instance)
+        else:
+            texts = {
+                weight: _join(getattr(instance, name) for name in names)
+                for weight, names in self.fields.items()
+            }
+        return {f'text_{weight}': fold_yo(texts.get(weight, '')) for weight in WEIGHTS}
+
+    def on_change(self, callback):
+        """callback() вызывается после коммита каждого изменения индекса"""
+        self._listeners.append(callback)
+
+    def _changed(self):
+        for callback in self._listeners:
+            transaction.on_commit(callback)
+
+    def update(self, instance):
+        """Обновляет или удаляет документ объекта"""
+        from .models import SearchDocument
+
+        if not self.matches(instance):
+            return self.remove(instance.pk)
+        SearchDocument.objects.update_or_create(
+            content_type=self.content_type,
+            object_id=instance.pk,
+            defaults=self.document(instance),
+        )
+        self._changed()
+
+    def remove(self, pk):
+        from .models import SearchDocument
+
+        deleted, _ = SearchDocument.objects.filter(content_type=self.content_type, object_id=pk).delete()
+        if deleted:
+            self._changed()
+
+    def refresh(self, pks):
+        """Перестраивает документы объектов по первичным ключам"""
+        pks = {pk for pk in pks if pk is not None}
+        if not pks:
+            return
+        instances = {instance.pk: instance for instance in self.queryset().filter(pk__in=pks)}
+        for pk in pks:
+            if pk in instances:
+                self.update(instances[pk])
+            else:
+                self.remove(pk)
+
+    def rebuild(self, batch_size=1000):
+        """Пересоздает документы всех объектов модели. Возвращает их количество"""
+        from .models import SearchDocument
+
+        content_type = self.content_type
+        SearchDocument.objects.filter(content_type=content_type).delete()
+        created = 0
+        batch = []
+        for instance in self.queryset().iterator(chunk_size=batch_size):
+            batch.append(SearchDocument(
+                content_type=content_type,
+                object_id=instance.pk,
+                **self.document(instance)
+            ))
+            if len(batch) >= batch_size:
+                created += len(SearchDocument.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(SearchDocument.objects.bulk_create(batch))
+        self._changed()
+        return created
+
+    def connect(self):
+        post_save.connect(
+            self._on_save,
+            sender=self.target_label,
+            weak=False,
+            dispatch_uid=f'search:{self.target_label}:save',
+        )
+        post_delete.connect(
+            self._on_delete,
+            sender=self.target_label,
+            weak=False,
+            dispatch_uid=f'search:{self.target_label}:delete',
+        )
+
+    def connect_related(self, source, get_targets):
+        """
+        Обновляет документы при изменении связанной модели source.
+        get_targets(instance) - первичные ключи затронутых объектов индекса
+        """
+        def on_save(sender, instance, raw=False, **kwargs):
+            if not raw:
+                self.refresh(get_targets(instance))
+
+        def on_pre_delete(sender, instance, **kwargs):
+            # После удаления связи (например, M2M) уже не найти
+            instance._search_refresh_pks = list(get_targets(instance))
+
+        def on_delete(sender, instance, **kwargs):
+            self.refresh(getattr(instance, '_search_refresh_pks', []))
+
+        uid = f'search:{self.target_label}:{source}'
+        post_save.connect(on_save, sender=source, weak=False, dispatch_uid=f'{uid}:save')
+        pre_delete.connect(on_pre_delete, sender=source, weak=False, dispatch_uid=f'{uid}:pre_delete')
+        post_delete.connect(on_delete, sender=source, weak=False, dispatch_uid=f'{uid}:delete')
+
+    def connect_m2m(self, through):
+        """Обновляет документы при изменении M2M-связи (through - промежуточная модель)"""
+        def on_change(sender, instance, action, reverse, pk_set, **kwargs):
+            if action not in ('post_add', 'post_remove', 'post_clear'):
+                return
+            if not reverse:
+                self.refresh([instance.pk])
+            elif pk_set:
+                self.refresh(pk_set)
+
+        m2m_changed.connect(
+            on_change,
+            sender=through,
+            weak=False,
+            dispatch_uid=f'search:{self.target_label}:{through}:m2m',
+        )
+
+    def _on_save(self, sender, instance, raw=False, **kwargs):
+        if not raw:
+            self.update(instance)
+
+    def _on_delete(self, sender, instance, **kwargs):
+        self.remove(instance.pk)
+
+    def search(self, query, limit=None):
+        """
+        SearchHits: (pk, rank) по убыванию релевантности, не больше limit.
+        None - полнотекстовый индекс недоступен для текущей СУБД.
+        """
+        from .models import SearchDocument
+
+        query = fold_yo(query or '')
+        tokens = tokenize(query)
+        limit = limit or max_results()
+        if not tokens:
+            return SearchHits([], limit)
+
+        connection = connections[router.db_for_read(SearchDocument)]
+        engine = ENGINES.get(connection.vendor)
+        if engine is None or not engine.available(connection):
+            return None
+        # Лишняя строка показывает, что совпадений больше предела
+        return SearchHits(engine.search(connection, self.content_type.pk, query, tokens, limit + 1), limit)
+
+
+class PostgresEngine:
+    """tsvector + GIN, ranking ts_rank_cd"""
+
+    @staticmethod
+    def available(connection):
+        return True
+
+    @staticmethod
+    def search(connection, content_type_id, query, tokens, limit):
+        sql = (
+            "WITH q AS (SELECT websearch_to_tsquery('russian', %s) || "
+            "websearch_to_tsquery('english', %s) AS query) "
+            'SELECT d.object_id, ts_rank_cd(d.search_vector, q.query) AS rank '
+            'FROM core_searchdocument d, q '
+            'WHERE d.content_type_id = %s AND d.search_vector @@ q.query '
+            'ORDER BY rank DESC LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [query, query, content_type_id, limit])
+            return [(object_id, float(rank)) for object_id, rank in cursor.fetchall()]
+
+
+class SqliteEngine:
+    """FTS5, ranking bm25 (меньше - релевантнее)"""
+
+    _available = {}
+
+    @classmethod
+    def available(cls, connection):
+        alias = connection.alias
+        if alias not in cls._available:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_searchdocument_fts'"
+                )
+                cls._available[alias] = cursor.fetchone() is not None
+        return cls._available[alias]
+
+    @staticmethod
+    def search(connection, content_type_id, query, tokens, limit):
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(weight) for weight in SQLITE_BM25_WEIGHTS)
+        sql = (
+            f'SELECT d.object_id, bm25(core_searchdocument_fts, {weights}) AS rank '
+            'FROM core_searchdocument_fts f '
+            'JOIN core_searchdocument d ON d.id = f.rowid '
+            'WHERE core_searchdocument_fts MATCH %s AND d.content_type_id = %s '
+            'ORDER BY rank LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, content_type_id, limit])
+            return [(object_id, -rank) for object_id, rank in cursor.fetchall()]
+
+
+ENGINES = {
+    'postgresql': PostgresEngine,
+    'sqlite': SqliteEngine,
+}
+
+
+class SearchRegistry:
+    """Реестр поисковых индексов моделей"""
+
+    def __init__(self):
+        self._indexes = {}
+
+    def register(self, target, fields=None, document=None, condition=None,
+                 prefetch=None, related=None, m2m=None):
+        """
+        Регистрирует индекс модели и подключает обновление документов.
+        related - {модель: функция instance -> pk объектов индекса},
+        m2m - промежуточные модели M2M-связей, входящих в документ
+        """
+        index = SearchIndex(
+            target, fields=fields, document=document, condition=condition, prefetch=prefetch
+        )
+        self._indexes[target] = index
+        index.connect()
+        for source, get_targets in (related or {}).items():
+            index.connect_related(source, get_targets)
+        for through in m2m or []:
+            index.connect_m2m(through)
+        return index
+
+    def get(self, target):
+        return self._indexes[target]
+
+    def all(self):
+        return list(self._indexes.values())
+
+
+search_indexes = SearchRegistry()
+
+
+def rank_queryset(queryset, hits):
+    """
+    Объекты queryset из hits в порядке ранга (аннотация search_rank)
+    с атрибутами search_limit и search_truncated
+    """
+    if not hits:
+        queryset = queryset.none()
+    else:
+        rank = Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in hits],
+            output_field=FloatField(),
+        )
+        queryset = (
+            queryset.filter(pk__in=[pk for pk, _ in hits])
+            .annotate(search_rank=rank)
+            .order_by('-search_rank')
+        )
+    queryset.search_limit = getattr(hits, 'limit', len(hits))
+    queryset.search_truncated = getattr(hits, 'truncated', False)
+    return queryset
+
+
+def ranked_search(queryset, query, fallback=None, limit=None):
+    """
+    Объекты queryset, найденные по индексу, в порядке релевантности
+    (аннотация search_rank), не больше limit (по умолчанию SEARCH_MAX_RESULTS).
+    Без индекса - результат fallback()
+    """
+    if not tokenize(query):
+        return queryset
+    index = search_indexes.get(queryset.model._meta.label)
+    results = index.search(query, limit)
+    if results is None:
+        return fallback() if fallback else queryset.none()
+    return rank_queryset(queryset, results)
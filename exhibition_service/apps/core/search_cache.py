@@ -0,0 +1,118 @@
+# exhibition_service/apps/core/search_cache.py
+"""
+Кэш результатов поиска.
+
+Запрос нормализуется (normalize_text: регистр, пробелы, ё -> е), в кэше
+хранится упорядоченный список (pk, ранг) найденных объектов. При попадании
+выполняется один запрос за объектами по первичным ключам вместо поиска.
+
+Кэш каждой модели сбрасывается счетчиком поколений после любого
+изменения ее поискового индекса: сохранения объекта, входящего в индекс,
+и выхода объекта из индекса (смена статуса, удаление). Базовый queryset
+менеджера по-прежнему применяется к закэшированным ключам, поэтому
+снятые с публикации объекты не попадают в выдачу и до сброса.
+
+Каждый поиск записывается в Analytics (EventType.SEARCH) с нормализованным
+запросом и признаком попадания в кэш - по этим событиям команда
+warm_search_cache прогревает популярные запросы.
+"""
+from django.conf import settings
+
+from .caching import CacheGeneration, make_signature
+from .ingestion import record_search
+from .search import SearchHits, max_results, normalize_text, rank_queryset, ranked_search, search_indexes
+
+
+DEFAULT_SETTINGS = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 600,  # секунды
+    'RECORD_QUERIES': True,
+}
+
+
+def get_search_cache_settings():
+    """Настройки кэша поиска с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'SEARCH_CACHE', {})}
+
+
+class SearchResultCache:
+    """Кэш результатов поиска одной модели"""
+
+    def __init__(self, target):
+        self.target_label = target
+        self.generation = CacheGeneration(
+            f'search_results:{target}', get_search_cache_settings()['CACHE_ALIAS']
+        )
+
+    def get(self, query):
+        """Список (pk, ранг) для нормализованного запроса или None"""
+        return self.generation.cache.get(self.generation.key(make_signature(query)))
+
+    def set(self, query, results):
+        self.generation.cache.set(
+            self.generation.key(make_signature(query)),
+            results,
+            get_search_cache_settings()['TIMEOUT'],
+        )
+
+    def invalidate(self):
+        self.generation.bump()
+
+
+class SearchResultRegistry:
+    """Кэши результатов поиска по моделям"""
+
+    def __init__(self):
+        self._caches = {}
+
+    def register(self, target):
+        """Подключает кэш к поисковому индексу модели (индекс регистрируется раньше)"""
+        cache = SearchResultCache(target)
+        self._caches[target] = cache
+        search_indexes.get(target).on_change(cache.invalidate)
+        return cache
+
+    def get(self, target):
+        return self._caches.get(target)
+
+
+search_results = SearchResultRegistry()
+
+
+def _results(queryset, limit):
+    """SearchHits результата поиска; без ранга (icontains) - по порядку выдачи"""
+    if 'search_rank' in queryset.query.annotations:
+        hits = SearchHits(list(queryset.values_list('pk', 'search_rank')[:limit]), limit)
+        hits.truncated = hits.truncated or getattr(queryset, 'search_truncated', False)
+        return hits
+    pks = queryset.values_list('pk', flat=True)[:limit + 1]
+    return SearchHits([(pk, float(-position)) for position, pk in enumerate(pks)], limit)
+
+
+def cached_search(queryset, query, fallback=None, request=None, record=True, limit=None):
+    """
+    ranked_search с кэшем результатов по нормализованному запросу.
+    Объекты queryset в порядке релевантности (аннотация search_rank),
+    не больше limit, с атрибутами search_limit и search_truncated
+    """
+    normalized = normalize_text(query)
+    if not normalized:
+        return queryset
+    model = queryset.model
+    cache = search_results.get(model._meta.label)
+    if cache is None:
+        return ranked_search(queryset, query, fallback, limit)
+
+    limit = limit or max_results()
+    # Предел по умолчанию не входит в ключ: ключи прогретого кэша не меняются
+    key = normalized if limit == max_results() else [normalized, limit]
+    results = cache.get(key)
+    hit = results is not None
+    if not hit:
+        results = _results(ranked_search(queryset, normalized, fallback, limit), limit)
+        cache.set(key, results)
+
+    if record and get_search_cache_settings()['RECORD_QUERIES']:
+        record_search(model, normalized, request, cache_hit=hit, results=len(results))
+
+    return rank_queryset(queryset, results)
@@ -0,0 +1,187 @@
+# exhibition_service/apps/core/slugs.py
+"""
+Выделение уникальных slug.
+
+Свободный суффикс ищется одним запросом: все занятые slug вида
+base, base-1, base-2, ... выбираются по префиксу (slug LIKE 'base%') и
+первый свободный номер находится в памяти. Раньше каждый занятый номер
+стоил отдельного запроса exists().
+
+Между выбором slug и INSERT его может занять другой процесс: save()
+выполняет сохранение в точке сохранения (savepoint) и при IntegrityError
+из-за занятого slug выбирает следующий.
+
+assign() выдает уникальные slug пачке несохраненных объектов перед
+bulk_create: запрос на пачку префиксов, а не на объект.
+
+Кириллица транслитерируется (ISO 9, упрощенная, без диакритики), чтобы
+разные русские названия давали разные slug, а не общий вида "company-N".
+"""
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+
+MAX_ATTEMPTS = 5
+# Символов под суффикс "-N": все кандидаты начинаются с base[:max_length - SUFFIX_RESERVE]
+SUFFIX_RESERVE = 10
+PREFIX_BATCH_SIZE = 200
+
+TRANSLITERATION = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'j', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'і': 'i', 'ї': 'yi', 'є': 'ye', 'ґ': 'g', 'ў': 'u',
+})
+
+
+def transliterate(text):
+    """Кириллица латиницей (регистр не сохраняется)"""
+    return text.lower().translate(TRANSLITERATION)
+
+
+class SlugAllocator:
+    """
+    Правило slug модели: поле-источник и область уникальности
+    (scope - имена полей, например ('company_id',), в пределах которых
+    slug уникален)
+    """
+
+    def __init__(self, target, source, field='slug', scope=()):
+        self.target_label = target
+        self.source = source
+        self.field = field
+        self.scope = tuple(scope)
+
+    @property
+    def model(self):
+        return apps.get_model(self.target_label)
+
+    @property
+    def max_length(self):
+        return self.model._meta.get_field(self.field).max_length
+
+    def base(self, instance):
+        """slug без суффикса; для имен без букв и цифр - имя модели"""
+        base = slugify(transliterate(getattr(instance, self.source) or '')).strip('-')
+        return base[:self.max_length] or self.model._meta.model_name
+
+    def prefix(self, base):
+        return base[:self.max_length - SUFFIX_RESERVE]
+
+    def scope_key(self, instance):
+        return tuple(getattr(instance, name) for name in self.scope)
+
+    def scope_filter(self, key):
+        return dict(zip(self.scope, key))
+
+    def candidate(self, base, number):
+        """base для number=0, иначе base-number с учетом максимальной длины поля"""
+        if not number:
+            return base
+        suffix = f'-{number}'
+        return base[:self.max_length - len(suffix)] + suffix
+
+    def first_free(self, base, taken, start=0):
+        """Наименьший номер не меньше start, slug с которым не занят"""
+        number = start
+        while self.candidate(base, number) in taken:
+            number += 1
+        return number
+
+    def taken(self, prefixes, scope_key=(), exclude_pk=None):
+        """Занятые slug с одним из префиксов (один запрос)"""
+        condition = Q()
+        for prefix in set(prefixes):
+            condition |= Q(**{f'{self.field}__startswith': prefix})
+        queryset = self.model._base_manager.filter(condition, **self.scope_filter(scope_key))
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        return set(queryset.values_list(self.field, flat=True))
+
+    def allocate(self, instance):
+        """Свободный slug для объекта"""
+        base = self.base(instance)
+        taken = self.taken([self.prefix(base)], self.scope_key(instance), instance.pk)
+        return self.candidate(base, self.first_free(base, taken))
+
+    def is_taken(self, instance):
+        queryset = self.model._base_manager.filter(
+            **{self.field: getattr(instance, self.field)},
+            **self.scope_filter(self.scope_key(instance)),
+        )
+        if instance.pk is not None:
+            queryset = queryset.exclude(pk=instance.pk)
+        return queryset.exists()
+
+    def save(self, instance, save, *args, **kwargs):
+        """
+        Вызывает save(*args, **kwargs), заполнив пустой slug; при гонке
+        за тот же slug повторяет сохранение со следующим свободным
+        """
+        if getattr(instance, self.field):
+            return save(*args, **kwargs)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            setattr(instance, self.field, self.allocate(instance))
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    return save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == MAX_ATTEMPTS or not self.is_taken(instance):
+                    raise
+
+    def assign(self, instances):
+        """
+        Заполняет пустые slug несохраненных объектов уникальными значениями
+        (с учетом уже занятых в БД и друг другом). Возвращает instances
+        """
+        groups = {}
+        for instance in instances:
+            groups.setdefault(self.scope_key(instance), []).append(instance)
+
+        for scope_key, group in groups.items():
+            pending = [instance for instance in group if not getattr(instance, self.field)]
+            bases = [self.base(instance) for instance in pending]
+            prefixes = sorted({self.prefix(base) for base in bases})
+            taken = {getattr(instance, self.field) for instance in group if getattr(instance, self.field)}
+            for start in range(0, len(prefixes), PREFIX_BATCH_SIZE):
+                taken |= self.taken(prefixes[start:start + PREFIX_BATCH_SIZE], scope_key)
+            # Номера ниже последнего выданного для base уже заняты
+            numbers = {}
+            for instance, base in zip(pending, bases):
+                numbers[base] = self.first_free(base, taken, numbers.get(base, 0))
+                slug = self.candidate(base, numbers[base])
+                setattr(instance, self.field, slug)
+                taken.add(slug)
+        return instances
+
+
+class SlugRegistry:
+    """Правила slug по моделям"""
+
+    def __init__(self):
+        self._allocators = {}
+
+    def register(self, target, source, field='slug', scope=()):
+        allocator = SlugAllocator(target, source, field, scope)
+        self._allocators[target] = allocator
+        return allocator
+
+    def get(self, model):
+        return self._allocators[model._meta.label]
+
+    def save(self, instance, save, *args, **kwargs):
+        """Сохранение объекта с выделением slug по правилу его модели"""
+        return self.get(type(instance)).save(instance, save, *args, **kwargs)
+
+    def assign(self, instances):
+        """Уникальные slug для пачки объектов одной модели перед bulk_create"""
+        instances = list(instances)
+        if not instances:
+            return instances
+        return self.get(type(instances[0])).assign(instances)
+
+
+slugs = SlugRegistry()
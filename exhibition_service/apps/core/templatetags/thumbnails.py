@@ -0,0 +1,17 @@
+# exhibition_service/apps/core/templatetags/thumbnails.py
+from django import template
+
+from apps.core.thumbnails import ThumbnailError, parse_size, thumbnail_url as build_thumbnail_url
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(file, size):
+    """URL превью: {% thumbnail_url company.logo '300x300' %}; размер - из THUMBNAILS['SIZES']"""
+    try:
+        width, height = parse_size(size)
+    except ThumbnailError as e:
+        raise template.TemplateSyntaxError(f'thumbnail_url: {e}')
+    return build_thumbnail_url(file, width, height)
@@ -1,3 +1,681 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from apps.companies.models import Company, CompanyAnalytics
+from apps.exhibitions.models import Category
+
+from . import geoip
+from .autocomplete import AutocompleteSnapshot, autocomplete, write_snapshot
+from .caching import CacheGeneration
+from .images import ImageDerivativePipeline, derivative_name, image_derivatives
+from .ingestion import EventIngestionQueue
+from .map_clusters import map_clusters
+from .metrics import accumulate_metrics
+from .models import Analytics, AnalyticsRollup, RollupWatermark, UniqueVisitorSketch, ViewHistory
+from .retention import RetentionPolicy, purge_policy
+from .rollups import WATERMARK_NAME, compact_analytics, rollup_totals
+from .thumbnails import ThumbnailCache, ThumbnailError
+from .unique_visitors import DEFAULT_SETTINGS as UNIQUE_VISITOR_SETTINGS, DatabaseBackend, unique_visitors
+from .view_counters import CacheBackend as ViewCounterCacheBackend, view_counter_buffer
+from .view_dedup import BloomBackend, DEFAULT_SETTINGS as VIEW_DEDUP_SETTINGS, track_view, view_deduplicator
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_event():
+    content_type = ContentType.objects.get_for_model(Analytics)
+    return Analytics(
+        content_type=content_type,
+        object_id=1,
+        event_type=Analytics.EventType.VIEW,
+        ip_address='127.0.0.1',
+        user_agent='Mozilla/5.0',
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EventIngestionTests(TestCase):
+    """Очередь записи событий"""
+
+    @override_settings(EVENT_INGESTION={'BACKEND': 'sync'})
+    def test_failing_enrich_still_writes_event(self):
+        events = EventIngestionQueue()
+        with mock.patch('apps.core.ingestion.apply_user_agent', side_effect=ValueError('bad UA')), \
+                self.assertLogs('apps.core.ingestion', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(events.put(make_event()))
+        self.assertEqual(Analytics.objects.count(), 1)
+        self.assertEqual(events.stats()['flushed'], 1)
+
+    @override_settings(EVENT_INGESTION={'BACKEND': 'sync'})
+    def test_events_wait_for_commit(self):
+        events = EventIngestionQueue()
+        with self.captureOnCommitCallbacks(execute=True):
+            events.put(make_event())
+            self.assertEqual(Analytics.objects.count(), 0)
+        self.assertEqual(Analytics.objects.count(), 1)
+
+    @override_settings(EVENT_INGESTION={'BACKEND': 'sync'})
+    def test_rolled_back_events_are_not_written(self):
+        events = EventIngestionQueue()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                events.put(make_event())
+                transaction.set_rollback(True)
+        self.assertEqual(Analytics.objects.count(), 0)
+
+    def test_failed_batch_falls_back_to_single_rows(self):
+        events = EventIngestionQueue()
+        bad = make_event()
+        bad.object_id = None
+        with self.assertLogs('apps.core.ingestion', 'ERROR'):
+            events._write([make_event(), bad, make_event()])
+        self.assertEqual(Analytics.objects.count(), 2)
+        self.assertEqual(events.stats()['flushed'], 2)
+        self.assertEqual(events.stats()['failed'], 1)
+
+    @override_settings(EVENT_INGESTION={'BACKEND': 'thread', 'FLUSH_INTERVAL': 0.05})
+    def test_flush_returns_after_worker_failure(self):
+        events = EventIngestionQueue()
+        with mock.patch('apps.core.ingestion.close_old_connections', side_effect=RuntimeError('db down')), \
+                self.assertLogs('apps.core.ingestion', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                events.put(make_event())
+            deadline = time.monotonic() + 5
+            while not events.stats().get('failed') and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(events.stats()['failed'], 1)
+
+        flushing = threading.Thread(target=events.flush, daemon=True)
+        flushing.start()
+        flushing.join(timeout=5)
+        self.assertFalse(flushing.is_alive(), 'flush() завис на пачке, которую поток не отметил')
+        # Поток пережил ошибку и продолжает работу
+        self.assertTrue(events._worker.is_alive())
+        events._stopping.set()
+        events._worker.join(timeout=5)
+
+
+class UniqueVisitorFlushTests(TestCase):
+    """Сброс скетчей уникальных посетителей в БД"""
+
+    def test_failed_flush_keeps_sketches(self):
+        backend = DatabaseBackend({**UNIQUE_VISITOR_SETTINGS, 'MAX_BUFFER_SIZE': 1, 'FLUSH_IN_BACKGROUND': False})
+        content_type = ContentType.objects.get_for_model(Analytics)
+        today = timezone.localdate()
+        with mock.patch.object(UniqueVisitorSketch.objects, 'select_for_update', side_effect=RuntimeError('db down')), \
+                self.assertLogs('apps.core.unique_visitors', 'ERROR'):
+            # Сброс из add() не роняет запрос
+            backend.add(content_type.pk, 1, today, 'visitor-1')
+        self.assertEqual(UniqueVisitorSketch.objects.count(), 0)
+        self.assertEqual(backend.count(content_type.pk, 1, today, today), 1)
+
+        backend.add(content_type.pk, 1, today, 'visitor-2')
+        self.assertEqual(UniqueVisitorSketch.objects.count(), 1)
+        self.assertEqual(backend.count(content_type.pk, 1, today, today), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION={'BACKEND': 'sync'})
+class MetricAccumulatorTests(TestCase):
+    """Метрики запроса записываются только после успешного коммита"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.company = Company.objects.create(
+            name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+            status='active',
+        )
+
+    def record(self):
+        CompanyAnalytics.record_metric(self.company, CompanyAnalytics.MetricType.CLICKS)
+
+    def clicks(self):
+        return list(
+            CompanyAnalytics.objects.filter(metric_type=CompanyAnalytics.MetricType.CLICKS).values_list('value', flat=True)
+        )
+
+    def test_flushes_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with accumulate_metrics():
+                self.record()
+                self.record()
+            self.assertEqual(self.clicks(), [])
+        self.assertEqual(self.clicks(), [2])
+
+    def test_exception_discards_metrics(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with accumulate_metrics():
+                self.record()
+                raise RuntimeError('view failed')
+        self.assertEqual(self.clicks(), [])
+
+    def test_rolled_back_increments_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with accumulate_metrics():
+                self.record()
+                with transaction.atomic():
+                    self.record()
+                    transaction.set_rollback(True)
+        self.assertEqual(self.clicks(), [1])
+
+    def test_flush_error_is_logged(self):
+        with self.assertLogs('apps.core.metrics', 'ERROR'), \
+                mock.patch('apps.core.metrics.upsert_increments', side_effect=RuntimeError('db down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            with accumulate_metrics():
+                self.record()
+        self.assertEqual(self.clicks(), [])
+
+
+class GeoIPReloadTests(SimpleTestCase):
+    """Переоткрытие базы GeoIP при замене файла"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'geoip.bin')
+        patcher = mock.patch.multiple(geoip, _database=None, _database_mtime=None, _last_check=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def replace(self, write, mtime):
+        write()
+        os.utime(self.path, (mtime, mtime))
+        geoip._last_check = 0
+        with self.settings(GEOIP_DATABASE_PATH=self.path):
+            return geoip.get_database()
+
+    def test_reload_closes_previous_and_survives_broken_file(self):
+        first = self.replace(lambda: geoip.build_database([('1.0.0.0', '1.0.0.255', 'RU', 'Москва')], self.path), 1000)
+        self.assertEqual(first.lookup('1.0.0.1'), ('RU', 'Москва'))
+
+        def truncated():
+            with open(self.path, 'wb') as output:
+                output.write(geoip.MAGIC + b'\x01')
+        with self.assertLogs('apps.core.geoip', 'ERROR'):
+            self.assertIs(self.replace(truncated, 2000), first)
+
+        second = self.replace(lambda: geoip.build_database([('1.0.0.0', '1.0.0.255', 'KZ', 'Алматы')], self.path), 3000)
+        self.assertIsNot(second, first)
+        self.assertTrue(first._map.closed)
+        self.assertIsNone(first.lookup('2.0.0.1'))
+        self.assertEqual(second.lookup('1.0.0.1'), ('KZ', 'Алматы'))
+        second.close()
+
+
+class AutocompleteSnapshotTests(SimpleTestCase):
+    """Ранжирование подсказок в снимке"""
+
+    def test_long_prefix_ranks_past_scan_limit(self):
+        # Самые тяжелые ключи идут последними по алфавиту, за пределами max_scan
+        entries = [
+            (f'expo {number:03d}', number, {'type': 'exhibition', 'id': number, 'label': f'Expo {number}'})
+            for number in range(50)
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'autocomplete.idx')
+            write_snapshot(entries, path, max_scan=10)
+            snapshot = AutocompleteSnapshot(path)
+            try:
+                self.assertEqual([item['id'] for item in snapshot.lookup('expo', 3)], [49, 48, 47])
+                self.assertEqual([item['id'] for item in snapshot.lookup('expo 00', 3)], [9, 8, 7])
+            finally:
+                snapshot.close()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION={'BACKEND': 'sync'})
+class AutocompleteDeltaTests(TestCase):
+    """Изменения объектов пишутся в дельту и вливаются в снимок"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(autocomplete.reset)
+        self.path = os.path.join(directory.name, 'autocomplete.idx')
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.company = Company.objects.create(
+            name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+            status='active', city='Москва',
+        )
+
+    def settings_for(self, delta_max_entries):
+        return self.settings(AUTOCOMPLETE={
+            'SNAPSHOT_PATH': self.path, 'RELOAD_CHECK_INTERVAL': 0, 'DELTA_MAX_ENTRIES': delta_max_entries,
+        })
+
+    def test_change_goes_to_delta(self):
+        with self.settings_for(100):
+            autocomplete.rebuild()
+            snapshot_mtime = os.stat(self.path).st_mtime_ns
+            self.company.name = 'Globex'
+            self.company.city = 'Казань'
+            self.company.save()
+            autocomplete.apply_changes({'company': {self.company.pk}})
+
+            self.assertEqual(os.stat(self.path).st_mtime_ns, snapshot_mtime)
+            self.assertTrue(os.path.exists(autocomplete.delta_path))
+            self.assertEqual(autocomplete.suggest('acm'), [])
+            self.assertEqual([item['label'] for item in autocomplete.suggest('glo')], ['Globex'])
+            self.assertEqual(autocomplete.suggest('каз'), [{'type': 'city', 'label': 'Казань'}])
+
+            autocomplete.rebuild()
+            self.assertFalse(os.path.exists(autocomplete.delta_path))
+            self.assertEqual([item['label'] for item in autocomplete.suggest('glo')], ['Globex'])
+
+    def test_large_delta_is_merged_into_snapshot(self):
+        with self.settings_for(0):
+            autocomplete.rebuild()
+            self.company.name = 'Globex'
+            self.company.save()
+            autocomplete.apply_changes({'company': {self.company.pk}})
+
+            self.assertFalse(os.path.exists(autocomplete.delta_path))
+            self.assertEqual(autocomplete.suggest('acm'), [])
+            self.assertEqual([item['label'] for item in autocomplete.suggest('glo')], ['Globex'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION={'BACKEND': 'sync'})
+class MapClusterTests(TestCase):
+    """Кластеры карты: проверка bbox и блокировка обновлений"""
+
+    def setUp(self):
+        map_clusters.get('exhibition').cache.clear()
+
+    def get(self, bbox, zoom='5', **params):
+        return self.client.get(reverse('core:map_clusters'), {'bbox': bbox, 'zoom': zoom, **params})
+
+    def test_invalid_bbox_is_rejected(self):
+        for bbox in ('nan,0,10,10', '0,0,inf,10', '-200,0,10,10', '0,-91,10,10', '0,20,10,10.5e1', '0,50,10,40', '0,0,10'):
+            with self.subTest(bbox=bbox):
+                self.assertEqual(self.get(bbox).status_code, 400)
+        self.assertEqual(self.get('0,0,10,10', zoom='x').status_code, 400)
+
+    def test_valid_bbox(self):
+        response = self.get('170,-10,-170,10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['clusters'], [])
+
+    def test_busy_lock_skips_update_and_marks_grid_stale(self):
+        source = map_clusters.get('exhibition')
+        source.rebuild()
+        source.cache.add(f'map_clusters:{source.kind}:lock', 1)
+        point = (1, 55.75, 37.61, 'ucfv0j0q')
+        with mock.patch('apps.core.map_clusters.time.sleep'), \
+                mock.patch('apps.core.map_clusters.time.monotonic', side_effect=[0, 0, 10]), \
+                self.assertLogs('apps.core.map_clusters', 'WARNING'):
+            source.apply(None, point)
+        self.assertIsNotNone(source.cache.get(source.built_key))
+        self.assertIsNotNone(source.cache.get(source.stale_key))
+        self.assertIsNone(source.cache.get(source.key(5, point[3][:3])))
+
+        # Запрос отдает прежние шарды и только ставит пересборку в фон
+        with mock.patch.object(map_clusters, 'rebuild_in_background') as background, \
+                mock.patch.object(type(source), 'rebuild') as rebuild:
+            self.assertEqual(self.get('30,50,40,60', types='exhibition').status_code, 200)
+        background.assert_called_once_with(source)
+        rebuild.assert_not_called()
+
+    def test_request_never_builds_grid_inline(self):
+        source = map_clusters.get('exhibition')
+        with mock.patch.object(map_clusters, 'rebuild_in_background') as background, \
+                mock.patch.object(type(source), 'rebuild') as rebuild:
+            self.assertEqual(self.get('30,50,40,60').json()['clusters'], [])
+        self.assertEqual(background.call_count, len(map_clusters.kinds()))
+        rebuild.assert_not_called()
+
+    def test_rebuild_clears_stale_mark(self):
+        source = map_clusters.get('exhibition')
+        source.cache.set(source.stale_key, 1)
+        self.assertEqual(source.rebuild(), 0)
+        self.assertIsNone(source.cache.get(source.stale_key))
+        self.assertIsNotNone(source.cache.get(source.built_key))
+
+
+class ThumbnailTests(SimpleTestCase):
+    """Превью по запросу: проверка размера, хранилища и очистка кэша"""
+
+    def render(self, size):
+        return Template('{% load thumbnails %}{% thumbnail_url name size %}').render(
+            Context({'name': 'logos/acme.png', 'size': size})
+        )
+
+    def test_template_tag_validates_size(self):
+        self.assertEqual(self.render('300x300'), '/media/thumb/300x300/logos/acme.png')
+        for size in ('301x300', 'large', '300', '-1x5'):
+            with self.subTest(size=size), self.assertRaises(TemplateSyntaxError):
+                self.render(size)
+
+    def test_storage_without_local_paths(self):
+        with mock.patch('apps.core.thumbnails.default_storage') as storage:
+            storage.exists.return_value = True
+            storage.path.side_effect = NotImplementedError
+            with self.assertRaises(ThumbnailError):
+                ThumbnailCache().validate(300, 300, 'logos/acme.png')
+
+    def test_evict_removes_stale_temporary_files(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.makedirs(os.path.join(directory.name, 'ab'))
+        stale, fresh = (os.path.join(directory.name, 'ab', f'ab{name}.jpg.1.2.tmp') for name in ('old', 'new'))
+        for path in (stale, fresh):
+            with open(path, 'wb') as output:
+                output.write(b'x')
+        old = time.time() - 7200
+        os.utime(stale, (old, old))
+
+        with self.settings(THUMBNAILS={'CACHE_DIR': directory.name}):
+            ThumbnailCache().evict()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION={'BACKEND': 'sync'})
+class ViewCounterBufferTests(TestCase):
+    """Буфер счетчиков просмотров"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.company = Company.objects.create(
+            name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+            status='active',
+        )
+        view_counter_buffer.reset()
+        self.addCleanup(view_counter_buffer.reset)
+
+    def views(self):
+        return Company.objects.values_list('views_count', flat=True).get(pk=self.company.pk)
+
+    @override_settings(VIEW_COUNTER_BUFFER={'MAX_BUFFER_SIZE': 100, 'FLUSH_INTERVAL': 3600})
+    def test_increments_are_buffered_and_flushed_as_delta(self):
+        for _ in range(3):
+            self.company.increment_views()
+        self.assertEqual(self.views(), 0)
+        # Изменение поля после чтения не затирается: запись - views_count + n
+        Company.objects.filter(pk=self.company.pk).update(views_count=10)
+        self.assertEqual(view_counter_buffer.flush(), 1)
+        self.assertEqual(self.views(), 13)
+        self.assertEqual(view_counter_buffer.pending(), 0)
+
+    @override_settings(VIEW_COUNTER_BUFFER={'MAX_BUFFER_SIZE': 1, 'FLUSH_INTERVAL': 3600})
+    def test_failed_flush_from_view_is_logged_and_kept(self):
+        with mock.patch.object(view_counter_buffer, '_apply', side_effect=RuntimeError('db down')), \
+                self.assertLogs('apps.core.view_counters', 'ERROR'):
+            self.company.increment_views()
+        self.assertEqual(view_counter_buffer.pending(), 1)
+
+        with mock.patch.object(view_counter_buffer, '_apply', side_effect=RuntimeError('db down')), \
+                self.assertLogs('apps.core.view_counters', 'ERROR'), self.assertRaises(RuntimeError):
+            view_counter_buffer.flush()
+        self.assertEqual(view_counter_buffer.flush(), 1)
+        self.assertEqual(self.views(), 1)
+
+    def test_cache_drain_hides_only_missing_key(self):
+        from redis.exceptions import ConnectionError, ResponseError
+
+        backend = ViewCounterCacheBackend.__new__(ViewCounterCacheBackend)
+        backend.client = mock.Mock()
+        backend.client.rename.side_effect = ResponseError('no such key')
+        self.assertEqual(backend.drain(), {})
+        backend.client.rename.side_effect = ConnectionError('redis down')
+        with self.assertRaises(ConnectionError):
+            backend.drain()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheGenerationTests(SimpleTestCase):
+    """Поколения ключей кэша"""
+
+    def setUp(self):
+        self.generation = CacheGeneration('tests')
+        self.generation.cache.clear()
+
+    def test_bump_invalidates_keys(self):
+        old_key = self.generation.key('page', 1)
+        self.generation.bump()
+        self.assertNotEqual(self.generation.key('page', 1), old_key)
+
+    def test_evicted_counter_never_reuses_generation(self):
+        self.generation.current()
+        self.generation.bump()
+        old_key = self.generation.key('page', 1)
+        self.generation.cache.set(old_key, 'stale')
+
+        self.generation.cache.delete(self.generation.counter_key)
+        self.assertIsNone(self.generation.cache.get(self.generation.key('page', 1)))
+
+        self.generation.cache.delete(self.generation.counter_key)
+        self.generation.bump()
+        self.assertIsNone(self.generation.cache.get(self.generation.key('page', 1)))
+
+
+def make_image(size=(800, 800), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION={'BACKEND': 'sync'}, IMAGE_DERIVATIVES={'BACKEND': 'sync'})
+class ImageDerivativeTests(TestCase):
+    """Производные изображения по хэшу содержимого"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        self.storage = FileSystemStorage(location=self.media_root, base_url='/media/')
+        self.pipeline = ImageDerivativePipeline(storage=self.storage)
+
+    def test_same_content_is_rendered_once(self):
+        first = self.storage.save('logos/a.png', ContentFile(make_image()))
+        second = self.storage.save('logos/b.png', ContentFile(make_image()))
+        digest = self.pipeline.process(first)
+        self.assertRegex(digest, r'^[0-9a-f]{64}$')
+
+        with mock.patch('apps.core.images.render_derivatives') as render:
+            self.assertEqual(self.pipeline.process(second), digest)
+        render.assert_not_called()
+
+        thumbnail = derivative_name(digest, 'thumbnail', 'webp')
+        self.assertEqual(thumbnail, f'derivatives/{digest[:2]}/{digest}/thumbnail.webp')
+        with self.storage.open(thumbnail) as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (300, 300))
+        self.assertEqual(self.pipeline.url(second, 'card'), f'/media/derivatives/{digest[:2]}/{digest}/card.jpg')
+        self.assertEqual(self.pipeline.url('logos/new.png'), '/media/logos/new.png')
+
+    def test_concurrent_write_keeps_fixed_name(self):
+        name = self.storage.save('logos/a.png', ContentFile(make_image()))
+        digest = self.pipeline.process(name)
+        path = derivative_name(digest, 'card')
+        exists = self.storage.exists
+        calls = []
+
+        def raced_exists(name):
+            # Параллельный процесс записал файл между exists() и save()
+            calls.append(name)
+            return len(calls) > 1 and exists(name)
+
+        with mock.patch.object(self.storage, 'exists', side_effect=raced_exists):
+            self.assertEqual(self.pipeline._replace(path, b'late'), path)
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(self.storage.path(path)))),
+            sorted(['manifest.json'] + [f'{variant}.{ext}' for variant in ('banner', 'card', 'thumbnail') for ext in ('jpg', 'webp')]),
+        )
+
+    def test_company_logo_original_is_not_modified(self):
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        with self.settings(MEDIA_ROOT=self.media_root), \
+                self.captureOnCommitCallbacks(execute=True):
+            company = Company.objects.create(
+                name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+                status='active', logo=ContentFile(make_image(), name='acme.png'),
+            )
+        with self.settings(MEDIA_ROOT=self.media_root):
+            with default_storage.open(company.logo.name) as stored, Image.open(stored) as image:
+                # Прежний _process_images уменьшал сам оригинал до 300x300
+                self.assertEqual(image.size, (800, 800))
+            digest = image_derivatives.digest(company.logo.name)
+            self.assertIsNotNone(digest)
+            self.assertTrue(default_storage.exists(derivative_name(digest, 'thumbnail')))
+
+
+class RollupTests(TestCase):
+    """Инкрементальная свертка событий в агрегаты"""
+
+    def setUp(self):
+        self.content_type = ContentType.objects.get_for_model(Analytics)
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+
+    def event(self, event_type, created_at):
+        event = Analytics.objects.create(content_type=self.content_type, object_id=1, event_type=event_type)
+        Analytics.objects.filter(pk=event.pk).update(created_at=created_at)
+        return event
+
+    def counts(self, granularity):
+        return dict(
+            AnalyticsRollup.objects.filter(granularity=granularity).values_list('event_type', 'count')
+        )
+
+    def test_compaction_advances_watermark_and_skips_recent_events(self):
+        view, click = Analytics.EventType.VIEW, Analytics.EventType.CLICK
+        self.event(view, self.hour + timedelta(minutes=5))
+        self.event(view, self.hour + timedelta(minutes=50))
+        last_old = self.event(click, self.hour + timedelta(minutes=10))
+        recent = self.event(view, timezone.now())
+
+        self.assertEqual(compact_analytics(batch_size=2), 3)
+        self.assertEqual(RollupWatermark.objects.get(name=WATERMARK_NAME).last_event_id, last_old.pk)
+        self.assertEqual(self.counts(AnalyticsRollup.Granularity.HOUR), {view: 2, click: 1})
+        self.assertEqual(self.counts(AnalyticsRollup.Granularity.DAY), {view: 2, click: 1})
+
+        # Повторный запуск не учитывает события дважды
+        self.assertEqual(compact_analytics(), 0)
+
+        Analytics.objects.filter(pk=recent.pk).update(created_at=self.hour + timedelta(minutes=30))
+        self.assertEqual(compact_analytics(), 1)
+        self.assertEqual(self.counts(AnalyticsRollup.Granularity.HOUR), {view: 3, click: 1})
+        self.assertEqual(RollupWatermark.objects.get(name=WATERMARK_NAME).last_event_id, recent.pk)
+        totals = rollup_totals(start=self.hour - timedelta(days=1))
+        self.assertEqual((totals[view], totals[click]), (3, 1))
+
+    def test_max_batches_limits_one_run(self):
+        for minute in range(5):
+            self.event(Analytics.EventType.VIEW, self.hour + timedelta(minutes=minute))
+        self.assertEqual(compact_analytics(batch_size=2, max_batches=1), 2)
+        self.assertEqual(compact_analytics(batch_size=2), 3)
+        self.assertEqual(self.counts(AnalyticsRollup.Granularity.DAY), {Analytics.EventType.VIEW: 5})
+
+
+class RetentionTests(TestCase):
+    """Удаление устаревших событий пачками"""
+
+    def setUp(self):
+        self.content_type = ContentType.objects.get_for_model(Analytics)
+        self.policy = RetentionPolicy(
+            'core.Analytics', default_days=30, type_field='event_type',
+            overrides={Analytics.EventType.CLICK: 10},
+        )
+
+    def event(self, event_type, days_ago):
+        event = Analytics.objects.create(content_type=self.content_type, object_id=1, event_type=event_type)
+        Analytics.objects.filter(pk=event.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return event
+
+    def test_type_overrides_and_batches(self):
+        view, click = Analytics.EventType.VIEW, Analytics.EventType.CLICK
+        old_views = [self.event(view, 40) for _ in range(3)]
+        fresh_view = self.event(view, 20)
+        old_click = self.event(click, 15)
+        fresh_click = self.event(click, 5)
+        RollupWatermark.objects.create(name=WATERMARK_NAME, last_event_id=fresh_click.pk)
+
+        self.assertEqual(purge_policy(self.policy, batch_size=2, pause=0, dry_run=True), 4)
+        self.assertEqual(Analytics.objects.count(), 6)
+
+        self.assertEqual(purge_policy(self.policy, batch_size=2, pause=0), 4)
+        self.assertEqual(
+            set(Analytics.objects.values_list('pk', flat=True)),
+            {fresh_view.pk, fresh_click.pk},
+        )
+        self.assertFalse(Analytics.objects.filter(pk__in=[event.pk for event in old_views + [old_click]]).exists())
+
+    def test_events_above_watermark_are_kept(self):
+        rolled_up = self.event(Analytics.EventType.VIEW, 40)
+        pending = self.event(Analytics.EventType.VIEW, 40)
+        RollupWatermark.objects.create(name=WATERMARK_NAME, last_event_id=rolled_up.pk)
+
+        self.assertEqual(purge_policy(self.policy, pause=0), 1)
+        self.assertEqual(list(Analytics.objects.values_list('pk', flat=True)), [pending.pk])
+
+
+class BloomDedupTests(SimpleTestCase):
+    """Фильтр Блума из двух поколений"""
+
+    def test_repeat_is_dropped_until_two_rotations(self):
+        clock = [1000.0]
+        with mock.patch('apps.core.view_dedup.time.monotonic', side_effect=lambda: clock[0]):
+            backend = BloomBackend({**VIEW_DEDUP_SETTINGS, 'WINDOW': 60, 'BLOOM_CAPACITY': 1000})
+            self.assertTrue(backend.first_seen('s1:exhibitions.exhibition:1'))
+            self.assertFalse(backend.first_seen('s1:exhibitions.exhibition:1'))
+            self.assertTrue(backend.first_seen('s2:exhibitions.exhibition:1'))
+
+            # После первой ротации ключ остается в предыдущем поколении
+            clock[0] += 61
+            self.assertFalse(backend.first_seen('s2:exhibitions.exhibition:1'))
+            # После второй - забыт
+            clock[0] += 61
+            self.assertTrue(backend.first_seen('s2:exhibitions.exhibition:1'))
+            backend.reset()
+            self.assertTrue(backend.first_seen('s1:exhibitions.exhibition:1'))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, EVENT_INGESTION={'BACKEND': 'sync'}, VIEW_DEDUP={'BACKEND': 'cache'},
+    UNIQUE_VISITORS={'FLUSH_IN_BACKGROUND': False},
+)
+class TrackViewTests(TestCase):
+    """Учет просмотров с дедупликацией в пределах окна"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='owner@example.com', username='owner', password='x')
+        self.company = Company.objects.create(
+            name='Acme', description='-', created_by=user, category=Category.objects.create(name='Build'),
+            status='active',
+        )
+        view_deduplicator.reset()
+        self.addCleanup(view_deduplicator.reset)
+        view_counter_buffer.reset()
+        self.addCleanup(view_counter_buffer.reset)
+        unique_visitors.reset()
+        self.addCleanup(unique_visitors.reset)
+
+    def request(self, ip, user_agent='Mozilla/5.0'):
+        request = RequestFactory().get('/', REMOTE_ADDR=ip, HTTP_USER_AGENT=user_agent)
+        request.user = mock.Mock(is_authenticated=False)
+        return request
+
+    def test_repeat_views_within_window_are_not_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(track_view(self.request('10.0.0.1'), self.company))
+            self.assertFalse(track_view(self.request('10.0.0.1'), self.company))
+            self.assertTrue(track_view(self.request('10.0.0.1', 'Other/1.0'), self.company))
+            self.assertTrue(track_view(self.request('10.0.0.2'), self.company))
+        self.assertEqual(ViewHistory.objects.count(), 3)
+        self.assertEqual(self.company.views_count, 3)
+        self.assertEqual(unique_visitors.count(self.company), 3)
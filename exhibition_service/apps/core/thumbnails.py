@@ -0,0 +1,320 @@
+# exhibition_service/apps/core/thumbnails.py
+"""
+Превью медиафайлов по запросу: /media/thumb/<ширина>x<высота>/<путь>.
+
+Вариант строится при первом обращении и сохраняется в дисковом кэше
+(CACHE_DIR, вне MEDIA_ROOT). Имя файла в кэше - хэш пути, размера и
+времени изменения оригинала, размеров превью и формата: замена
+оригинала дает новый ключ, а старые варианты вытесняются.
+
+Объем кэша ограничен MAX_SIZE: при превышении удаляются давно не
+запрашивавшиеся варианты (время изменения файла обновляется при чтении
+не чаще TOUCH_INTERVAL), пока объем не опустится до LOW_WATER_MARK.
+Недописанные временные файлы (оставшиеся после падения процесса)
+старше TEMPORARY_MAX_AGE удаляются при том же пересчете.
+
+Превью строятся только для хранилищ с локальными файлами
+(Storage.path()); для остальных ThumbnailError.
+
+Одновременные запросы одного варианта ждут одну сборку: блокировка по
+ключу внутри процесса и файловая (fcntl) между процессами; число
+одновременных декодирований Pillow в процессе ограничено MAX_RENDERS.
+
+Перед Django обычно стоит веб-сервер, отдающий /media/: префикс
+/media/thumb/ нужно проксировать в приложение.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from PIL import Image, ImageOps
+
+from .images import encode_image
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'CACHE_DIR': '',  # по умолчанию BASE_DIR/data/thumbnails
+    'MAX_SIZE': 512 * 1024 * 1024,  # байт
+    'RESCAN_INTERVAL': 300,  # секунды; объем, записанный другими процессами, виден после пересчета
+    'LOW_WATER_MARK': 0.9,  # доля MAX_SIZE после вытеснения
+    'TOUCH_INTERVAL': 3600,  # секунды
+    'TEMPORARY_MAX_AGE': 3600,  # секунды
+    'SIZES': [(150, 150), (300, 300), (600, 400), (1200, 400)],  # None - любые до MAX_DIMENSION
+    'MAX_DIMENSION': 2000,
+    'MAX_RENDERS': 2,
+    'JPEG_QUALITY': 85,
+    'WEBP_QUALITY': 80,
+}
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+def get_thumbnail_settings():
+    """Настройки превью с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'THUMBNAILS', {})}
+
+
+class ThumbnailError(Exception):
+    """Превью нельзя построить: недопустимый размер, путь или не изображение"""
+
+
+class KeyedLocks:
+    """Блокировки по ключу; записи удаляются, когда ключ никто не ждет"""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class ThumbnailCache:
+    """Дисковый кэш превью с вытеснением давно не используемых"""
+
+    def __init__(self):
+        self._locks = KeyedLocks()
+        self._renders = None
+        self._total = None
+        self._scanned_at = 0
+        self._total_lock = threading.Lock()
+
+    @property
+    def directory(self):
+        directory = get_thumbnail_settings()['CACHE_DIR'] or os.path.join(settings.BASE_DIR, 'data', 'thumbnails')
+        return os.path.abspath(directory)
+
+    def validate(self, width, height, name):
+        check_size(width, height)
+        if not name.lower().endswith(EXTENSIONS):
+            raise ThumbnailError(f'Файл {name} не является изображением')
+        try:
+            if not default_storage.exists(name):
+                raise ThumbnailError(f'Файл {name} не найден')
+            return default_storage.path(name)
+        except SuspiciousFileOperation:
+            raise ThumbnailError(f'Недопустимый путь {name}')
+        except NotImplementedError:
+            raise ThumbnailError('Хранилище медиафайлов не поддерживает локальные пути')
+
+    def key(self, source, name, width, height, image_format):
+        stat = os.stat(source)
+        data = f'{name}\0{stat.st_size}\0{stat.st_mtime_ns}\0{width}x{height}\0{image_format}'
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def path(self, key, image_format):
+        extension = 'jpg' if image_format == 'jpeg' else image_format
+        return os.path.join(self.directory, key[:2], f'{key}.{extension}')
+
+    def get(self, name, width, height, image_format='jpeg'):
+        """(путь к файлу превью, ключ); при необходимости строит превью"""
+        source = self.validate(width, height, name)
+        key = self.key(source, name, width, height, image_format)
+        path = self.path(key, image_format)
+        if self._touch(path):
+            return path, key
+
+        # Один поток на ключ в процессе, один процесс на ключ на сервере
+        with self._locks.hold(key), self._file_lock(key):
+            if not os.path.exists(path):
+                with self._render_slot():
+                    content = render_thumbnail(source, width, height, image_format)
+                self._write(path, content)
+        return path, key
+
+    def _touch(self, path):
+        """Отмечает использование варианта; False, если его нет"""
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        if now - modified > get_thumbnail_settings()['TOUCH_INTERVAL']:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                return False  # вытеснен между stat и utime
+        return True
+
+    @contextmanager
+    def _render_slot(self):
+        if self._renders is None:
+            with self._total_lock:
+                if self._renders is None:
+                    self._renders = threading.BoundedSemaphore(get_thumbnail_settings()['MAX_RENDERS'])
+        with self._renders:
+            yield
+
+    @contextmanager
+    def _file_lock(self, key):
+        """
+        Межпроцессная блокировка варианта. Файлы блокировок общие для
+        ключей с одинаковым первым байтом и никогда не удаляются
+        """
+        if fcntl is None:
+            yield
+            return
+        directory = os.path.join(self.directory, 'locks')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{key[:2]}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporary, 'wb') as output:
+                output.write(content)
+            os.replace(temporary, path)
+        except OSError:
+            _remove(temporary)
+            raise
+        options = get_thumbnail_settings()
+        with self._total_lock:
+            if self._total is not None:
+                self._total += len(content)
+            over = (
+                self._total is None
+                or self._total > options['MAX_SIZE']
+                or time.monotonic() - self._scanned_at > options['RESCAN_INTERVAL']
+            )
+        if over:
+            self.evict()
+
+    def _files(self, temporary=None):
+        """(mtime, размер, путь) вариантов; пути недописанных файлов - в список temporary"""
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if file_name.endswith('.lock'):
+                    continue
+                path = os.path.join(root, file_name)
+                if file_name.endswith('.tmp'):
+                    if temporary is not None:
+                        temporary.append(path)
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        """
+        Пересчитывает объем кэша и, если он больше MAX_SIZE, удаляет
+        давно не использованные варианты. Возвращает число удаленных
+        """
+        options = get_thumbnail_settings()
+        temporary = []
+        files = sorted(self._files(temporary))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        # Временные файлы пишутся доли секунды: старые остались от упавших процессов
+        stale_before = time.time() - options['TEMPORARY_MAX_AGE']
+        for path in temporary:
+            try:
+                if os.stat(path).st_mtime < stale_before:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        if total > options['MAX_SIZE']:
+            target = options['MAX_SIZE'] * options['LOW_WATER_MARK']
+            for _, size, path in files:
+                if total <= target:
+                    break
+                _remove(path)
+                total -= size
+                removed += 1
+        with self._total_lock:
+            self._total, self._scanned_at = total, time.monotonic()
+        if removed:
+            logger.info('Кэш превью: удалено вариантов %s, объем %s байт', removed, total)
+        return removed
+
+    def clear(self):
+        """Удаляет все варианты (для тестов и команд)"""
+        for _, _, path in list(self._files()):
+            os.remove(path)
+        with self._total_lock:
+            self._total = 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def check_size(width, height):
+    """ThumbnailError, если размер не входит в SIZES (или больше MAX_DIMENSION)"""
+    options = get_thumbnail_settings()
+    if options['SIZES'] is not None:
+        if (width, height) not in {tuple(size) for size in options['SIZES']}:
+            raise ThumbnailError(f'Недопустимый размер превью {width}x{height}')
+    elif not (0 < width <= options['MAX_DIMENSION'] and 0 < height <= options['MAX_DIMENSION']):
+        raise ThumbnailError(f'Недопустимый размер превью {width}x{height}')
+
+
+def parse_size(size):
+    """(ширина, высота) из строки вида '300x300'; ThumbnailError для недопустимого размера"""
+    width, separator, height = str(size).strip().partition('x')
+    if not (separator and width.isdigit() and height.isdigit()):
+        raise ThumbnailError(f'Размер превью {size!r} не в формате ШИРИНАxВЫСОТА')
+    width, height = int(width), int(height)
+    check_size(width, height)
+    return width, height
+
+
+def render_thumbnail(source, width, height, image_format='jpeg'):
+    """Байты превью файла source, вписанного в width x height"""
+    options = get_thumbnail_settings()
+    try:
+        with Image.open(source) as image:
+            image.draft('RGB', (width, height))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+            return encode_image(image, image_format, options)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f'Не удалось построить превью: {e}')
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def thumbnail_url(file, width, height):
+    """URL превью медиафайла (FieldFile или имя); '' для пустого поля"""
+    name = getattr(file, 'name', file)
+    if not name:
+        return ''
+    return reverse('core:thumbnail', kwargs={'width': width, 'height': height, 'path': name})
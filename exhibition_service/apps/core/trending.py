@@ -0,0 +1,121 @@
+# exhibition_service/apps/core/trending.py
+"""
+Инкрементальный рейтинг "в тренде" с экспоненциальным затуханием.
+
+Используется прямое затухание (forward decay): событие в момент t
+добавляет weight * 2^((t - EPOCH) / HALF_LIFE), поэтому старые оценки
+не нужно пересчитывать - более поздние события просто весят больше,
+а порядок объектов совпадает с порядком по затухающей сумме.
+
+Чтобы значения не переполняли float, в колонке хранится log2 суммы:
+    score' = max(score, x) + log2(1 + 2^-|score - x|)
+Обновление - один UPDATE на пачку объектов, выборка top-N идет по индексу.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+
+DEFAULT_SETTINGS = {
+    'HALF_LIFE_HOURS': 48,
+    'EPOCH': '2024-01-01',
+}
+
+
+def get_trending_settings():
+    """Настройки рейтинга с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TRENDING', {})}
+
+
+def decay_exponent(now=None):
+    """(now - EPOCH) в периодах полураспада"""
+    options = get_trending_settings()
+    epoch = datetime.fromisoformat(options['EPOCH']).replace(tzinfo=dt_timezone.utc)
+    elapsed = ((now or timezone.now()) - epoch).total_seconds()
+    return elapsed / (options['HALF_LIFE_HOURS'] * 3600)
+
+
+def current_value(score, now=None):
+    """Затухающая сумма весов на текущий момент из хранимого log2"""
+    return 2.0 ** (score - decay_exponent(now))
+
+
+class TrendingScore:
+    """Рейтинг "в тренде" одной модели"""
+
+    def __init__(self, target, weights, field='trending_score'):
+        self.target_label = target
+        self.weights = weights
+        self.field = field
+
+    def __str__(self):
+        return f'{self.target_label}.{self.field}'
+
+    @property
+    def target_model(self):
+        return apps.get_model(self.target_label)
+
+    def bump(self, pks, event, amount=1, now=None):
+        """Добавляет amount событий event объектам pks одним UPDATE"""
+        weight = self.weights.get(event, 0) * amount
+        if not pks or weight <= 0:
+            return 0
+        increment = Value(math.log2(weight) + decay_exponent(now), output_field=FloatField())
+        score = F(self.field)
+        return self.target_model._base_manager.filter(pk__in=sorted(pks)).update(**{
+            self.field: Greatest(score, increment) + Log(
+                Value(2.0), Value(1.0) + Power(Value(2.0), -Abs(score - increment))
+            )
+        })
+
+    def connect_source(self, event, source, fk):
+        """Начисляет событие при создании строки source, ссылающейся через fk"""
+        def on_save(sender, instance, created, raw=False, **kwargs):
+            if created and not raw:
+                target_id = getattr(instance, f'{fk}_id')
+                if target_id is not None:
+                    self.bump([target_id], event)
+
+        post_save.connect(
+            on_save,
+            sender=source,
+            weak=False,
+            dispatch_uid=f'trending:{self}:{event}',
+        )
+
+
+class TrendingRegistry:
+    """Реестр рейтингов "в тренде" по моделям"""
+
+    def __init__(self):
+        self._scores = {}
+
+    def register(self, target, weights, sources=None, field='trending_score'):
+        """
+        Регистрирует рейтинг модели. weights - вес каждого типа события,
+        sources - {событие: (модель-источник, fk)} для начисления по созданию строк
+        """
+        score = TrendingScore(target, weights, field)
+        self._scores[target] = score
+        for event, (source, fk) in (sources or {}).items():
+            score.connect_source(event, source, fk)
+        return score
+
+    def get(self, target):
+        return self._scores.get(target)
+
+    def bump(self, target, pks, event, amount=1):
+        """Начисляет события, если для модели зарегистрирован рейтинг"""
+        score = self.get(target)
+        if score is None:
+            return 0
+        return score.bump(pks, event, amount)
+
+
+trending = TrendingRegistry()
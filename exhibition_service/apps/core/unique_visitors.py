@@ -0,0 +1,266 @@
+# exhibition_service/apps/core/unique_visitors.py
+"""
+Уникальные посетители объектов по дням на HyperLogLog.
+
+Backend "db": скетчи копятся в памяти процесса и периодически
+объединяются со скетчами в UniqueVisitorSketch (объединение
+коммутативно, поэтому буферизация не искажает оценку). Сброс идет
+в фоновом потоке, а не в запросе; при ошибке БД скетчи возвращаются
+в буфер. FLUSH_IN_BACKGROUND=False - сброс в вызывающем потоке (тесты).
+Backend "cache": PFADD/PFCOUNT в Redis, ключ на объект и день.
+
+Уникальные за период - оценка объединения дневных скетчей.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .hll import DEFAULT_PRECISION, HyperLogLog
+from .redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'db',
+    'CACHE_ALIAS': 'default',
+    'PRECISION': DEFAULT_PRECISION,
+    'FLUSH_INTERVAL': 60,
+    'MAX_BUFFER_SIZE': 500,
+    'FLUSH_IN_BACKGROUND': True,
+    'KEY_TTL': 400 * 24 * 3600,
+}
+
+
+def get_unique_visitor_settings():
+    """Настройки подсистемы с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'UNIQUE_VISITORS', {})}
+
+
+def _dates(start_date, end_date):
+    current = start_date
+    while current <= end_date:
+        yield current
+        current += timedelta(days=1)
+
+
+def _default_range(start_date, end_date):
+    end_date = end_date or timezone.localdate()
+    start_date = start_date or end_date - timedelta(days=29)
+    return start_date, end_date
+
+
+class DatabaseBackend:
+    """Скетчи в UniqueVisitorSketch с буфером в памяти процесса"""
+
+    def __init__(self, options):
+        self.precision = options['PRECISION']
+        self.flush_interval = options['FLUSH_INTERVAL']
+        self.max_buffer_size = options['MAX_BUFFER_SIZE']
+        self.background = options['FLUSH_IN_BACKGROUND']
+        self._buffer = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flushing = False
+
+    def add(self, content_type_id, object_id, date, visitor):
+        key = (content_type_id, object_id, date)
+        with self._lock:
+            sketch = self._buffer.get(key)
+            if sketch is None:
+                sketch = self._buffer[key] = HyperLogLog(self.precision)
+            sketch.add(visitor)
+            size = len(self._buffer)
+
+        interval_passed = time.monotonic() - self._last_flush >= self.flush_interval
+        if size >= self.max_buffer_size or interval_passed:
+            if self.background:
+                self._flush_in_background()
+            else:
+                self.flush(blocking=False)
+
+    def _flush_in_background(self):
+        """Запускает сброс в отдельном потоке; не больше одного потока за раз"""
+        with self._lock:
+            if self._flushing:
+                return
+            self._flushing = True
+            self._last_flush = time.monotonic()
+        threading.Thread(target=self._run_flush, name='unique-visitors-flush', daemon=True).start()
+
+    def _run_flush(self):
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._flushing = False
+
+    def _restore(self, items):
+        """Возвращает несохраненные скетчи в буфер, объединяя с новыми"""
+        with self._lock:
+            for key, sketch in items:
+                current = self._buffer.get(key)
+                self._buffer[key] = sketch if current is None else current.merge(sketch)
+
+    def flush(self, blocking=True):
+        """
+        Объединяет буфер со скетчами в БД. Возвращает число обновленных скетчей.
+        При ошибке несохраненные скетчи возвращаются в буфер
+        """
+        from .models import UniqueVisitorSketch
+
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            with self._lock:
+                pending, self._buffer = self._buffer, {}
+            # Стабильный порядок блокировок строк
+            items = sorted(pending.items(), key=lambda item: item[0])
+            saved = 0
+            try:
+                for (content_type_id, object_id, date), sketch in items:
+                    with transaction.atomic():
+                        row, created = UniqueVisitorSketch.objects.select_for_update().get_or_create(
+                            content_type_id=content_type_id,
+                            object_id=object_id,
+                            date=date,
+                            defaults={'sketch': sketch.to_bytes()},
+                        )
+                        if not created:
+                            row.sketch = HyperLogLog.from_bytes(row.sketch).merge(sketch).to_bytes()
+                            row.save(update_fields=['sketch', 'updated_at'])
+                    saved += 1
+            except Exception:
+                logger.exception(
+                    'Не удалось сохранить скетчи уникальных посетителей, в буфер возвращено %s',
+                    len(items) - saved,
+                )
+                self._restore(items[saved:])
+            return saved
+        finally:
+            self._flush_lock.release()
+
+    def sketches(self, content_type_id, object_id, start_date, end_date):
+        from .models import UniqueVisitorSketch
+
+        stored = UniqueVisitorSketch.objects.filter(
+            content_type_id=content_type_id,
+            object_id=object_id,
+            date__range=(start_date, end_date),
+        ).values_list('sketch', flat=True)
+        result = [HyperLogLog.from_bytes(data) for data in stored]
+        with self._lock:
+            result.extend(
+                sketch for (ct_id, obj_id, date), sketch in self._buffer.items()
+                if ct_id == content_type_id and obj_id == object_id and start_date <= date <= end_date
+            )
+        return result
+
+    def count(self, content_type_id, object_id, start_date, end_date):
+        sketches = self.sketches(content_type_id, object_id, start_date, end_date)
+        return HyperLogLog.union(sketches, self.precision).count() if sketches else 0
+
+
+class CacheBackend:
+    """Скетчи в Redis: PFADD на событие, PFCOUNT по ключам дней периода"""
+
+    def __init__(self, options):
+        self.client = get_redis_client(options['CACHE_ALIAS'])
+        if self.client is None:
+            raise RuntimeError('UNIQUE_VISITORS: backend "cache" требует кэш на базе Redis')
+        self.ttl = options['KEY_TTL']
+
+    @staticmethod
+    def key(content_type_id, object_id, date):
+        return f'uv:{content_type_id}:{object_id}:{date.isoformat()}'
+
+    def add(self, content_type_id, object_id, date, visitor):
+        key = self.key(content_type_id, object_id, date)
+        pipe = self.client.pipeline()
+        pipe.pfadd(key, visitor)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def flush(self, blocking=True):
+        return 0
+
+    def count(self, content_type_id, object_id, start_date, end_date):
+        keys = [self.key(content_type_id, object_id, date) for date in _dates(start_date, end_date)]
+        return self.client.pfcount(*keys) if keys else 0
+
+
+BACKENDS = {
+    'db': DatabaseBackend,
+    'cache': CacheBackend,
+}
+
+
+class UniqueVisitors:
+    """Точка входа: учет посетителей и оценки уникальных за период"""
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    options = get_unique_visitor_settings()
+                    self._backend = BACKENDS[options['BACKEND']](options)
+        return self._backend
+
+    def reset(self):
+        """Пересоздает backend (например, после изменения настроек)"""
+        with self._lock:
+            self._backend = None
+
+    def add(self, obj, visitor, date=None):
+        """Учитывает посетителя объекта за день"""
+        content_type = ContentType.objects.get_for_model(obj)
+        self.backend.add(content_type.pk, obj.pk, date or timezone.localdate(), visitor)
+
+    def count(self, obj, start_date=None, end_date=None):
+        """Оценка числа уникальных посетителей за период (по умолчанию 30 дней)"""
+        start_date, end_date = _default_range(start_date, end_date)
+        content_type = ContentType.objects.get_for_model(obj)
+        return self.backend.count(content_type.pk, obj.pk, start_date, end_date)
+
+    def stats(self, obj, start_date=None, end_date=None):
+        """
+        Поле для статистики объекта за период. Скетчи хранятся по дням
+        и ограниченное время, поэтому без начала периода (итоги за все
+        время) возвращается оценка за 30 дней в поле unique_visitors_30d
+        """
+        if start_date is None:
+            return {'unique_visitors_30d': self.count(obj, end_date=end_date)}
+        return {'unique_visitors': self.count(obj, start_date, end_date)}
+
+    def flush(self):
+        return self.backend.flush()
+
+
+unique_visitors = UniqueVisitors()
+
+
+@atexit.register
+def _flush_on_exit():
+    """Сбрасывает буфер скетчей при остановке воркера"""
+    if unique_visitors._backend is None:
+        return
+    try:
+        unique_visitors.flush()
+    except Exception:
+        logger.exception('Ошибка сброса скетчей уникальных посетителей при завершении процесса')
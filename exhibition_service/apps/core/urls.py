@@ -5,4 +5,7 @@ app_name = 'core'
 
 urlpatterns = [
     path('', views.index, name='index'),
-]
\ No newline at end of file
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    path('map/clusters/', views.map_clusters, name='map_clusters'),
+    path('media/thumb/<int:width>x<int:height>/<path:path>', views.thumbnail, name='thumbnail'),
+]
@@ -0,0 +1,106 @@
+# exhibition_service/apps/core/user_agents.py
+"""
+Определение устройства, браузера и ОС по строке User-Agent.
+
+Разбор регулярными выражениями относительно дорогой, а распределение
+строк User-Agent сильно скошено (несколько версий браузеров дают
+большую часть трафика), поэтому результаты кэшируются в LRU по сырой строке.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+
+
+UserAgentInfo = namedtuple('UserAgentInfo', ['device_type', 'browser', 'os'])
+
+UNKNOWN = UserAgentInfo('', '', '')
+
+DEVICE_BOT = 'bot'
+DEVICE_MOBILE = 'mobile'
+DEVICE_TABLET = 'tablet'
+DEVICE_DESKTOP = 'desktop'
+
+BOT_RE = re.compile(r'bot|crawler|spider|slurp|curl|wget|python-requests|httpclient|headless', re.I)
+TABLET_RE = re.compile(r'ipad|tablet|playbook|silk|kindle|(android(?!.*mobile))', re.I)
+MOBILE_RE = re.compile(r'mobi|iphone|ipod|android.*mobile|windows phone|opera mini|blackberry', re.I)
+
+# Порядок важен: Edge и Opera содержат "Chrome", Chrome содержит "Safari"
+BROWSER_PATTERNS = [
+    ('YaBrowser', re.compile(r'YaBrowser/(\d+)')),
+    ('Edge', re.compile(r'Edg(?:e|A|iOS)?/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+).*Safari/')),
+    ('Internet Explorer', re.compile(r'(?:MSIE |Trident/.*rv:)(\d+)')),
+]
+
+OS_PATTERNS = [
+    ('Windows', re.compile(r'Windows NT (\d+\.\d+)')),
+    ('iOS', re.compile(r'(?:iPhone|iPad|iPod).*? OS (\d+)')),
+    ('Android', re.compile(r'Android (\d+)')),
+    ('macOS', re.compile(r'Mac OS X (\d+[._]\d+)')),
+    ('Chrome OS', re.compile(r'CrOS')),
+    ('Linux', re.compile(r'Linux')),
+]
+
+WINDOWS_VERSIONS = {'10.0': '10', '6.3': '8.1', '6.2': '8', '6.1': '7'}
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def _match(patterns, user_agent):
+    for name, pattern in patterns:
+        match = pattern.search(user_agent)
+        if match:
+            version = match.group(1) if match.groups() else ''
+            return name, version
+    return '', ''
+
+
+def parse_user_agent_uncached(user_agent):
+    """Разбирает строку User-Agent без кэша"""
+    if not user_agent:
+        return UNKNOWN
+
+    if BOT_RE.search(user_agent):
+        device_type = DEVICE_BOT
+    elif TABLET_RE.search(user_agent):
+        device_type = DEVICE_TABLET
+    elif MOBILE_RE.search(user_agent):
+        device_type = DEVICE_MOBILE
+    else:
+        device_type = DEVICE_DESKTOP
+
+    browser, browser_version = _match(BROWSER_PATTERNS, user_agent)
+    os_name, os_version = _match(OS_PATTERNS, user_agent)
+    if os_name == 'Windows':
+        os_version = WINDOWS_VERSIONS.get(os_version, os_version)
+    elif os_name == 'macOS':
+        os_version = os_version.replace('_', '.')
+
+    return UserAgentInfo(
+        device_type=device_type,
+        browser=f'{browser} {browser_version}'.strip()[:50],
+        os=f'{os_name} {os_version}'.strip()[:50],
+    )
+
+
+parse_user_agent = lru_cache(
+    maxsize=getattr(settings, 'USER_AGENT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+)(parse_user_agent_uncached)
+parse_user_agent.__doc__ = 'Разбирает строку User-Agent с LRU-кэшем по сырой строке'
+
+
+def apply_user_agent(instance):
+    """Заполняет device_type, browser и os события, если они пустые"""
+    if instance.device_type or not instance.user_agent:
+        return instance
+    info = parse_user_agent(instance.user_agent)
+    instance.device_type = info.device_type
+    instance.browser = info.browser
+    instance.os = info.os
+    return instance
@@ -0,0 +1,220 @@
+# exhibition_service/apps/core/view_counters.py
+"""
+Буфер счетчиков просмотров с отложенной записью.
+
+Вместо UPDATE на каждый просмотр инкременты копятся в памяти процесса
+(backend "memory") или в Redis (backend "cache") и периодически
+сбрасываются в БД атомарными UPDATE ... SET views_count = views_count + n.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .redis_utils import get_redis_client
+from .trending import trending
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'memory',
+    'CACHE_ALIAS': 'default',
+    'FLUSH_INTERVAL': 10,
+    'MAX_BUFFER_SIZE': 1000,
+}
+
+
+def get_buffer_settings():
+    """Настройки буфера с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'VIEW_COUNTER_BUFFER', {})}
+
+
+def make_key(model_label, pk, field):
+    return f'{model_label}:{pk}:{field}'
+
+
+def parse_key(key):
+    model_label, pk, field = key.rsplit(':', 2)
+    return model_label, int(pk), field
+
+
+class MemoryBackend:
+    """Буфер в памяти процесса (отдельный для каждого воркера)"""
+
+    def __init__(self, options):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, key, amount):
+        """Добавляет инкремент и возвращает текущий размер буфера"""
+        with self._lock:
+            self._counts[key] += amount
+            return len(self._counts)
+
+    def drain(self):
+        """Забирает накопленные инкременты, очищая буфер"""
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(int)
+        return dict(counts)
+
+    def size(self):
+        return len(self._counts)
+
+
+class CacheBackend:
+    """Общий для всех воркеров буфер в Redis (hash с HINCRBY)"""
+
+    hash_key = 'view_counter_buffer'
+
+    def __init__(self, options):
+        self.client = get_redis_client(options['CACHE_ALIAS'])
+        if self.client is None:
+            raise RuntimeError(
+                'VIEW_COUNTER_BUFFER: backend "cache" требует кэш на базе Redis'
+            )
+
+    def add(self, key, amount):
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.hash_key, key, amount)
+        pipe.hlen(self.hash_key)
+        return pipe.execute()[1]
+
+    def drain(self):
+        # RENAME атомарен: инкременты, пришедшие во время сброса,
+        # попадут в новый hash и не потеряются
+        from redis.exceptions import ResponseError
+
+        flush_key = f'{self.hash_key}:flush:{uuid.uuid4().hex}'
+        try:
+            self.client.rename(self.hash_key, flush_key)
+        except ResponseError as e:
+            if 'no such key' not in str(e).lower():
+                raise
+            return {}  # ключа нет - буфер пуст
+        pipe = self.client.pipeline()
+        pipe.hgetall(flush_key)
+        pipe.delete(flush_key)
+        raw, _ = pipe.execute()
+        return {
+            (key.decode() if isinstance(key, bytes) else key): int(value)
+            for key, value in raw.items()
+        }
+
+    def size(self):
+        return self.client.hlen(self.hash_key)
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'cache': CacheBackend,
+}
+
+
+class ViewCounterBuffer:
+    """Накапливает инкременты счетчиков и сбрасывает их пачками"""
+
+    def __init__(self):
+        self._backend = None
+        self._backend_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    options = get_buffer_settings()
+                    self._backend = BACKENDS[options['BACKEND']](options)
+        return self._backend
+
+    def reset(self):
+        """Пересоздает backend (например, после изменения настроек)"""
+        with self._backend_lock:
+            self._backend = None
+
+    def increment(self, instance, field='views_count', amount=1):
+        """Добавляет инкремент счетчика объекта в буфер"""
+        key = make_key(instance._meta.label, instance.pk, field)
+        size = self.backend.add(key, amount)
+
+        options = get_buffer_settings()
+        interval_passed = time.monotonic() - self._last_flush >= options['FLUSH_INTERVAL']
+        if size >= options['MAX_BUFFER_SIZE'] or interval_passed:
+            self.flush(blocking=False)
+
+    def flush(self, blocking=True):
+        """
+        Сбрасывает буфер в БД. Возвращает количество обновленных объектов.
+        При blocking=False (сброс из запроса) сброс пропускается, если его
+        уже выполняет другой поток, а ошибка записывается в лог и не
+        пробрасывается: просмотр страницы не должен падать из-за сброса
+        """
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            counts = {}
+            try:
+                counts = self.backend.drain()
+                if counts:
+                    self._apply(counts)
+            except Exception:
+                # Возвращаем инкременты в буфер, чтобы не потерять просмотры
+                logger.exception('Не удалось сбросить буфер счетчиков просмотров')
+                try:
+                    for key, amount in counts.items():
+                        self.backend.add(key, amount)
+                except Exception:
+                    logger.exception('Потеряны инкременты счетчиков просмотров: %s', counts)
+                if blocking:
+                    raise
+                return 0
+            return len(counts)
+        finally:
+            self._flush_lock.release()
+
+    def _apply(self, counts):
+        """Записывает инкременты: один UPDATE на группу объектов с одинаковым приростом"""
+        grouped = defaultdict(lambda: defaultdict(list))
+        for key, amount in counts.items():
+            model_label, pk, field = parse_key(key)
+            if amount:
+                grouped[(model_label, field)][amount].append(pk)
+
+        with transaction.atomic():
+            for (model_label, field), by_amount in grouped.items():
+                model = apps.get_model(model_label)
+                for amount, pks in by_amount.items():
+                    # Сортировка ключей - стабильный порядок блокировок строк
+                    model._base_manager.filter(pk__in=sorted(pks)).update(
+                        **{field: F(field) + amount}
+                    )
+                    if field == 'views_count':
+                        trending.bump(model_label, pks, 'view', amount)
+
+    def pending(self):
+        """Количество объектов с несброшенными инкрементами"""
+        return self.backend.size()
+
+
+view_counter_buffer = ViewCounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    """Сбрасывает буфер при остановке воркера"""
+    if view_counter_buffer._backend is None:
+        return
+    try:
+        view_counter_buffer.flush()
+    except Exception:
+        logger.exception('Ошибка сброса буфера счетчиков при завершении процесса')
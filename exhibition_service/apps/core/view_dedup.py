@@ -0,0 +1,171 @@
+# exhibition_service/apps/core/view_dedup.py
+"""
+Дедупликация просмотров в пределах окна сессии.
+
+Повторный просмотр того же объекта тем же посетителем (сессия,
+пользователь или IP + User-Agent) в течение WINDOW секунд не создает
+запись ViewHistory и не увеличивает счетчик просмотров.
+
+Backend "cache" - атомарный cache.add (SET NX EX в Redis), общий для
+всех воркеров. Backend "bloom" - фильтр Блума в памяти процесса из двух
+поколений, которые меняются раз в WINDOW: повтор отсекается не меньше
+WINDOW и не больше 2 * WINDOW секунд; ложные срабатывания
+(доля ERROR_RATE) отбрасывают небольшую часть уникальных просмотров.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'cache',
+    'CACHE_ALIAS': 'default',
+    'WINDOW': 1800,
+    'BLOOM_CAPACITY': 1000000,
+    'BLOOM_ERROR_RATE': 0.001,
+}
+
+
+def get_dedup_settings():
+    """Настройки дедупликации с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'VIEW_DEDUP', {})}
+
+
+def visitor_key(request):
+    """Идентификатор посетителя: пользователь, сессия или IP + User-Agent"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}'
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f's{session.session_key}'
+    from apps.users.models import UserActivity
+
+    raw = f'{UserActivity.get_client_ip(request)}|{request.META.get("HTTP_USER_AGENT", "")}'
+    return 'a' + hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class CacheBackend:
+    """Окно через cache.add: ключ живет WINDOW секунд"""
+
+    def __init__(self, options):
+        self.cache = caches[options['CACHE_ALIAS']]
+        self.window = options['WINDOW']
+
+    def first_seen(self, key):
+        return self.cache.add(f'view_dedup:{key}', 1, timeout=self.window)
+
+    def reset(self):
+        pass
+
+
+class BloomFilter:
+    """Фильтр Блума на bytearray"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Двойное хеширование: h1 + i * h2
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+
+class BloomBackend:
+    """Два поколения фильтра Блума с ротацией раз в WINDOW"""
+
+    def __init__(self, options):
+        self.window = options['WINDOW']
+        self.capacity = options['BLOOM_CAPACITY']
+        self.error_rate = options['BLOOM_ERROR_RATE']
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._previous = BloomFilter(self.capacity, self.error_rate)
+            self._rotated_at = time.monotonic()
+
+    def _rotate(self):
+        if time.monotonic() - self._rotated_at >= self.window:
+            self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._rotated_at = time.monotonic()
+
+    def first_seen(self, key):
+        with self._lock:
+            self._rotate()
+            if key in self._current or key in self._previous:
+                return False
+            self._current.add(key)
+            return True
+
+
+BACKENDS = {
+    'cache': CacheBackend,
+    'bloom': BloomBackend,
+}
+
+
+class ViewDeduplicator:
+    """Отсекает повторные просмотры объекта посетителем в пределах окна"""
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    options = get_dedup_settings()
+                    self._backend = BACKENDS[options['BACKEND']](options)
+        return self._backend
+
+    def reset(self):
+        """Пересоздает backend (например, после изменения настроек)"""
+        with self._lock:
+            self._backend = None
+
+    def first_view(self, request, obj, visitor=None):
+        """True, если это первый просмотр объекта посетителем в текущем окне"""
+        key = f'{visitor or visitor_key(request)}:{obj._meta.label_lower}:{obj.pk}'
+        return self.backend.first_seen(key)
+
+
+view_deduplicator = ViewDeduplicator()
+
+
+def track_view(request, obj):
+    """
+    Учитывает просмотр объекта: счетчик views_count, уникальные посетители и ViewHistory.
+    Повторы в пределах окна отбрасываются. Возвращает True, если просмотр учтен.
+    """
+    from .ingestion import record_view
+    from .unique_visitors import unique_visitors
+
+    visitor = visitor_key(request)
+    if not view_deduplicator.first_view(request, obj, visitor=visitor):
+        return False
+    if hasattr(obj, 'increment_views'):
+        obj.increment_views()
+    unique_visitors.add(obj, visitor)
+    record_view(obj, request)
+    return True
@@ -1,4 +1,15 @@
+import math
+
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .autocomplete import autocomplete as autocomplete_service
+from .map_clusters import map_clusters as map_cluster_registry
+from .thumbnails import CONTENT_TYPES, ThumbnailError, thumbnail_cache
+
+MAX_AUTOCOMPLETE_LIMIT = 20
+
 
 def index(request):
     """Главная страница"""
@@ -7,3 +18,70 @@ def index(request):
     }
     return render(request, 'core/index.html', context)
 
+
+def autocomplete(request):
+    """Подсказки по префиксу: выставки, компании и города"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    limit = max(1, min(limit, MAX_AUTOCOMPLETE_LIMIT))
+    return JsonResponse({
+        'query': query,
+        'results': autocomplete_service.suggest(query, limit) if query else [],
+    })
+
+
+def map_clusters(request):
+    """
+    Кластеры маркеров карты: bbox=min_lon,min_lat,max_lon,max_lat, zoom,
+    types=exhibition,company (по умолчанию все)
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in request.GET['bbox'].split(','))
+        zoom = int(request.GET.get('zoom', 0))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Ожидаются параметры bbox=min_lon,min_lat,max_lon,max_lat и zoom'}, status=400)
+    valid = (
+        all(math.isfinite(value) for value in (min_lon, min_lat, max_lon, max_lat))
+        and -90 <= min_lat <= max_lat <= 90
+        and -180 <= min_lon <= 180 and -180 <= max_lon <= 180
+    )
+    if not valid:
+        # min_lon > max_lon допустим: прямоугольник пересекает 180-й меридиан
+        return JsonResponse({'error': 'bbox вне допустимых координат: широта -90..90, долгота -180..180'}, status=400)
+    kinds = [kind for kind in request.GET.get('types', '').split(',') if kind] or None
+    return JsonResponse({
+        'zoom': zoom,
+        'clusters': map_cluster_registry.clusters(min_lat, min_lon, max_lat, max_lon, zoom, kinds),
+    })
+
+
+def thumbnail(request, width, height, path):
+    """
+    Превью медиафайла path, вписанное в width x height; строится при первом
+    запросе. WebP - если браузер его принимает, иначе JPEG
+    """
+    image_format = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    try:
+        file_path, key = thumbnail_cache.get(path, width, height, image_format)
+        try:
+            content = open(file_path, 'rb')
+        except FileNotFoundError:
+            # Вариант вытеснен между проверкой и чтением
+            file_path, key = thumbnail_cache.get(path, width, height, image_format)
+            content = open(file_path, 'rb')
+    except ThumbnailError as e:
+        raise Http404(str(e))
+
+    etag = f'"{key}"'
+    if request.headers.get('If-None-Match') == etag:
+        content.close()
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(content, content_type=CONTENT_TYPES[image_format])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=86400)
+    patch_vary_headers(response, ('Accept',))
+    return response
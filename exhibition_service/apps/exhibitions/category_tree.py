@@ -0,0 +1,191 @@
+# exhibition_service/apps/exhibitions/category_tree.py
+"""
+Дерево активных категорий в памяти процесса.
+
+Дерево загружается одним запросом и хранится как неизменяемая структура:
+узлы по id, списки детей, хлебные крошки и отображаемые имена посчитаны
+заранее, поэтому навигация по категориям не обращается к БД.
+
+Актуальность проверяется по номеру версии в кэше (не чаще CHECK_INTERVAL
+секунд): сохранение или удаление категории увеличивает версию, и каждый
+воркер перечитывает дерево при следующем обращении. Категории внутри
+неактивной категории в дерево не входят; их отображаемые имена (для
+Category.__str__) хранятся отдельно.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.conf import settings
+
+from apps.core.caching import CacheGeneration
+
+
+DEFAULT_SETTINGS = {
+    'CACHE_ALIAS': 'default',
+    'CHECK_INTERVAL': 1,  # секунды между проверками версии
+}
+
+
+def get_category_tree_settings():
+    """Настройки дерева категорий с учетом значений по умолчанию"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'CATEGORY_TREE', {})}
+
+
+@dataclass(frozen=True)
+class CategoryNode:
+    """Категория в дереве навигации"""
+
+    id: int
+    name: str
+    slug: str
+    parent_id: int
+    depth: int
+    sort_order: int
+    is_featured: bool
+    color: str
+    icon: str
+    display_name: str
+    children: tuple
+    breadcrumbs: tuple
+
+    def __str__(self):
+        return self.display_name
+
+
+def _display_name(row, parent):
+    return f"{parent['name']} → {row['name']}" if parent else row['name']
+
+
+class CategoryTree:
+    """Неизменяемый снимок дерева активных категорий"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        rows = sorted(rows, key=lambda row: (row['depth'], row['sort_order'], row['name']))
+        by_id = {row['id']: row for row in rows}
+        visible = {}
+        for row in rows:
+            # Родитель обрабатывается раньше (depth меньше); потомки скрытой категории скрыты
+            if row['is_active'] and (row['parent_id'] is None or row['parent_id'] in visible):
+                visible[row['id']] = row
+
+        children = {pk: [] for pk in visible}
+        for row in visible.values():
+            if row['parent_id'] is not None:
+                children[row['parent_id']].append(row['id'])
+
+        nodes = {}
+        for pk, row in visible.items():
+            parent = by_id.get(row['parent_id'])
+            ancestors = [int(ancestor) for ancestor in row['path'].split('/')[:-2]]
+            nodes[pk] = CategoryNode(
+                id=pk,
+                name=row['name'],
+                slug=row['slug'],
+                parent_id=row['parent_id'],
+                depth=row['depth'],
+                sort_order=row['sort_order'],
+                is_featured=row['is_featured'],
+                color=row['color'],
+                icon=row['icon'] or '',
+                display_name=_display_name(row, parent),
+                children=tuple(children[pk]),
+                breadcrumbs=tuple(ancestor for ancestor in ancestors if ancestor in visible) + (pk,),
+            )
+        self.nodes = MappingProxyType(nodes)
+        # Имена всех категорий, включая скрытые: (parent_id, name, отображаемое имя)
+        self.names = MappingProxyType({
+            pk: (row['parent_id'], row['name'], _display_name(row, by_id.get(row['parent_id'])))
+            for pk, row in by_id.items()
+        })
+        self.by_slug = MappingProxyType({node.slug: node for node in nodes.values()})
+        self.roots = tuple(nodes[pk] for pk in visible if visible[pk]['parent_id'] is None)
+        self.featured = tuple(node for node in nodes.values() if node.is_featured)
+
+    def __contains__(self, pk):
+        return pk in self.nodes
+
+    def __iter__(self):
+        return iter(self.nodes.values())
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, pk):
+        return self.nodes.get(pk)
+
+    def children(self, pk):
+        node = self.nodes.get(pk)
+        return tuple(self.nodes[child] for child in node.children) if node else ()
+
+    def descendants(self, pk):
+        """Все видимые потомки в порядке обхода в глубину"""
+        result = []
+        stack = list(reversed(self.children(pk)))
+        while stack:
+            node = stack.pop()
+            result.append(node)
+            stack.extend(reversed(self.children(node.id)))
+        return result
+
+    def display_name(self, pk, parent_id, name):
+        """Отображаемое имя, если категория в дереве не отличается от переданной"""
+        entry = self.names.get(pk)
+        if entry is not None and entry[:2] == (parent_id, name):
+            return entry[2]
+        return None
+
+    def breadcrumbs(self, pk):
+        node = self.nodes.get(pk)
+        return tuple(self.nodes[ancestor] for ancestor in node.breadcrumbs) if node else ()
+
+
+class CategoryTreeCache:
+    """Дерево категорий процесса с проверкой версии в кэше"""
+
+    def __init__(self):
+        self._tree = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.version = CacheGeneration('category_tree', get_category_tree_settings()['CACHE_ALIAS'])
+
+    def get(self):
+        """Актуальное дерево; перечитывается из БД только при смене версии"""
+        now = time.monotonic()
+        tree = self._tree
+        if tree is not None and now - self._checked_at < get_category_tree_settings()['CHECK_INTERVAL']:
+            return tree
+
+        version = self.version.current()
+        if tree is not None and tree.version == version:
+            self._checked_at = now
+            return tree
+
+        with self._lock:
+            if self._tree is None or self._tree.version != version:
+                self._tree = self._load(version)
+            self._checked_at = now
+            return self._tree
+
+    def _load(self, version):
+        from .models import Category
+
+        rows = Category.objects.order_by().values(
+            'id', 'name', 'slug', 'parent_id', 'path', 'depth',
+            'sort_order', 'is_active', 'is_featured', 'color', 'icon',
+        )
+        return CategoryTree(list(rows), version)
+
+    def invalidate(self):
+        """Увеличивает версию: все воркеры перечитают дерево"""
+        self.version.bump()
+
+    def reset(self):
+        """Сбрасывает дерево процесса (для тестов)"""
+        with self._lock:
+            self._tree, self._checked_at = None, 0
+
+
+category_tree = CategoryTreeCache()
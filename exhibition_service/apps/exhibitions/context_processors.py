@@ -0,0 +1,9 @@
+# exhibition_service/apps/exhibitions/context_processors.py
+from django.utils.functional import SimpleLazyObject
+
+from .category_tree import category_tree
+
+
+def category_navigation(request):
+    """Дерево категорий для навигации; читается только если используется в шаблоне"""
+    return {'category_tree': SimpleLazyObject(category_tree.get)}
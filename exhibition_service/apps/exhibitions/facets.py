@@ -0,0 +1,189 @@
+# exhibition_service/apps/exhibitions/facets.py
+"""
+Фасетный поиск по опубликованным выставкам.
+
+Одним запросом с GROUP BY по (категория, город, формат, бесплатность,
+месяц начала) строится "куб" - число выставок на каждую комбинацию.
+Комбинаций не больше, чем выставок, поэтому все фасеты для любого
+набора фильтров считаются по кубу в памяти без отдельных COUNT.
+
+Счетчики фасета считаются с учетом всех фильтров, кроме фильтра самого
+фасета (при выбранном городе видно, сколько выставок в других городах).
+
+Куб и счетчики по сигнатуре фильтров кэшируются; любое сохранение или
+удаление выставки или категории начинает новое поколение кэша
+(подключается в models.py).
+"""
+from collections import defaultdict
+
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+from apps.core.caching import CacheGeneration, make_signature
+
+
+FACETS = ('category', 'city', 'format', 'is_free', 'month')
+
+CACHE_TIMEOUT = 60 * 60
+
+facet_cache = CacheGeneration('exhibition_facets')
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _parse_int(value):
+    """Положительное целое или None для некорректного значения"""
+    try:
+        value = int(getattr(value, 'pk', value))
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _parse_month(value):
+    """YYYY-MM или None для некорректного значения"""
+    year, _, month = str(value).strip()[:7].partition('-')
+    if not (len(year) == 4 and year.isdigit() and len(month) == 2 and month.isdigit()):
+        return None
+    if not 1 <= int(month) <= 12:
+        return None
+    return f'{year}-{month}'
+
+
+def _city_key(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+def normalize_filters(filters):
+    """
+    Фильтры в каноническом виде; пустые, неизвестные и некорректные
+    (категория не число, месяц не YYYY-MM) отбрасываются
+    """
+    normalized = {}
+    for name in FACETS:
+        value = filters.get(name)
+        if value is None or value == '':
+            continue
+        if name == 'category':
+            value = _parse_int(value)
+        elif name == 'city':
+            value = _city_key(value)
+        elif name == 'is_free':
+            value = _parse_bool(value)
+        elif name == 'month':
+            value = _parse_month(value)
+        else:
+            value = str(value)
+        if value is not None:
+            normalized[name] = value
+    return normalized
+
+
+def apply_filters(queryset, filters):
+    """Применяет фасетные фильтры к queryset выставок"""
+    filters = normalize_filters(filters)
+    lookups = {}
+    if 'category' in filters:
+        lookups['category_id'] = filters['category']
+    if 'city' in filters:
+        # Написания города, совпадающие после нормализации (как в счетчиках фасета)
+        lookups['city__in'] = {
+            row['city'] for row in get_cube() if _city_key(row['city']) == filters['city']
+        }
+    if 'format' in filters:
+        lookups['format'] = filters['format']
+    if 'is_free' in filters:
+        lookups['is_free'] = filters['is_free']
+    if 'month' in filters:
+        year, _, month = filters['month'].partition('-')
+        lookups['start_date__year'] = int(year)
+        lookups['start_date__month'] = int(month)
+    return queryset.filter(**lookups)
+
+
+def build_cube():
+    """Число опубликованных выставок по комбинациям значений фасетов"""
+    from .models import Exhibition
+
+    rows = (
+        Exhibition.objects.published()
+        .annotate(month=TruncMonth('start_date'))
+        .values('category', 'category__name', 'city', 'format', 'is_free', 'month')
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+    return [
+        {
+            'category': row['category'],
+            'category_name': row['category__name'],
+            'city': row['city'],
+            'format': row['format'],
+            'is_free': row['is_free'],
+            'month': row['month'].strftime('%Y-%m') if row['month'] else '',
+            'total': row['total'],
+        }
+        for row in rows
+    ]
+
+
+def get_cube():
+    return facet_cache.get_or_set(('cube',), build_cube, CACHE_TIMEOUT)
+
+
+def _matches(row, filters, skip=None):
+    for name, value in filters.items():
+        if name == skip:
+            continue
+        current = _city_key(row[name]) if name == 'city' else row[name]
+        if current != value:
+            return False
+    return True
+
+
+def compute_facets(cube, filters):
+    """Счетчики всех фасетов и общее число выставок для нормализованных фильтров"""
+    counts = {name: defaultdict(int) for name in FACETS}
+    labels = {name: {} for name in FACETS}
+    total = 0
+    for row in cube:
+        if _matches(row, filters):
+            total += row['total']
+        for name in FACETS:
+            if _matches(row, filters, skip=name):
+                value = _city_key(row[name]) if name == 'city' else row[name]
+                counts[name][value] += row['total']
+                labels[name].setdefault(value, {
+                    'category': row['category_name'],
+                    'city': str(row['city']).strip(),
+                }.get(name, row[name]))
+
+    facets = {}
+    for name in FACETS:
+        facets[name] = sorted(
+            (
+                {
+                    'value': value,
+                    'label': labels[name][value],
+                    'count': count,
+                    'selected': filters.get(name) == value,
+                }
+                for value, count in counts[name].items()
+            ),
+            key=lambda item: (-item['count'], str(item['label'])),
+        )
+    return {'total': total, 'facets': facets}
+
+
+def facet_counts(filters=None):
+    """Фасеты опубликованных выставок для фильтров (кэшируются по сигнатуре)"""
+    filters = normalize_filters(filters or {})
+    return facet_cache.get_or_set(
+        ('counts', make_signature(filters)),
+        lambda: compute_facets(get_cube(), filters),
+        CACHE_TIMEOUT,
+    )
+
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exhibitions', '0003_exhibitionanalytics_exhibitionregistration_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exhibition',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг "в тренде"'),
+        ),
+        migrations.AddIndex(
+            model_name='exhibition',
+            index=models.Index(fields=['status', '-trending_score'], name='exhibitions_status_3f6e18_idx'),
+        ),
+    ]
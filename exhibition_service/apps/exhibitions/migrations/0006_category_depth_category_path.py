@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:02
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    """Материализованные пути существующих категорий (обход от корней)"""
+    Category = apps.get_model('exhibitions', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path_of(pk, seen=()):
+        if pk not in paths:
+            parent = parents.get(pk)
+            if parent is None or parent in seen:
+                paths[pk] = f'{pk}/'
+            else:
+                paths[pk] = path_of(parent, seen + (pk,)) + f'{pk}/'
+        return paths[pk]
+
+    categories = list(Category.objects.only('pk', 'path', 'depth'))
+    for category in categories:
+        category.path = path_of(category.pk)
+        category.depth = category.path.count('/') - 1
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exhibitions', '0005_exhibition_geo_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:05
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    """Счетчики существующих категорий: прямые и с учетом подкатегорий"""
+    Category = apps.get_model('exhibitions', 'Category')
+    Exhibition = apps.get_model('exhibitions', 'Exhibition')
+    Company = apps.get_model('companies', 'Company')
+    direct = {
+        'exhibitions': Counter(
+            Exhibition.objects.filter(status='published', category__isnull=False)
+            .values_list('category_id', flat=True)
+        ),
+        'companies': Counter(
+            Company.objects.filter(is_active=True, status='active', category__isnull=False)
+            .values_list('category_id', flat=True)
+        ),
+    }
+    categories = list(Category.objects.only('pk', 'path'))
+    totals = {name: Counter() for name in direct}
+    for category in categories:
+        for ancestor in category.path.split('/'):
+            if ancestor:
+                for name, counts in direct.items():
+                    totals[name][int(ancestor)] += counts[category.pk]
+    for category in categories:
+        for name in direct:
+            setattr(category, f'{name}_count', direct[name][category.pk])
+            setattr(category, f'{name}_total', totals[name][category.pk])
+    Category.objects.bulk_update(
+        categories,
+        ['exhibitions_count', 'companies_count', 'exhibitions_total', 'companies_total'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_company_geo_cell'),
+        ('exhibitions', '0006_category_depth_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='companies_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество компаний'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='companies_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Компаний с подкатегориями'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='exhibitions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество выставок'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='exhibitions_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Выставок с подкатегориями'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -2,12 +2,30 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.urls import reverse
-from django.utils.text import slugify
+from django.apps import apps
+from django.db.models import Exists, OuterRef, Value
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import uuid
 
+from apps.core.autocomplete import autocomplete
+from apps.core.counters import counters
+from apps.core.geo import geo_cells, in_bbox, near
+from apps.core.images import image_derivatives
+from apps.core.map_clusters import map_clusters
+from apps.core.metrics import metric_series, metric_totals, record_increment, upsert_increments
+from apps.core.search import ranked_search, search_indexes
+from apps.core.search_cache import cached_search, search_results
+from apps.core.slugs import slugs
+from apps.core.unique_visitors import unique_visitors
+from apps.core.trending import trending
+from apps.core.view_counters import view_counter_buffer
+
+from .category_tree import category_tree
+from .facets import apply_filters, facet_cache, facet_counts
+
 
 class CategoryManager(models.Manager):
     """Менеджер для категорий"""
@@ -18,15 +36,53 @@ class CategoryManager(models.Manager):
     
     def with_exhibitions(self):
         """Категории с выставками"""
-        return self.active().filter(exhibitions__isnull=False).distinct()
+        exhibitions = apps.get_model('exhibitions', 'Exhibition').objects.filter(category=OuterRef('pk'))
+        return self.active().filter(Exists(exhibitions))
     
     def with_companies(self):
         """Категории с компаниями"""
-        return self.active().filter(companies__isnull=False).distinct()
+        companies = apps.get_model('companies', 'Company').objects.filter(category=OuterRef('pk'))
+        return self.active().filter(Exists(companies))
+    
+    def with_live_counts(self, include_descendants=False):
+        """
+        Фактические счетчики опубликованных выставок и активных компаний
+        (live_exhibitions_count, live_companies_count) одним запросом,
+        когда сохраненным счетчикам нельзя доверять
+        """
+        suffix = 'total' if include_descendants else 'count'
+        return self.annotate(
+            live_exhibitions_count=counters.get(f'exhibitions.Category.exhibitions_{suffix}').actual_count_subquery(),
+            live_companies_count=counters.get(f'exhibitions.Category.companies_{suffix}').actual_count_subquery(),
+        )
     
     def featured(self):
         """Рекомендуемые категории"""
         return self.active().filter(is_featured=True)
+    
+    def roots(self):
+        """Категории верхнего уровня"""
+        return self.filter(parent__isnull=True)
+    
+    def tree(self):
+        """Дерево активных категорий из памяти процесса (без запросов к БД)"""
+        return category_tree.get()
+    
+    def subtree(self, category, include_self=True):
+        """Категория и все ее потомки одним запросом по материализованному пути"""
+        queryset = self.filter(subtree_filter(category.path))
+        if not include_self:
+            queryset = queryset.exclude(pk=category.pk)
+        return queryset
+
+
+def subtree_filter(path, field='path'):
+    """
+    Q для узлов поддерева: путь начинается с path. LIKE 'path%' не зависит
+    от правил сортировки БД; в PostgreSQL для db_index-поля Django создает
+    индекс varchar_pattern_ops, и префиксный поиск идет по индексу
+    """
+    return models.Q(**{f'{field}__startswith': path})
 
 
 class Category(models.Model):
@@ -63,6 +119,17 @@ class Category(models.Model):
         verbose_name=_('Родительская категория')
     )
     
+    # Материализованный путь: первичные ключи от корня до категории, "1/5/12/"
+    path = models.CharField(_('Путь в дереве'), max_length=255, blank=True, db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(_('Уровень вложенности'), default=0, editable=False)
+    
+    # Денормализованные счетчики (apps.core.counters): опубликованные выставки
+    # и активные компании в категории и во всем ее поддереве
+    exhibitions_count = models.PositiveIntegerField(_('Количество выставок'), default=0, editable=False)
+    companies_count = models.PositiveIntegerField(_('Количество компаний'), default=0, editable=False)
+    exhibitions_total = models.PositiveIntegerField(_('Выставок с подкатегориями'), default=0, editable=False)
+    companies_total = models.PositiveIntegerField(_('Компаний с подкатегориями'), default=0, editable=False)
+    
     # Цвет для UI
     color = models.CharField(_('Цвет'), max_length=7, default='#6c757d')
     
@@ -92,60 +159,96 @@ class Category(models.Model):
         ]
 
     def __str__(self):
+        if self.parent_id and not Category.parent.is_cached(self):
+            # Имя родителя из дерева категорий, без запроса
+            display_name = category_tree.get().display_name(self.pk, self.parent_id, self.name)
+            if display_name is not None:
+                return display_name
         if self.parent:
             return f"{self.parent.name} → {self.name}"
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Category.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        
         # SEO поля по умолчанию
         if not self.meta_title:
             self.meta_title = self.name[:60]
         if not self.meta_description:
             self.meta_description = (self.short_description or self.description)[:160]
         
-        super().save(*args, **kwargs)
-
-    def get_absolute_url(self):
-        return reverse('exhibitions:category_detail', kwargs={'slug': self.slug})
+        old_path, old_depth = '', 0
+        if self.pk:
+            old_path, old_depth = Category.objects.filter(pk=self.pk).values_list(
+                'path', 'depth'
+            ).first() or ('', 0)
+        parent_path, parent_depth = '', -1
+        if self.parent_id:
+            parent_path, parent_depth = Category.objects.filter(pk=self.parent_id).values_list(
+                'path', 'depth'
+            ).get()
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError('Категорию нельзя вложить в нее саму или в ее подкатегорию')
+        
+        # Автоматическое создание slug (apps.core.slugs)
+        slugs.save(self, super().save, *args, **kwargs)
+        self._move(old_path, old_depth, parent_path, parent_depth)
+
+    def _move(self, old_path, old_depth, parent_path, parent_depth):
+        """Обновляет путь категории и одним UPDATE - пути всех ее потомков"""
+        new_path = f'{parent_path}{self.pk}/'
+        new_depth = parent_depth + 1
+        if new_path == old_path and new_depth == old_depth:
+            return
+        Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        if old_path:
+            Category.objects.filter(subtree_filter(old_path)).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+                depth=models.F('depth') + (new_depth - old_depth),
+            )
+            # Поддерево переехало: итоги старых и новых предков пересчитываются
+            self.reconcile_totals(old_path, new_path)
+        self.path, self.depth = new_path, new_depth
+
+    @staticmethod
+    def reconcile_totals(*paths):
+        """Пересчитывает итоги по поддереву для категорий на путях paths"""
+        pks = {int(pk) for path in paths for pk in path.split('/') if pk}
+        for counter in counters.for_target('exhibitions.Category'):
+            if counter.rollup:
+                counter.reconcile(pks)
 
     @property
-    def exhibitions_count(self):
-        """Количество выставок в категории"""
-        return self.exhibitions.filter(status='published').count()
+    def ancestor_ids(self):
+        """Первичные ключи предков от корня (без самой категории)"""
+        return [int(pk) for pk in self.path.split('/')[:-2]]
 
-    @property
-    def companies_count(self):
-        """Количество компаний в категории"""
-        return self.companies.filter(is_active=True, status='active').count()
+    def get_absolute_url(self):
+        return reverse('exhibitions:category_detail', kwargs={'slug': self.slug})
 
     def get_subcategories(self):
         """Возвращает подкategории"""
         return self.children.filter(is_active=True).order_by('sort_order', 'name')
 
+    def get_descendants(self, include_self=False):
+        """Все потомки категории одним запросом"""
+        return Category.objects.subtree(self, include_self=include_self)
+
+    def get_ancestors(self):
+        """Предки категории от корня одним запросом"""
+        return Category.objects.filter(pk__in=self.ancestor_ids).order_by('depth')
+
     def get_all_children(self):
         """Возвращает все дочерние категории (рекурсивно)"""
-        children = list(self.children.filter(is_active=True))
-        for child in self.children.filter(is_active=True):
-            children.extend(child.get_all_children())
-        return children
+        # Потомки неактивной категории не показываются, как и она сама
+        descendants = list(self.get_descendants().order_by('depth', 'sort_order', 'name'))
+        hidden = {f'/{category.pk}/' for category in descendants if not category.is_active}
+        return [
+            category for category in descendants
+            if category.is_active and not any(marker in f'/{category.path}' for marker in hidden)
+        ]
 
     def get_breadcrumbs(self):
         """Возвращает хлебные крошки"""
-        breadcrumbs = [self]
-        current = self.parent
-        while current:
-            breadcrumbs.insert(0, current)
-            current = current.parent
-        return breadcrumbs
+        return [*self.get_ancestors(), self]
 
 
 class ExhibitionManager(models.Manager):
@@ -172,12 +275,31 @@ class ExhibitionManager(models.Manager):
         """Рекомендуемые выставки"""
         return self.published().filter(is_featured=True)
     
+    def trending(self, limit=10):
+        """Выставки "в тренде" по затухающему рейтингу активности"""
+        return self.published().order_by('-trending_score')[:limit]
+    
     def by_category(self, category):
         """Выставки по категории"""
         return self.published().filter(category=category)
     
-    def search(self, query):
-        """Поиск выставок"""
+    def in_category_tree(self, category):
+        """Выставки категории и всех ее подкатегорий"""
+        return self.published().filter(subtree_filter(category.path, 'category__path'))
+    
+    def search(self, query, request=None, cached=True, record=True, limit=None):
+        """
+        Полнотекстовый поиск выставок по убыванию релевантности.
+        cached - через кэш результатов с записью запроса в аналитику;
+        limit - предел выдачи (по умолчанию SEARCH_MAX_RESULTS, см. search_truncated)
+        """
+        fallback = lambda: self.search_icontains(query)
+        if not cached:
+            return ranked_search(self.published(), query, fallback=fallback, limit=limit)
+        return cached_search(self.published(), query, fallback=fallback, request=request, record=record, limit=limit)
+    
+    def search_icontains(self, query):
+        """Поиск выставок по вхождению подстроки (без полнотекстового индекса)"""
         return self.published().filter(
             models.Q(title__icontains=query) |
             models.Q(description__icontains=query) |
@@ -190,9 +312,25 @@ class ExhibitionManager(models.Manager):
         """Выставки в городе"""
         return self.published().filter(city__icontains=city)
     
+    def near(self, latitude, longitude, km):
+        """Выставки в радиусе km от точки по возрастанию расстояния (distance_km)"""
+        return near(self.published(), latitude, longitude, km)
+    
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Выставки в прямоугольнике карты"""
+        return in_bbox(self.published(), min_lat, min_lon, max_lat, max_lon)
+    
     def by_format(self, format_type):
         """Выставки по формату"""
         return self.published().filter(format=format_type)
+    
+    def faceted(self, **filters):
+        """Опубликованные выставки по фасетным фильтрам (category, city, format, is_free, month)"""
+        return apply_filters(self.published(), filters)
+    
+    def facet_counts(self, **filters):
+        """Счетчики всех фасетов для фильтров (из кэша)"""
+        return facet_counts(filters)
 
 
 class Exhibition(models.Model):
@@ -304,6 +442,7 @@ class Exhibition(models.Model):
     # Координаты
     latitude = models.DecimalField(_('Широта'), max_digits=10, decimal_places=8, null=True, blank=True)
     longitude = models.DecimalField(_('Долгота'), max_digits=11, decimal_places=8, null=True, blank=True)
+    geo_cell = models.CharField(_('Geohash координат'), max_length=12, blank=True, db_index=True, editable=False)
     
     # Онлайн параметры
     online_platform = models.CharField(_('Платформа'), max_length=100, blank=True)
@@ -383,6 +522,7 @@ class Exhibition(models.Model):
     views_count = models.PositiveIntegerField(_('Количество просмотров'), default=0)
     favorites_count = models.PositiveIntegerField(_('Количество добавлений в избранное'), default=0)
     registrations_count = models.PositiveIntegerField(_('Количество регистраций'), default=0)
+    trending_score = models.FloatField(_('Рейтинг "в тренде"'), default=0, editable=False)
     
     # Рейтинг
     rating = models.DecimalField(
@@ -420,6 +560,7 @@ class Exhibition(models.Model):
             models.Index(fields=['start_date', 'end_date']),
             models.Index(fields=['city', 'country']),
             models.Index(fields=['-views_count']),
+            models.Index(fields=['status', '-trending_score']),
             models.Index(fields=['-rating']),
             models.Index(fields=['-created_at']),
         ]
@@ -428,16 +569,6 @@ class Exhibition(models.Model):
         return self.title
 
     def save(self, *args, **kwargs):
-        # Автоматическое создание slug
-        if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-            while Exhibition.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        
         # Устанавливаем дату публикации
         if self.status == self.Status.PUBLISHED and not self.published_at:
             self.published_at = timezone.now()
@@ -446,7 +577,8 @@ class Exhibition(models.Model):
         if self.end_date < timezone.now() and self.status == self.Status.PUBLISHED:
             self.status = self.Status.COMPLETED
         
-        super().save(*args, **kwargs)
+        # Автоматическое создание slug (apps.core.slugs)
+        slugs.save(self, super().save, *args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('exhibitions:detail', kwargs={'slug': self.slug})
@@ -520,14 +652,9 @@ class Exhibition(models.Model):
         return True
 
     def increment_views(self):
-        """Увеличивает счетчик просмотров"""
+        """Увеличивает счетчик просмотров (запись в БД - через буфер)"""
+        view_counter_buffer.increment(self)
         self.views_count += 1
-        self.save(update_fields=['views_count'])
-
-    def increment_registrations(self):
-        """Увеличивает счетчик регистраций"""
-        self.registrations_count += 1
-        self.save(update_fields=['registrations_count'])
 
     def update_rating(self):
         """Обновляет рейтинг на основе отзывов"""
@@ -641,9 +768,7 @@ class ExhibitionTag(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        slugs.save(self, super().save, *args, **kwargs)
 
     @property
     def exhibitions_count(self):
@@ -743,619 +868,725 @@ class ExhibitionDocument(models.Model):
         return f"{self.file_size:.1f} ГБ"
 
 
-    class FavoriteExhibition(models.Model):
-        """Избранные выставки пользователей"""
-        
-        user = models.ForeignKey(
-            settings.AUTH_USER_MODEL,
-            on_delete=models.CASCADE,
-            related_name='favorite_exhibitions',
-            verbose_name=_('Пользователь')
-        )
-        exhibition = models.ForeignKey(
-            Exhibition,
-            on_delete=models.CASCADE,
-            related_name='favorited_by',
-            verbose_name=_('Выставка')
-        )
-        created_at = models.DateTimeField(_('Дата добавления'), auto_now_add=True)
-        
-        # Заметки пользователя
-        notes = models.TextField(_('Заметки'), blank=True)
-        
-        # Напоминания
-        reminder_date = models.DateTimeField(_('Дата напоминания'), null=True, blank=True)
-        is_reminded = models.BooleanField(_('Напоминание отправлено'), default=False)
+class FavoriteExhibition(models.Model):
+    """Избранные выставки пользователей"""
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='favorite_exhibitions',
+        verbose_name=_('Пользователь')
+    )
+    exhibition = models.ForeignKey(
+        Exhibition,
+        on_delete=models.CASCADE,
+        related_name='favorited_by',
+        verbose_name=_('Выставка')
+    )
+    created_at = models.DateTimeField(_('Дата добавления'), auto_now_add=True)
+    
+    # Заметки пользователя
+    notes = models.TextField(_('Заметки'), blank=True)
+    
+    # Напоминания
+    reminder_date = models.DateTimeField(_('Дата напоминания'), null=True, blank=True)
+    is_reminded = models.BooleanField(_('Напоминание отправлено'), default=False)
 
-        class Meta:
-            verbose_name = _('Избранная выставка')
-            verbose_name_plural = _('Избранные выставки')
-            db_table = 'favorite_exhibitions'
-            unique_together = ('user', 'exhibition')
-            ordering = ['-created_at']
+    class Meta:
+        verbose_name = _('Избранная выставка')
+        verbose_name_plural = _('Избранные выставки')
+        db_table = 'favorite_exhibitions'
+        unique_together = ('user', 'exhibition')
+        ordering = ['-created_at']
 
-        def __str__(self):
-            return f"{self.user.email} - {self.exhibition.title}"
+    def __str__(self):
+        return f"{self.user.email} - {self.exhibition.title}"
 
 
-    class ExhibitionRegistration(models.Model):
-        """Регистрация на выставку"""
-        
-        class RegistrationType(models.TextChoices):
-            VISITOR = 'visitor', _('Посетитель')
-            EXHIBITOR = 'exhibitor', _('Экспонент')
-            SPEAKER = 'speaker', _('Спикер')
-            PRESS = 'press', _('Пресса')
-            VIP = 'vip', _('VIP')
-        
-        class Status(models.TextChoices):
-            PENDING = 'pending', _('Ожидает подтверждения')
-            CONFIRMED = 'confirmed', _('Подтвержден')
-            CANCELLED = 'cancelled', _('Отменен')
-            ATTENDED = 'attended', _('Посетил')
-            NO_SHOW = 'no_show', _('Не явился')
-        
-        exhibition = models.ForeignKey(
-            Exhibition,
-            on_delete=models.CASCADE,
-            related_name='registrations',
-            verbose_name=_('Выставка')
-        )
-        user = models.ForeignKey(
-            settings.AUTH_USER_MODEL,
-            on_delete=models.CASCADE,
-            related_name='exhibition_registrations',
-            verbose_name=_('Пользователь'),
-            null=True,
-            blank=True
-        )
-        
-        # Информация о регистрации (для незарегистрированных пользователей)
-        first_name = models.CharField(_('Имя'), max_length=100)
-        last_name = models.CharField(_('Фамилия'), max_length=100)
-        email = models.EmailField(_('Email'))
-        phone = models.CharField(_('Телефон'), max_length=20, blank=True)
-        company_name = models.CharField(_('Компания'), max_length=200, blank=True)
-        position = models.CharField(_('Должность'), max_length=100, blank=True)
-        
-        # Тип регистрации
-        registration_type = models.CharField(
-            _('Тип регистрации'),
-            max_length=20,
-            choices=RegistrationType.choices,
-            default=RegistrationType.VISITOR
-        )
-        
-        # Статус
-        status = models.CharField(
-            _('Статус'),
-            max_length=20,
-            choices=Status.choices,
-            default=Status.PENDING
-        )
-        
-        # Дополнительная информация
-        interests = models.TextField(_('Интересы/Цели посещения'), blank=True)
-        dietary_requirements = models.CharField(_('Диетические требования'), max_length=200, blank=True)
-        accessibility_needs = models.CharField(_('Потребности в доступности'), max_length=200, blank=True)
-        
-        # QR код для входа
-        qr_code = models.CharField(_('QR код'), max_length=100, unique=True, blank=True)
-        
-        # Подтверждение и посещение
-        confirmed_at = models.DateTimeField(_('Дата подтверждения'), null=True, blank=True)
-        attended_at = models.DateTimeField(_('Дата посещения'), null=True, blank=True)
-        check_in_notes = models.TextField(_('Заметки при регистрации'), blank=True)
-        
-        # Метаданные
-        ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
-        user_agent = models.TextField(_('User Agent'), blank=True)
-        source = models.CharField(_('Источник регистрации'), max_length=100, blank=True)
-        
-        created_at = models.DateTimeField(_('Дата регистрации'), auto_now_add=True)
-        updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
-
-        class Meta:
-            verbose_name = _('Регистрация на выставку')
-            verbose_name_plural = _('Регистрации на выставки')
-            db_table = 'exhibition_registrations'
-            unique_together = ('exhibition', 'email')
-            ordering = ['-created_at']
-            indexes = [
-                models.Index(fields=['exhibition', 'status']),
-                models.Index(fields=['user']),
-                models.Index(fields=['email']),
-                models.Index(fields=['qr_code']),
-                models.Index(fields=['-created_at']),
-            ]
-
-        def __str__(self):
-            return f"Регистрация {self.get_full_name()} на {self.exhibition.title}"
-
-        def save(self, *args, **kwargs):
-            # Заполняем информацию из профиля пользователя
-            if self.user and not self.first_name:
-                self.first_name = self.user.first_name or self.user.email.split('@')[0]
-                self.last_name = self.user.last_name
-                self.email = self.user.email
-                if hasattr(self.user, 'phone'):
-                    self.phone = self.user.phone
-                if hasattr(self.user, 'company_name'):
-                    self.company_name = self.user.company_name
-                if hasattr(self.user, 'position'):
-                    self.position = self.user.position
-            
-            # Генерируем QR код
-            if not self.qr_code:
-                import uuid
-                self.qr_code = str(uuid.uuid4())
-            
-            # Устанавливаем дату подтверждения
-            if self.status == self.Status.CONFIRMED and not self.confirmed_at:
-                self.confirmed_at = timezone.now()
-            
-            super().save(*args, **kwargs)
-            
-            # Увеличиваем счетчик регистраций
-            if self._state.adding:  # Только при создании
-                self.exhibition.increment_registrations()
+class ExhibitionRegistration(models.Model):
+    """Регистрация на выставку"""
+    
+    class RegistrationType(models.TextChoices):
+        VISITOR = 'visitor', _('Посетитель')
+        EXHIBITOR = 'exhibitor', _('Экспонент')
+        SPEAKER = 'speaker', _('Спикер')
+        PRESS = 'press', _('Пресса')
+        VIP = 'vip', _('VIP')
+    
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Ожидает подтверждения')
+        CONFIRMED = 'confirmed', _('Подтвержден')
+        CANCELLED = 'cancelled', _('Отменен')
+        ATTENDED = 'attended', _('Посетил')
+        NO_SHOW = 'no_show', _('Не явился')
+    
+    exhibition = models.ForeignKey(
+        Exhibition,
+        on_delete=models.CASCADE,
+        related_name='registrations',
+        verbose_name=_('Выставка')
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='exhibition_registrations',
+        verbose_name=_('Пользователь'),
+        null=True,
+        blank=True
+    )
+    
+    # Информация о регистрации (для незарегистрированных пользователей)
+    first_name = models.CharField(_('Имя'), max_length=100)
+    last_name = models.CharField(_('Фамилия'), max_length=100)
+    email = models.EmailField(_('Email'))
+    phone = models.CharField(_('Телефон'), max_length=20, blank=True)
+    company_name = models.CharField(_('Компания'), max_length=200, blank=True)
+    position = models.CharField(_('Должность'), max_length=100, blank=True)
+    
+    # Тип регистрации
+    registration_type = models.CharField(
+        _('Тип регистрации'),
+        max_length=20,
+        choices=RegistrationType.choices,
+        default=RegistrationType.VISITOR
+    )
+    
+    # Статус
+    status = models.CharField(
+        _('Статус'),
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    
+    # Дополнительная информация
+    interests = models.TextField(_('Интересы/Цели посещения'), blank=True)
+    dietary_requirements = models.CharField(_('Диетические требования'), max_length=200, blank=True)
+    accessibility_needs = models.CharField(_('Потребности в доступности'), max_length=200, blank=True)
+    
+    # QR код для входа
+    qr_code = models.CharField(_('QR код'), max_length=100, unique=True, blank=True)
+    
+    # Подтверждение и посещение
+    confirmed_at = models.DateTimeField(_('Дата подтверждения'), null=True, blank=True)
+    attended_at = models.DateTimeField(_('Дата посещения'), null=True, blank=True)
+    check_in_notes = models.TextField(_('Заметки при регистрации'), blank=True)
+    
+    # Метаданные
+    ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
+    user_agent = models.TextField(_('User Agent'), blank=True)
+    source = models.CharField(_('Источник регистрации'), max_length=100, blank=True)
+    
+    created_at = models.DateTimeField(_('Дата регистрации'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
 
-        def get_full_name(self):
-            """Полное имя"""
-            return f"{self.first_name} {self.last_name}".strip()
+    class Meta:
+        verbose_name = _('Регистрация на выставку')
+        verbose_name_plural = _('Регистрации на выставки')
+        db_table = 'exhibition_registrations'
+        unique_together = ('exhibition', 'email')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['exhibition', 'status']),
+            models.Index(fields=['user']),
+            models.Index(fields=['email']),
+            models.Index(fields=['qr_code']),
+            models.Index(fields=['-created_at']),
+        ]
 
-        def confirm_registration(self):
-            """Подтверждает регистрацию"""
-            self.status = self.Status.CONFIRMED
+    def __str__(self):
+        return f"Регистрация {self.get_full_name()} на {self.exhibition.title}"
+
+    def save(self, *args, **kwargs):
+        # Заполняем информацию из профиля пользователя
+        if self.user and not self.first_name:
+            self.first_name = self.user.first_name or self.user.email.split('@')[0]
+            self.last_name = self.user.last_name
+            self.email = self.user.email
+            if hasattr(self.user, 'phone'):
+                self.phone = self.user.phone
+            if hasattr(self.user, 'company_name'):
+                self.company_name = self.user.company_name
+            if hasattr(self.user, 'position'):
+                self.position = self.user.position
+        
+        # Генерируем QR код
+        if not self.qr_code:
+            import uuid
+            self.qr_code = str(uuid.uuid4())
+        
+        # Устанавливаем дату подтверждения
+        if self.status == self.Status.CONFIRMED and not self.confirmed_at:
             self.confirmed_at = timezone.now()
-            self.save()
-
-        def mark_attended(self, notes=''):
-            """Отмечает посещение"""
-            self.status = self.Status.ATTENDED
-            self.attended_at = timezone.now()
-            self.check_in_notes = notes
-            self.save()
-
-        def generate_ticket_pdf(self):
-            """Генерирует PDF билет (заглушка)"""
-            # Здесь можно реализовать генерацию PDF с QR кодом
-            pass
+        
+        # Счетчик регистраций выставки обновляется через apps.core.counters
+        super().save(*args, **kwargs)
 
+    def get_full_name(self):
+        """Полное имя"""
+        return f"{self.first_name} {self.last_name}".strip()
 
-    class ExhibitionSchedule(models.Model):
-        """Расписание мероприятий выставки"""
-        
-        class EventType(models.TextChoices):
-            OPENING = 'opening', _('Торжественное открытие')
-            PRESENTATION = 'presentation', _('Презентация')
-            SEMINAR = 'seminar', _('Семинар')
-            WORKSHOP = 'workshop', _('Мастер-класс')
-            PANEL = 'panel', _('Панельная дискуссия')
-            NETWORKING = 'networking', _('Нетворкинг')
-            BREAK = 'break', _('Перерыв')
-            LUNCH = 'lunch', _('Обед')
-            CLOSING = 'closing', _('Закрытие')
-            OTHER = 'other', _('Другое')
-        
-        exhibition = models.ForeignKey(
-            Exhibition,
-            on_delete=models.CASCADE,
-            related_name='schedule',
-            verbose_name=_('Выставка')
-        )
-        
-        title = models.CharField(_('Название мероприятия'), max_length=200)
-        description = models.TextField(_('Описание'), blank=True)
-        event_type = models.CharField(
-            _('Тип мероприятия'),
-            max_length=20,
-            choices=EventType.choices,
-            default=EventType.OTHER
-        )
-        
-        # Время
-        start_time = models.DateTimeField(_('Время начала'))
-        end_time = models.DateTimeField(_('Время окончания'))
-        
-        # Место
-        location = models.CharField(_('Место проведения'), max_length=200, blank=True)
-        room = models.CharField(_('Зал/Комната'), max_length=100, blank=True)
-        
-        # Спикеры
-        speakers = models.ManyToManyField(
-            'ExhibitionSpeaker',
-            blank=True,
-            related_name='schedule_events',
-            verbose_name=_('Спикеры')
-        )
-        
-        # Дополнительная информация
-        max_attendees = models.PositiveIntegerField(_('Максимум участников'), null=True, blank=True)
-        registration_required = models.BooleanField(_('Требуется регистрация'), default=False)
-        is_featured = models.BooleanField(_('Рекомендуемое'), default=False)
-        
-        # Онлайн параметры
-        online_link = models.URLField(_('Ссылка на онлайн-трансляцию'), blank=True)
-        
-        created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
-        updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+    def confirm_registration(self):
+        """Подтверждает регистрацию"""
+        self.status = self.Status.CONFIRMED
+        self.confirmed_at = timezone.now()
+        self.save()
 
-        class Meta:
-            verbose_name = _('Событие расписания')
-            verbose_name_plural = _('Расписание выставки')
-            db_table = 'exhibition_schedule'
-            ordering = ['start_time']
+    def mark_attended(self, notes=''):
+        """Отмечает посещение"""
+        self.status = self.Status.ATTENDED
+        self.attended_at = timezone.now()
+        self.check_in_notes = notes
+        self.save()
 
-        def __str__(self):
-            return f"{self.exhibition.title} - {self.title}"
+    def generate_ticket_pdf(self):
+        """Генерирует PDF билет (заглушка)"""
+        # Здесь можно реализовать генерацию PDF с QR кодом
+        pass
 
-        @property
-        def duration_minutes(self):
-            """Продолжительность в минутах"""
-            return int((self.end_time - self.start_time).total_seconds() / 60)
 
-        @property
-        def is_current(self):
-            """Проходит ли мероприятие сейчас"""
-            now = timezone.now()
-            return self.start_time <= now <= self.end_time
+class ExhibitionSchedule(models.Model):
+    """Расписание мероприятий выставки"""
+    
+    class EventType(models.TextChoices):
+        OPENING = 'opening', _('Торжественное открытие')
+        PRESENTATION = 'presentation', _('Презентация')
+        SEMINAR = 'seminar', _('Семинар')
+        WORKSHOP = 'workshop', _('Мастер-класс')
+        PANEL = 'panel', _('Панельная дискуссия')
+        NETWORKING = 'networking', _('Нетворкинг')
+        BREAK = 'break', _('Перерыв')
+        LUNCH = 'lunch', _('Обед')
+        CLOSING = 'closing', _('Закрытие')
+        OTHER = 'other', _('Другое')
+    
+    exhibition = models.ForeignKey(
+        Exhibition,
+        on_delete=models.CASCADE,
+        related_name='schedule',
+        verbose_name=_('Выставка')
+    )
+    
+    title = models.CharField(_('Название мероприятия'), max_length=200)
+    description = models.TextField(_('Описание'), blank=True)
+    event_type = models.CharField(
+        _('Тип мероприятия'),
+        max_length=20,
+        choices=EventType.choices,
+        default=EventType.OTHER
+    )
+    
+    # Время
+    start_time = models.DateTimeField(_('Время начала'))
+    end_time = models.DateTimeField(_('Время окончания'))
+    
+    # Место
+    location = models.CharField(_('Место проведения'), max_length=200, blank=True)
+    room = models.CharField(_('Зал/Комната'), max_length=100, blank=True)
+    
+    # Спикеры
+    speakers = models.ManyToManyField(
+        'ExhibitionSpeaker',
+        blank=True,
+        related_name='schedule_events',
+        verbose_name=_('Спикеры')
+    )
+    
+    # Дополнительная информация
+    max_attendees = models.PositiveIntegerField(_('Максимум участников'), null=True, blank=True)
+    registration_required = models.BooleanField(_('Требуется регистрация'), default=False)
+    is_featured = models.BooleanField(_('Рекомендуемое'), default=False)
+    
+    # Онлайн параметры
+    online_link = models.URLField(_('Ссылка на онлайн-трансляцию'), blank=True)
+    
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
 
-        @property
-        def is_upcoming(self):
-            """Предстоящее ли мероприятие"""
-            return timezone.now() < self.start_time
+    class Meta:
+        verbose_name = _('Событие расписания')
+        verbose_name_plural = _('Расписание выставки')
+        db_table = 'exhibition_schedule'
+        ordering = ['start_time']
 
+    def __str__(self):
+        return f"{self.exhibition.title} - {self.title}"
 
-    class ExhibitionSpeaker(models.Model):
-        """Спикеры выставки"""
-        
-        exhibition = models.ForeignKey(
-            Exhibition,
-            on_delete=models.CASCADE,
-            related_name='speakers',
-            verbose_name=_('Выставка')
-        )
-        
-        # Личная информация
-        first_name = models.CharField(_('Имя'), max_length=100)
-        last_name = models.CharField(_('Фамилия'), max_length=100)
-        title = models.CharField(_('Звание/Степень'), max_length=100, blank=True)
-        bio = models.TextField(_('Биография'))
-        
-        # Профессиональная информация
-        company = models.CharField(_('Компания'), max_length=200, blank=True)
-        position = models.CharField(_('Должность'), max_length=200, blank=True)
-        
-        # Контакты
-        email = models.EmailField(_('Email'), blank=True)
-        phone = models.CharField(_('Телефон'), max_length=20, blank=True)
-        website = models.URLField(_('Веб-сайт'), blank=True)
-        
-        # Медиа
-        photo = models.ImageField(
-            _('Фотография'),
-            upload_to='speakers/',
-            blank=True,
-            null=True,
-            help_text=_('Рекомендуемый размер: 300x300 пикселей')
-        )
-        
-        # Социальные сети
-        linkedin_url = models.URLField(_('LinkedIn'), blank=True)
-        twitter_url = models.URLField(_('Twitter'), blank=True)
-        
-        # Настройки
-        is_keynote = models.BooleanField(_('Ключевой спикер'), default=False)
-        is_featured = models.BooleanField(_('Рекомендуемый'), default=False)
-        sort_order = models.PositiveIntegerField(_('Порядок'), default=0)
-        
-        created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
-        updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
-
-        class Meta:
-            verbose_name = _('Спикер выставки')
-            verbose_name_plural = _('Спикеры выставки')
-            db_table = 'exhibition_speakers'
-            ordering = ['sort_order', 'last_name', 'first_name']
-
-        def __str__(self):
-            return f"{self.get_full_name()} - {self.exhibition.title}"
-
-        def get_full_name(self):
-            """Полное имя"""
-            name_parts = []
-            if self.title:
-                name_parts.append(self.title)
-            name_parts.extend([self.first_name, self.last_name])
-            return ' '.join(name_parts)
-
-        def get_short_bio(self, max_length=200):
-            """Краткая биография"""
-            if len(self.bio) <= max_length:
-                return self.bio
-            return self.bio[:max_length].rsplit(' ', 1)[0] + '...'
-
-
-    class ExhibitionSponsor(models.Model):
-        """Спонсоры выставки"""
-        
-        class SponsorType(models.TextChoices):
-            TITLE = 'title', _('Титульный спонсор')
-            GENERAL = 'general', _('Генеральный спонсор')
-            OFFICIAL = 'official', _('Официальный спонсор')
-            PARTNER = 'partner', _('Партнер')
-            MEDIA = 'media', _('Медиа-партнер')
-            TECH = 'tech', _('Технический партнер')
-            SUPPORTER = 'supporter', _('Поддерживающий партнер')
-        
-        exhibition = models.ForeignKey(
-            Exhibition,
-            on_delete=models.CASCADE,
-            related_name='sponsors',
-            verbose_name=_('Выставка')
+    @property
+    def duration_minutes(self):
+        """Продолжительность в минутах"""
+        return int((self.end_time - self.start_time).total_seconds() / 60)
+
+    @property
+    def is_current(self):
+        """Проходит ли мероприятие сейчас"""
+        now = timezone.now()
+        return self.start_time <= now <= self.end_time
+
+    @property
+    def is_upcoming(self):
+        """Предстоящее ли мероприятие"""
+        return timezone.now() < self.start_time
+
+
+class ExhibitionSpeaker(models.Model):
+    """Спикеры выставки"""
+    
+    exhibition = models.ForeignKey(
+        Exhibition,
+        on_delete=models.CASCADE,
+        related_name='speakers',
+        verbose_name=_('Выставка')
+    )
+    
+    # Личная информация
+    first_name = models.CharField(_('Имя'), max_length=100)
+    last_name = models.CharField(_('Фамилия'), max_length=100)
+    title = models.CharField(_('Звание/Степень'), max_length=100, blank=True)
+    bio = models.TextField(_('Биография'))
+    
+    # Профессиональная информация
+    company = models.CharField(_('Компания'), max_length=200, blank=True)
+    position = models.CharField(_('Должность'), max_length=200, blank=True)
+    
+    # Контакты
+    email = models.EmailField(_('Email'), blank=True)
+    phone = models.CharField(_('Телефон'), max_length=20, blank=True)
+    website = models.URLField(_('Веб-сайт'), blank=True)
+    
+    # Медиа
+    photo = models.ImageField(
+        _('Фотография'),
+        upload_to='speakers/',
+        blank=True,
+        null=True,
+        help_text=_('Рекомендуемый размер: 300x300 пикселей')
+    )
+    
+    # Социальные сети
+    linkedin_url = models.URLField(_('LinkedIn'), blank=True)
+    twitter_url = models.URLField(_('Twitter'), blank=True)
+    
+    # Настройки
+    is_keynote = models.BooleanField(_('Ключевой спикер'), default=False)
+    is_featured = models.BooleanField(_('Рекомендуемый'), default=False)
+    sort_order = models.PositiveIntegerField(_('Порядок'), default=0)
+    
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Спикер выставки')
+        verbose_name_plural = _('Спикеры выставки')
+        db_table = 'exhibition_speakers'
+        ordering = ['sort_order', 'last_name', 'first_name']
+
+    def __str__(self):
+        return f"{self.get_full_name()} - {self.exhibition.title}"
+
+    def get_full_name(self):
+        """Полное имя"""
+        name_parts = []
+        if self.title:
+            name_parts.append(self.title)
+        name_parts.extend([self.first_name, self.last_name])
+        return ' '.join(name_parts)
+
+    def get_short_bio(self, max_length=200):
+        """Краткая биография"""
+        if len(self.bio) <= max_length:
+            return self.bio
+        return self.bio[:max_length].rsplit(' ', 1)[0] + '...'
+
+
+class ExhibitionSponsor(models.Model):
+    """Спонсоры выставки"""
+    
+    class SponsorType(models.TextChoices):
+        TITLE = 'title', _('Титульный спонсор')
+        GENERAL = 'general', _('Генеральный спонсор')
+        OFFICIAL = 'official', _('Официальный спонсор')
+        PARTNER = 'partner', _('Партнер')
+        MEDIA = 'media', _('Медиа-партнер')
+        TECH = 'tech', _('Технический партнер')
+        SUPPORTER = 'supporter', _('Поддерживающий партнер')
+    
+    exhibition = models.ForeignKey(
+        Exhibition,
+        on_delete=models.CASCADE,
+        related_name='sponsors',
+        verbose_name=_('Выставка')
+    )
+    
+    # Основная информация
+    name = models.CharField(_('Название'), max_length=200)
+    description = models.TextField(_('Описание'), blank=True)
+    sponsor_type = models.CharField(
+        _('Тип спонсорства'),
+        max_length=20,
+        choices=SponsorType.choices,
+        default=SponsorType.PARTNER
+    )
+    
+    # Медиа
+    logo = models.ImageField(
+        _('Логотип'),
+        upload_to='sponsors/',
+        help_text=_('Рекомендуемый размер: 300x150 пикселей')
+    )
+    
+    # Контакты
+    website = models.URLField(_('Веб-сайт'), blank=True)
+    contact_email = models.EmailField(_('Контактный email'), blank=True)
+    
+    # Настройки отображения
+    sort_order = models.PositiveIntegerField(_('Порядок'), default=0)
+    is_featured = models.BooleanField(_('Показывать на главной'), default=True)
+    
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Спонсор выставки')
+        verbose_name_plural = _('Спонсоры выставки')
+        db_table = 'exhibition_sponsors'
+        ordering = ['sort_order', 'name']
+
+    def __str__(self):
+        return f"{self.name} - {self.exhibition.title}"
+
+
+class ExhibitionAnalytics(models.Model):
+    """Аналитика по выставкам"""
+    
+    class MetricType(models.TextChoices):
+        VIEWS = 'views', _('Просмотры')
+        REGISTRATIONS = 'registrations', _('Регистрации')
+        FAVORITES = 'favorites', _('Добавления в избранное')
+        DOCUMENT_DOWNLOADS = 'document_downloads', _('Скачивания документов')
+        WEBSITE_CLICKS = 'website_clicks', _('Клики на сайт')
+        CONTACT_CLICKS = 'contact_clicks', _('Клики на контакты')
+    
+    exhibition = models.ForeignKey(
+        Exhibition,
+        on_delete=models.CASCADE,
+        related_name='analytics',
+        verbose_name=_('Выставка')
+    )
+    metric_type = models.CharField(
+        _('Тип метрики'),
+        max_length=20,
+        choices=MetricType.choices
+    )
+    value = models.PositiveIntegerField(_('Значение'), default=0)
+    date = models.DateField(_('Дата'))
+    
+    # Дополнительные параметры
+    source = models.CharField(_('Источник'), max_length=100, blank=True)
+    user_agent = models.CharField(_('User Agent'), max_length=255, blank=True)
+    ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
+    
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Аналитика выставки')
+        verbose_name_plural = _('Аналитика выставок')
+        db_table = 'exhibition_analytics'
+        unique_together = ('exhibition', 'metric_type', 'date')
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['exhibition', 'metric_type']),
+            models.Index(fields=['date']),
+            models.Index(fields=['-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.exhibition.title} - {self.get_metric_type_display()} - {self.date}"
+
+    @classmethod
+    def record_metric(cls, exhibition, metric_type, value=1, date=None, **kwargs):
+        """
+        Записывает метрику. В рамках HTTP-запроса запись откладывается
+        до конца ответа и выполняется одной пачкой
+        """
+        if date is None:
+            date = timezone.now().date()
+        
+        record_increment(
+            cls,
+            {'exhibition': exhibition, 'metric_type': metric_type, 'date': date, 'value': value, **kwargs},
+            conflict_fields=('exhibition', 'metric_type', 'date')
         )
-        
-        # Основная информация
-        name = models.CharField(_('Название'), max_length=200)
-        description = models.TextField(_('Описание'), blank=True)
-        sponsor_type = models.CharField(
-            _('Тип спонсорства'),
-            max_length=20,
-            choices=SponsorType.choices,
-            default=SponsorType.PARTNER
+
+    @classmethod
+    def record_metrics_bulk(cls, metrics):
+        """
+        Записывает пачку метрик одним upsert-запросом.
+        metrics - словари с ключами exhibition, metric_type, value (по умолчанию 1),
+        date (по умолчанию сегодня) и необязательными source, user_agent, ip_address
+        """
+        today = timezone.now().date()
+        rows = [
+            {'value': 1, **metric, 'date': metric.get('date') or today}
+            for metric in metrics
+        ]
+        return upsert_increments(cls, rows, conflict_fields=('exhibition', 'metric_type', 'date'))
+
+    @classmethod
+    def get_exhibition_stats(cls, exhibition, start_date=None, end_date=None):
+        """Получает статистику выставки за период (с оценкой уникальных посетителей, см. UniqueVisitors.stats)"""
+        stats = metric_totals(
+            cls.objects.filter(exhibition=exhibition),
+            cls.MetricType.values,
+            start_date=start_date,
+            end_date=end_date
         )
-        
-        # Медиа
-        logo = models.ImageField(
-            _('Логотип'),
-            upload_to='sponsors/',
-            help_text=_('Рекомендуемый размер: 300x150 пикселей')
+        stats.update(unique_visitors.stats(exhibition, start_date, end_date))
+        return stats
+
+    @classmethod
+    def get_stats_series(cls, exhibitions, start_date=None, end_date=None, period='day'):
+        """
+        Итоги и ряды по дням/неделям/месяцам (period: day, week, month)
+        для одной или нескольких выставок одним запросом
+        """
+        return metric_series(
+            cls.objects.all(),
+            'exhibition',
+            exhibitions,
+            cls.MetricType.values,
+            start_date=start_date,
+            end_date=end_date,
+            period=period
         )
-        
-        # Контакты
-        website = models.URLField(_('Веб-сайт'), blank=True)
-        contact_email = models.EmailField(_('Контактный email'), blank=True)
-        
-        # Настройки отображения
-        sort_order = models.PositiveIntegerField(_('Порядок'), default=0)
-        is_featured = models.BooleanField(_('Показывать на главной'), default=True)
-        
-        created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
 
-        class Meta:
-            verbose_name = _('Спонсор выставки')
-            verbose_name_plural = _('Спонсоры выставки')
-            db_table = 'exhibition_sponsors'
-            ordering = ['sort_order', 'name']
 
-        def __str__(self):
-            return f"{self.name} - {self.exhibition.title}"
+# Сигналы для автоматических действи
 
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
-    class ExhibitionAnalytics(models.Model):
-        """Аналитика по выставкам"""
-        
-        class MetricType(models.TextChoices):
-            VIEWS = 'views', _('Просмотры')
-            REGISTRATIONS = 'registrations', _('Регистрации')
-            FAVORITES = 'favorites', _('Добавления в избранное')
-            DOCUMENT_DOWNLOADS = 'document_downloads', _('Скачивания документов')
-            WEBSITE_CLICKS = 'website_clicks', _('Клики на сайт')
-            CONTACT_CLICKS = 'contact_clicks', _('Клики на контакты')
-        
-        exhibition = models.ForeignKey(
-            Exhibition,
-            on_delete=models.CASCADE,
-            related_name='analytics',
-            verbose_name=_('Выставка')
-        )
-        metric_type = models.CharField(
-            _('Тип метрики'),
-            max_length=20,
-            choices=MetricType.choices
-        )
-        value = models.PositiveIntegerField(_('Значение'), default=0)
-        date = models.DateField(_('Дата'))
-        
-        # Дополнительные параметры
-        source = models.CharField(_('Источник'), max_length=100, blank=True)
-        user_agent = models.CharField(_('User Agent'), max_length=255, blank=True)
-        ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
-        
-        created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
-
-        class Meta:
-            verbose_name = _('Аналитика выставки')
-            verbose_name_plural = _('Аналитика выставок')
-            db_table = 'exhibition_analytics'
-            unique_together = ('exhibition', 'metric_type', 'date')
-            ordering = ['-date']
-            indexes = [
-                models.Index(fields=['exhibition', 'metric_type']),
-                models.Index(fields=['date']),
-                models.Index(fields=['-created_at']),
-            ]
-
-        def __str__(self):
-            return f"{self.exhibition.title} - {self.get_metric_type_display()} - {self.date}"
-
-        @classmethod
-        def record_metric(cls, exhibition, metric_type, value=1, date=None, **kwargs):
-            """Записывает метрику"""
-            if date is None:
-                date = timezone.now().date()
-            
-            metric, created = cls.objects.get_or_create(
-                exhibition=exhibition,
-                metric_type=metric_type,
-                date=date,
-                defaults={'value': value, **kwargs}
+@receiver(post_save, sender=Exhibition)
+def exhibition_post_save(sender, instance, created, **kwargs):
+    """Действия после сохранения выставки"""
+    if created:
+        # Логируем создание выставки
+        try:
+            from apps.users.models import UserActivity
+            UserActivity.log_activity(
+                user=instance.organizer,
+                activity_type=UserActivity.ActivityType.EXHIBITION_CREATE,
+                description=f"Создана выставка: {instance.title}"
             )
-            
-            if not created:
-                metric.value += value
-                metric.save(update_fields=['value'])
-            
-            return metric
+        except ImportError:
+            pass
 
-        @classmethod
-        def get_exhibition_stats(cls, exhibition, start_date=None, end_date=None):
-            """Получает статистику выставки за период"""
-            queryset = cls.objects.filter(exhibition=exhibition)
-            
-            if start_date:
-                queryset = queryset.filter(date__gte=start_date)
-            if end_date:
-                queryset = queryset.filter(date__lte=end_date)
-            
-            stats = {}
-            for metric_type, _ in cls.MetricType.choices:
-                stats[metric_type] = queryset.filter(
-                    metric_type=metric_type
-                ).aggregate(
-                    total=models.Sum('value')
-                )['total'] or 0
-            
-            return stats
-
-
-    # Сигналы для автоматических действи
-
-    from django.db.models.signals import post_save, post_delete
-    from django.dispatch import receiver
-
-    @receiver(post_save, sender=Exhibition)
-    def exhibition_post_save(sender, instance, created, **kwargs):
-        """Действия после сохранения выставки"""
-        if created:
-            # Логируем создание выставки
-            try:
-                from apps.users.models import UserActivity
-                UserActivity.log_activity(
-                    user=instance.organizer,
-                    activity_type=UserActivity.ActivityType.EXHIBITION_CREATE,
-                    description=f"Создана выставка: {instance.title}"
-                )
-            except ImportError:
-                pass
-
-    @receiver(post_save, sender=FavoriteExhibition)
-    def favorite_exhibition_post_save(sender, instance, created, **kwargs):
-        """Действия после добавления в избранное"""
-        if created:
-            # Увеличиваем счетчик
-            instance.exhibition.favorites_count += 1
-            instance.exhibition.save(update_fields=['favorites_count'])
-            
-            # Логируем активность
-            try:
-                from apps.users.models import UserActivity
-                UserActivity.log_activity(
-                    user=instance.user,
-                    activity_type=UserActivity.ActivityType.FAVORITE_ADD,
-                    description=f"Добавлена в избранное выставка: {instance.exhibition.title}"
-                )
-            except ImportError:
-                pass
-
-    @receiver(post_delete, sender=FavoriteExhibition)
-    def favorite_exhibition_post_delete(sender, instance, **kwargs):
-        """Действия после удаления из избранного"""
-        # Уменьшаем счетчик
-        if instance.exhibition.favorites_count > 0:
-            instance.exhibition.favorites_count -= 1
-            instance.exhibition.save(update_fields=['favorites_count'])
-        
-        # Логируем активность
+@receiver(post_save, sender=FavoriteExhibition)
+def favorite_exhibition_post_save(sender, instance, created, **kwargs):
+    """Действия после добавления в избранное"""
+    if created:
+        # Логируем активность (счетчик обновляется через apps.core.counters)
         try:
             from apps.users.models import UserActivity
             UserActivity.log_activity(
                 user=instance.user,
-                activity_type=UserActivity.ActivityType.FAVORITE_REMOVE,
-                description=f"Удалена из избранного выставка: {instance.exhibition.title}"
+                activity_type=UserActivity.ActivityType.FAVORITE_ADD,
+                description=f"Добавлена в избранное выставка: {instance.exhibition.title}"
             )
         except ImportError:
             pass
 
-    @receiver(post_save, sender=ExhibitionRegistration)
-    def exhibition_registration_post_save(sender, instance, created, **kwargs):
-        """Действия после регистрации на выставку"""
-        if created:
-            # Записываем в аналитику
-            ExhibitionAnalytics.record_metric(
-                exhibition=instance.exhibition,
-                metric_type=ExhibitionAnalytics.MetricType.REGISTRATIONS
-            )
+@receiver(post_delete, sender=FavoriteExhibition)
+def favorite_exhibition_post_delete(sender, instance, **kwargs):
+    """Действия после удаления из избранного"""
+    # Логируем активность (счетчик обновляется через apps.core.counters)
+    try:
+        from apps.users.models import UserActivity
+        UserActivity.log_activity(
+            user=instance.user,
+            activity_type=UserActivity.ActivityType.FAVORITE_REMOVE,
+            description=f"Удалена из избранного выставка: {instance.exhibition.title}"
+        )
+    except ImportError:
+        pass
+
+@receiver(post_save, sender=ExhibitionRegistration)
+def exhibition_registration_post_save(sender, instance, created, **kwargs):
+    """Действия после регистрации на выставку"""
+    if created:
+        # Записываем в аналитику
+        ExhibitionAnalytics.record_metric(
+            exhibition=instance.exhibition,
+            metric_type=ExhibitionAnalytics.MetricType.REGISTRATIONS
+        )
 
 
 
 
-    # Дополнительные QuerySet и методы
-    class ExhibitionQuerySet(models.QuerySet):
-        """Дополнительные методы для запросов выставок"""
-        
-        def with_location(self):
-            """Выставки с указанным местоположением"""
-            return self.exclude(
-                models.Q(city='') | models.Q(city__isnull=True)
-            )
-        
-        def with_contacts(self):
-            """Выставки с контактной информацией"""
-            return self.exclude(
-                models.Q(contact_email='') & 
-                models.Q(contact_phone='') & 
-                models.Q(website='')
-            )
-        
-        def this_month(self):
-            """Выставки в этом месяце"""
-            from django.utils import timezone
-            now = timezone.now()
-            return self.filter(
-                start_date__year=now.year,
-                start_date__month=now.month
-            )
+# Дополнительные QuerySet и методы
+class ExhibitionQuerySet(models.QuerySet):
+    """Дополнительные методы для запросов выставок"""
+    
+    def with_location(self):
+        """Выставки с указанным местоположением"""
+        return self.exclude(
+            models.Q(city='') | models.Q(city__isnull=True)
+        )
+    
+    def with_contacts(self):
+        """Выставки с контактной информацией"""
+        return self.exclude(
+            models.Q(contact_email='') & 
+            models.Q(contact_phone='') & 
+            models.Q(website='')
+        )
+    
+    def this_month(self):
+        """Выставки в этом месяце"""
+        from django.utils import timezone
+        now = timezone.now()
+        return self.filter(
+            start_date__year=now.year,
+            start_date__month=now.month
+        )
+    
+    def next_month(self):
+        """Выставки в следующем месяце"""
+        from django.utils import timezone
+        import calendar
         
-        def next_month(self):
-            """Выставки в следующем месяце"""
-            from django.utils import timezone
-            import calendar
+        now = timezone.now()
+        if now.month == 12:
+            next_month = 1
+            next_year = now.year + 1
+        else:
+            next_month = now.month + 1
+            next_year = now.year
             
-            now = timezone.now()
-            if now.month == 12:
-                next_month = 1
-                next_year = now.year + 1
-            else:
-                next_month = now.month + 1
-                next_year = now.year
-                
-            return self.filter(
-                start_date__year=next_year,
-                start_date__month=next_month
-            )
-        
-        def by_rating(self, min_rating=3.0):
-            """Выставки с рейтингом выше указанного"""
-            return self.filter(rating__gte=min_rating)
-        
-        def free_events(self):
-            """Бесплатные мероприятия"""
-            return self.filter(is_free=True)
-        
-        def paid_events(self):
-            """Платные мероприятия"""
-            return self.filter(is_free=False)
-        
-        def online_events(self):
-            """Онлайн мероприятия"""
-            return self.filter(format__in=['online', 'hybrid'])
-        
-        def offline_events(self):
-            """Оффлайн мероприятия"""
-            return self.filter(format__in=['offline', 'hybrid'])
-
-    # Добавляем QuerySet к менеджеру
-    ExhibitionManager = ExhibitionManager.from_queryset(ExhibitionQuerySet)
-    Exhibition.add_to_class('objects', ExhibitionManager())
\ No newline at end of file
+        return self.filter(
+            start_date__year=next_year,
+            start_date__month=next_month
+        )
+    
+    def by_rating(self, min_rating=3.0):
+        """Выставки с рейтингом выше указанного"""
+        return self.filter(rating__gte=min_rating)
+    
+    def free_events(self):
+        """Бесплатные мероприятия"""
+        return self.filter(is_free=True)
+    
+    def paid_events(self):
+        """Платные мероприятия"""
+        return self.filter(is_free=False)
+    
+    def online_events(self):
+        """Онлайн мероприятия"""
+        return self.filter(format__in=['online', 'hybrid'])
+    
+    def offline_events(self):
+        """Оффлайн мероприятия"""
+        return self.filter(format__in=['offline', 'hybrid'])
+
+# Добавляем QuerySet к менеджеру
+ExhibitionManager = ExhibitionManager.from_queryset(ExhibitionQuerySet)
+Exhibition.add_to_class('objects', ExhibitionManager())
+
+
+# Денормализованные счетчики выставок
+counters.register('exhibitions.Exhibition', 'favorites_count', 'exhibitions.FavoriteExhibition', 'exhibition')
+# Отмененные регистрации не занимают места (см. can_register)
+ACTIVE_REGISTRATION = {
+    'status': [
+        status for status in ExhibitionRegistration.Status.values
+        if status != ExhibitionRegistration.Status.CANCELLED
+    ],
+}
+counters.register(
+    'exhibitions.Exhibition', 'registrations_count', 'exhibitions.ExhibitionRegistration', 'exhibition',
+    condition=ACTIVE_REGISTRATION,
+)
+
+# Уникальные slug
+slugs.register('exhibitions.Category', source='name')
+slugs.register('exhibitions.Exhibition', source='title')
+slugs.register('exhibitions.ExhibitionTag', source='name')
+
+# Счетчики категорий: прямые и с учетом подкатегорий
+PUBLISHED_EXHIBITION = {'status': 'published'}
+ACTIVE_COMPANY = {'is_active': True, 'status': 'active'}
+counters.register(
+    'exhibitions.Category', 'exhibitions_count', 'exhibitions.Exhibition', 'category',
+    condition=PUBLISHED_EXHIBITION,
+)
+counters.register(
+    'exhibitions.Category', 'exhibitions_total', 'exhibitions.Exhibition', 'category',
+    condition=PUBLISHED_EXHIBITION, rollup='path',
+)
+counters.register(
+    'exhibitions.Category', 'companies_count', 'companies.Company', 'category',
+    condition=ACTIVE_COMPANY,
+)
+counters.register(
+    'exhibitions.Category', 'companies_total', 'companies.Company', 'category',
+    condition=ACTIVE_COMPANY, rollup='path',
+)
+
+
+@receiver(post_delete, sender=Category)
+def reconcile_category_ancestors(sender, instance, **kwargs):
+    """Выставки и компании удаленной категории остаются без категории - итоги предков уменьшаются"""
+    Category.reconcile_totals(instance.path)
+
+
+# Рейтинг "в тренде"
+trending.register(
+    'exhibitions.Exhibition',
+    weights={'view': 1, 'favorite': 5, 'registration': 10},
+    sources={
+        'favorite': ('exhibitions.FavoriteExhibition', 'exhibition'),
+        'registration': ('exhibitions.ExhibitionRegistration', 'exhibition'),
+    },
+)
+
+
+# Полнотекстовый поиск
+search_indexes.register(
+    'exhibitions.Exhibition',
+    fields={
+        'a': ['title'],
+        'b': ['short_description', 'city', 'venue_name'],
+        'c': ['description'],
+    },
+    condition={'status': 'published'},
+)
+search_results.register('exhibitions.Exhibition')
+
+
+# Автодополнение
+autocomplete.register(
+    'exhibitions.Exhibition',
+    kind='exhibition',
+    label='title',
+    weight='views_count',
+    condition={'status': 'published'},
+    city='city',
+)
+
+
+# Производные изображения (превью, карточки, баннеры)
+image_derivatives.register('exhibitions.Exhibition', 'logo', 'banner_image')
+image_derivatives.register('exhibitions.ExhibitionImage', 'image')
+image_derivatives.register('exhibitions.ExhibitionSpeaker', 'photo')
+image_derivatives.register('exhibitions.ExhibitionSponsor', 'logo')
+
+# Геоячейки: поиск по координатам и кластеры карты
+geo_cells.register('exhibitions.Exhibition')
+map_clusters.register('exhibitions.Exhibition', kind='exhibition', condition={'status': 'published'})
+
+
+# Сброс кэша фасетов
+facet_cache.bump_on_change('exhibitions.Exhibition')
+facet_cache.bump_on_change('exhibitions.Category')
+
+# Версия дерева категорий в памяти воркеров
+category_tree.version.bump_on_change('exhibitions.Category')
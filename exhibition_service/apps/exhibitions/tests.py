@@ -1,3 +1,438 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.companies.models import Company
+from apps.core.counters import counters
+from apps.core.models import Analytics
+from apps.core.trending import current_value, trending
+
+from .category_tree import category_tree
+from .models import Category, Exhibition, ExhibitionRegistration
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SYNC_INGESTION = {'BACKEND': 'sync'}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class CategoryTreeTests(TestCase):
+    """Материализованный путь категорий"""
+
+    def test_move_rewrites_descendant_paths(self):
+        root = Category.objects.create(name='Root')
+        other = Category.objects.create(name='Other')
+        child = Category.objects.create(name='Child', parent=root)
+        grandchild = Category.objects.create(name='Grandchild', parent=child)
+        self.assertEqual(grandchild.path, f'{root.pk}/{child.pk}/{grandchild.pk}/')
+
+        child.parent = other
+        child.save()
+
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.path, f'{other.pk}/{child.pk}/{grandchild.pk}/')
+        self.assertEqual(grandchild.depth, 2)
+        self.assertEqual(
+            set(Category.objects.subtree(other).values_list('pk', flat=True)),
+            {other.pk, child.pk, grandchild.pk},
+        )
+        self.assertEqual(list(Category.objects.subtree(root, include_self=False)), [])
+
+    def test_subtree_does_not_match_sibling_prefix(self):
+        first = Category.objects.create(name='First')
+        sibling = Category.objects.create(name='Sibling')
+        # Путь "N/" не должен захватывать корень с путем "N1/"
+        Category.objects.filter(pk=sibling.pk).update(path=f'{first.pk}1/')
+        self.assertEqual(list(Category.objects.subtree(first)), [first])
+
+    def test_move_into_own_subtree_is_rejected(self):
+        root = Category.objects.create(name='Root')
+        child = Category.objects.create(name='Child', parent=root)
+        root.parent = child
+        with self.assertRaises(ValueError):
+            root.save()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION, CATEGORY_TREE={'CHECK_INTERVAL': 60})
+class CategoryTreeCacheTests(TestCase):
+    """Дерево категорий в памяти процесса"""
+
+    def setUp(self):
+        cache.clear()
+        category_tree.reset()
+        self.addCleanup(category_tree.reset)
+        self.clock = [1000.0]
+        patcher = mock.patch('apps.exhibitions.category_tree.time.monotonic', side_effect=lambda: self.clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reload_only_after_version_change(self):
+        root = Category.objects.create(name='Root')
+        child = Category.objects.create(name='Child', parent=root)
+        tree = Category.objects.tree()
+        self.assertEqual([node.id for node in tree.children(root.pk)], [child.pk])
+        self.assertEqual(str(tree.get(child.pk)), 'Root → Child')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Second', parent=root)
+        # Версия сменилась, но до CHECK_INTERVAL дерево не проверяется
+        with self.assertNumQueries(0):
+            self.assertIs(Category.objects.tree(), tree)
+
+        self.clock[0] += 61
+        with self.assertNumQueries(1):
+            fresh = Category.objects.tree()
+        self.assertEqual(len(fresh.children(root.pk)), 2)
+
+        # Версия не менялась: дерево не перечитывается
+        self.clock[0] += 61
+        with self.assertNumQueries(0):
+            self.assertIs(Category.objects.tree(), fresh)
+
+    def test_inactive_category_hides_subtree(self):
+        root = Category.objects.create(name='Root')
+        hidden = Category.objects.create(name='Hidden', parent=root, is_active=False)
+        leaf = Category.objects.create(name='Leaf', parent=hidden)
+        tree = Category.objects.tree()
+        self.assertEqual(set(tree.nodes), {root.pk})
+        self.assertEqual([node.id for node in tree.breadcrumbs(root.pk)], [root.pk])
+
+        # Отображаемое имя скрытой категории берется из дерева без запроса
+        leaf = Category.objects.get(pk=leaf.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(leaf), 'Hidden → Leaf')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class CategoryCounterTests(TestCase):
+    """Денормализованные счетчики категорий с итогами по поддереву"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        self.root = Category.objects.create(name='Root')
+        self.child = Category.objects.create(name='Child', parent=self.root)
+
+    def create_exhibition(self, category, status=Exhibition.Status.PUBLISHED):
+        now = timezone.now()
+        return Exhibition.objects.create(
+            title='Expo', description='-', organizer=self.user, category=category,
+            start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+            venue_name='-', address='-', city='Москва', status=status,
+        )
+
+    def counts(self, category, prefix='exhibitions'):
+        category.refresh_from_db()
+        return getattr(category, f'{prefix}_count'), getattr(category, f'{prefix}_total')
+
+    def test_status_change_updates_category_and_ancestors(self):
+        exhibition = self.create_exhibition(self.child, status=Exhibition.Status.DRAFT)
+        self.assertEqual(self.counts(self.child), (0, 0))
+
+        exhibition.status = Exhibition.Status.PUBLISHED
+        exhibition.save()
+        self.assertEqual(self.counts(self.child), (1, 1))
+        self.assertEqual(self.counts(self.root), (0, 1))
+
+        exhibition.status = Exhibition.Status.DRAFT
+        exhibition.save()
+        self.assertEqual(self.counts(self.child), (0, 0))
+        self.assertEqual(self.counts(self.root), (0, 0))
+
+    def test_category_change_moves_counts(self):
+        other = Category.objects.create(name='Other')
+        exhibition = self.create_exhibition(self.child)
+
+        exhibition.category = other
+        exhibition.save()
+        self.assertEqual(self.counts(self.child), (0, 0))
+        self.assertEqual(self.counts(self.root), (0, 0))
+        self.assertEqual(self.counts(other), (1, 1))
+
+    def test_company_status_change(self):
+        company = Company.objects.create(
+            name='Acme', description='-', created_by=self.user, category=self.child, status='active',
+        )
+        self.assertEqual(self.counts(self.root, 'companies'), (0, 1))
+        company.is_active = False
+        company.save()
+        self.assertEqual(self.counts(self.root, 'companies'), (0, 0))
+
+    def test_subtree_move_reconciles_totals(self):
+        self.create_exhibition(self.child)
+        other = Category.objects.create(name='Other')
+        self.child.parent = other
+        self.child.save()
+        self.assertEqual(self.counts(self.root), (0, 0))
+        self.assertEqual(self.counts(other), (0, 1))
+
+    def test_live_counts_match_stored(self):
+        self.create_exhibition(self.child)
+        self.create_exhibition(self.root)
+        rows = Category.objects.with_live_counts(include_descendants=True).values_list(
+            'live_exhibitions_count', 'exhibitions_total',
+        )
+        for live, stored in rows:
+            self.assertEqual(live, stored)
+        self.assertEqual(self.counts(self.root), (1, 2))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class RegistrationCounterTests(TestCase):
+    """Счетчик регистраций не учитывает отмененные"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        now = timezone.now()
+        self.exhibition = Exhibition.objects.create(
+            title='Expo', description='-', organizer=user, category=Category.objects.create(name='Build'),
+            start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+            venue_name='-', address='-', city='Москва', status=Exhibition.Status.PUBLISHED,
+            max_participants=1,
+        )
+
+    def register(self, email, **fields):
+        return ExhibitionRegistration.objects.create(
+            exhibition=self.exhibition, first_name='-', last_name='-', email=email, **fields,
+        )
+
+    def registrations(self):
+        self.exhibition.refresh_from_db()
+        return self.exhibition.registrations_count
+
+    def test_cancelled_registration_frees_seat(self):
+        registration = self.register('a@example.com')
+        self.assertEqual(self.registrations(), 1)
+
+        registration.status = ExhibitionRegistration.Status.CANCELLED
+        registration.save()
+        self.assertEqual(self.registrations(), 0)
+
+        self.register('b@example.com', status=ExhibitionRegistration.Status.CANCELLED)
+        self.assertEqual(self.registrations(), 0)
+
+        registration.status = ExhibitionRegistration.Status.CONFIRMED
+        registration.save()
+        self.assertEqual(self.registrations(), 1)
+
+        registration.delete()
+        self.assertEqual(self.registrations(), 0)
+
+    def test_reconcile_skips_cancelled(self):
+        self.register('a@example.com')
+        self.register('b@example.com', status=ExhibitionRegistration.Status.CANCELLED)
+        Exhibition.objects.filter(pk=self.exhibition.pk).update(registrations_count=5)
+
+        counter = counters.get('exhibitions.Exhibition.registrations_count')
+        self.assertEqual(list(counter.drifted()), [self.exhibition])
+        counter.reconcile()
+        self.assertEqual(self.registrations(), 1)
+        self.assertEqual(list(counter.drifted()), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class FacetFilterTests(TestCase):
+    """Фасетные фильтры из параметров запроса"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        self.category = Category.objects.create(name='Build')
+        now = timezone.now()
+        self.exhibition = Exhibition.objects.create(
+            title='Expo', description='-', organizer=user, category=self.category,
+            start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+            venue_name='-', address='-', city='Москва', status=Exhibition.Status.PUBLISHED,
+        )
+
+    def test_invalid_values_are_dropped(self):
+        filters = {'category': 'abc', 'month': '2025-13', 'city': ' москва '}
+        self.assertEqual(list(Exhibition.objects.faceted(**filters)), [self.exhibition])
+        self.assertEqual(Exhibition.objects.facet_counts(**filters)['total'], 1)
+        self.assertEqual(list(Exhibition.objects.faceted(month='янв', category='-1')), [self.exhibition])
+
+    def test_valid_values_filter(self):
+        month = self.exhibition.start_date.strftime('%Y-%m')
+        self.assertEqual(
+            list(Exhibition.objects.faceted(category=str(self.category.pk), month=month)), [self.exhibition]
+        )
+        self.assertEqual(list(Exhibition.objects.faceted(category=str(self.category.pk + 1))), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class SearchLimitTests(TestCase):
+    """Предел выдачи поиска и признак усечения"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        category = Category.objects.create(name='Build')
+        now = timezone.now()
+        for number in range(3):
+            Exhibition.objects.create(
+                title=f'Robotics {number}', description='-', organizer=user, category=category,
+                start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+                venue_name='-', address='-', city='Москва', status=Exhibition.Status.PUBLISHED,
+            )
+
+    def test_truncated_flag(self):
+        for cached in (False, True):
+            with self.subTest(cached=cached):
+                results = Exhibition.objects.search('robotics', cached=cached, record=False, limit=2)
+                self.assertEqual(len(results), 2)
+                self.assertEqual(results.search_limit, 2)
+                self.assertTrue(results.search_truncated)
+
+                results = Exhibition.objects.search('robotics', cached=cached, record=False, limit=3)
+                self.assertEqual(len(results), 3)
+                self.assertFalse(results.search_truncated)
+
+    def test_cached_hit_keeps_flag(self):
+        Exhibition.objects.search('robotics', record=False, limit=2)
+        results = Exhibition.objects.search('robotics', record=False, limit=2)
+        self.assertTrue(results.search_truncated)
+        self.assertEqual(len(Exhibition.objects.search('robotics', record=False)), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class SearchCacheTests(TestCase):
+    """Кэш результатов поиска и запись запросов"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        self.category = Category.objects.create(name='Build')
+        self.first = self.create('Робототехника')
+        cache.clear()
+
+    def create(self, title):
+        now = timezone.now()
+        return Exhibition.objects.create(
+            title=title, description='-', organizer=self.user, category=self.category,
+            start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+            venue_name='-', address='-', city='Москва', status=Exhibition.Status.PUBLISHED,
+        )
+
+    def searches(self):
+        return list(
+            Analytics.objects.filter(event_type=Analytics.EventType.SEARCH)
+            .order_by('pk').values_list('metadata', flat=True)
+        )
+
+    def test_normalized_queries_share_cache_and_are_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(list(Exhibition.objects.search('Робототехника')), [self.first])
+            self.assertEqual(list(Exhibition.objects.search('  РОБОТОТЕХНИКА ')), [self.first])
+            Exhibition.objects.search('робототехника', record=False)
+        self.assertEqual(
+            [(event['query'], event['cache_hit'], event['results']) for event in self.searches()],
+            [('робототехника', False, 1), ('робототехника', True, 1)],
+        )
+
+    def test_index_change_invalidates_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(Exhibition.objects.search('робототехника', record=False)), 1)
+            second = self.create('Робототехника 2')
+        self.assertEqual(
+            set(Exhibition.objects.search('робототехника', record=False)), {self.first, second},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.status = Exhibition.Status.DRAFT
+            second.save()
+        self.assertEqual(list(Exhibition.objects.search('робототехника', record=False)), [self.first])
+
+    def test_cached_keys_still_pass_base_queryset(self):
+        Exhibition.objects.search('робототехника', record=False)
+        # Снятие с публикации без сигналов: кэш не сброшен
+        Exhibition.objects.filter(pk=self.first.pk).update(status=Exhibition.Status.DRAFT)
+        self.assertEqual(list(Exhibition.objects.search('робототехника', record=False)), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION)
+class GeoSearchTests(TestCase):
+    """Поиск выставок по радиусу и прямоугольнику карты"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        self.category = Category.objects.create(name='Build')
+
+    def create(self, title, latitude, longitude, status=Exhibition.Status.PUBLISHED):
+        now = timezone.now()
+        return Exhibition.objects.create(
+            title=title, description='-', organizer=self.user, category=self.category,
+            start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+            venue_name='-', address='-', city='-', status=status,
+            latitude=latitude, longitude=longitude,
+        )
+
+    def test_geo_cell_follows_coordinates(self):
+        exhibition = self.create('Expo', '55.75580000', '37.61730000')
+        self.assertTrue(exhibition.geo_cell.startswith('ucfv'))
+        exhibition.latitude, exhibition.longitude = None, None
+        exhibition.save()
+        exhibition.refresh_from_db()
+        self.assertEqual(exhibition.geo_cell, '')
+
+    def test_near_filters_by_exact_distance_and_orders(self):
+        kremlin = self.create('Kremlin', '55.75200000', '37.61750000')
+        vdnh = self.create('VDNH', '55.82650000', '37.63790000')
+        self.create('Zelenograd', '55.99170000', '37.21440000')
+        self.create('Draft', '55.75300000', '37.61800000', status=Exhibition.Status.DRAFT)
+
+        found = list(Exhibition.objects.near('55.7558', '37.6173', 10))
+        self.assertEqual(found, [kremlin, vdnh])
+        self.assertLess(found[0].distance_km, 1)
+        self.assertAlmostEqual(found[1].distance_km, 7.9, delta=0.3)
+
+    def test_bbox_across_antimeridian(self):
+        east = self.create('Anadyr', '64.73490000', '177.51000000')
+        west = self.create('Nome', '64.50110000', '-165.40640000')
+        self.create('Moscow', '55.75580000', '37.61730000')
+
+        found = Exhibition.objects.in_bbox(60, 170, 70, -160)
+        self.assertEqual(set(found), {east, west})
+        self.assertEqual(list(Exhibition.objects.in_bbox(60, 170, 70, 179)), [east])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_INGESTION=SYNC_INGESTION, TRENDING={'HALF_LIFE_HOURS': 48})
+class TrendingTests(TestCase):
+    """Рейтинг "в тренде" с затуханием"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='org@example.com', username='org', password='x')
+        category = Category.objects.create(name='Build')
+        now = timezone.now()
+        self.old, self.new = (
+            Exhibition.objects.create(
+                title=title, description='-', organizer=user, category=category,
+                start_date=now + timedelta(days=3), end_date=now + timedelta(days=5),
+                venue_name='-', address='-', city='-', status=Exhibition.Status.PUBLISHED,
+            )
+            for title in ('Old', 'New')
+        )
+        self.score = trending.get('exhibitions.Exhibition')
+
+    def value(self, exhibition, now=None):
+        exhibition.refresh_from_db()
+        return current_value(exhibition.trending_score, now)
+
+    def test_old_activity_decays_below_fresh(self):
+        now = timezone.now()
+        # Десять периодов полураспада назад: 100 просмотров весят 100 / 1024
+        self.score.bump([self.old.pk], 'view', amount=100, now=now - timedelta(hours=480))
+        self.score.bump([self.new.pk], 'view', now=now)
+        self.assertAlmostEqual(self.value(self.old, now), 100 / 1024, places=3)
+        self.assertAlmostEqual(self.value(self.new, now), 1, places=3)
+        self.assertEqual(list(Exhibition.objects.trending(2)), [self.new, self.old])
+
+        self.score.bump([self.old.pk], 'view', amount=3, now=now)
+        self.assertAlmostEqual(self.value(self.old, now), 3 + 100 / 1024, places=3)
+        self.assertEqual(list(Exhibition.objects.trending(1)), [self.old])
+
+    def test_registration_adds_its_weight(self):
+        ExhibitionRegistration.objects.create(
+            exhibition=self.new, first_name='-', last_name='-', email='a@example.com',
+        )
+        self.assertAlmostEqual(self.value(self.new), 10, places=2)
+        self.assertEqual(self.score.bump([self.old.pk], 'unknown'), 0)
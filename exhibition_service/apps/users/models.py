@@ -11,6 +11,9 @@ import uuid
 import secrets
 from datetime import timedelta
 
+from apps.core.images import image_derivatives
+from apps.core.ingestion import ingestion_queue
+
 
 class User(AbstractUser):
     """Кастомная модель пользователя"""
@@ -540,7 +543,11 @@ class UserActivity(models.Model):
 
     @classmethod
     def log_activity(cls, user, activity_type, description='', request=None, **metadata):
-        """Логирует активность пользователя"""
+        """
+        Логирует активность пользователя через очередь событий.
+        Возвращает несохраненный экземпляр (pk = None): запись
+        выполняется позже, после коммита текущей транзакции
+        """
         ip_address = None
         user_agent = ''
         
@@ -548,7 +555,7 @@ class UserActivity(models.Model):
             ip_address = cls.get_client_ip(request)
             user_agent = request.META.get('HTTP_USER_AGENT', '')
         
-        return cls.objects.create(
+        activity = cls(
             user=user,
             activity_type=activity_type,
             description=description,
@@ -556,6 +563,8 @@ class UserActivity(models.Model):
             user_agent=user_agent,
             metadata=metadata
         )
+        ingestion_queue.put(activity)
+        return activity
 
     @staticmethod
     def get_client_ip(request):
@@ -565,4 +574,8 @@ class UserActivity(models.Model):
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+# Производные аватаров (apps.core.images)
+image_derivatives.register('users.UserProfile', 'avatar')
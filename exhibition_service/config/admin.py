@@ -17,7 +17,8 @@ import json
 from apps.users.models import User, UserProfile
 from apps.exhibitions.models import Category, Exhibition
 from apps.companies.models import Company
-from apps.core.models import SiteSettings
+from apps.core.models import Analytics, SiteSettings
+from apps.core.rollups import rollup_totals
 
 
 class ExhibitionAdminSite(admin.AdminSite):
@@ -57,9 +58,17 @@ class ExhibitionAdminSite(admin.AdminSite):
         return TemplateResponse(request, 'admin/dashboard.html', context)
     
     def statistics_view(self, request):
-        """Страница статистики"""
+        """Страница статистики (события читаются из агрегатов, а не из сырых данных)"""
+        period_start = timezone.now() - timedelta(days=30)
+        totals = rollup_totals(start=period_start)
+        event_totals = [
+            {'label': label, 'value': totals[value]}
+            for value, label in Analytics.EventType.choices
+        ]
+        
         context = {
             'title': 'Статистика',
+            'event_totals': event_totals,
         }
         return TemplateResponse(request, 'admin/statistics.html', context)
     
@@ -69,6 +69,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.core.middleware.MetricsAccumulatorMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -85,6 +86,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.i18n',
+                'apps.exhibitions.context_processors.category_navigation',
             ],
         },
     },
@@ -271,4 +273,143 @@ LOGGING = {
             'propagate': True,
         },
     },
-}
\ No newline at end of file
+}
+
+# Буфер счетчиков просмотров (apps.core.view_counters)
+# BACKEND: memory - буфер в памяти воркера, cache - общий буфер в Redis
+VIEW_COUNTER_BUFFER = {
+    'BACKEND': config('VIEW_COUNTER_BACKEND', default='memory'),
+    'CACHE_ALIAS': 'default',
+    'FLUSH_INTERVAL': config('VIEW_COUNTER_FLUSH_INTERVAL', default=10, cast=int),  # секунды
+    'MAX_BUFFER_SIZE': config('VIEW_COUNTER_MAX_BUFFER_SIZE', default=1000, cast=int),
+}
+
+# Сроки хранения данных в днях (apps.core.retention, команда purge_expired_data)
+# overrides - отдельные сроки для типов событий
+DATA_RETENTION = {
+    'BATCH_SIZE': config('RETENTION_BATCH_SIZE', default=5000, cast=int),
+    'BATCH_PAUSE': 0.05,  # секунды между пачками
+    'POLICIES': {
+        'core.Analytics': {
+            'default': config('ANALYTICS_RETENTION_DAYS', default=180, cast=int),
+            'type_field': 'event_type',
+            'overrides': {'view': 90, 'search': 30},
+        },
+        'core.ViewHistory': {
+            'default': config('VIEW_HISTORY_RETENTION_DAYS', default=365, cast=int),
+        },
+        'users.UserActivity': {
+            'default': config('USER_ACTIVITY_RETENTION_DAYS', default=365, cast=int),
+            'type_field': 'activity_type',
+            'overrides': {'favorite_add': 90, 'favorite_remove': 90},
+        },
+    },
+}
+
+# Очередь записи событий аналитики и журналов (apps.core.ingestion)
+# BACKEND: thread - фоновая запись пачками, sync - запись сразу
+# OVERFLOW_POLICY: drop - отбрасывать при переполнении,
+# sample - после HIGH_WATER_MARK сохранять долю SAMPLE_RATE
+EVENT_INGESTION = {
+    'BACKEND': config('EVENT_INGESTION_BACKEND', default='thread'),
+    'MAX_QUEUE_SIZE': config('EVENT_INGESTION_MAX_QUEUE_SIZE', default=10000, cast=int),
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2,  # секунды
+    'OVERFLOW_POLICY': config('EVENT_INGESTION_OVERFLOW_POLICY', default='drop'),
+    'HIGH_WATER_MARK': 0.8,
+    'SAMPLE_RATE': 0.1,
+}
+
+# Размер LRU-кэша разбора User-Agent (apps.core.user_agents)
+USER_AGENT_CACHE_SIZE = config('USER_AGENT_CACHE_SIZE', default=4096, cast=int)
+
+# Офлайн-база GeoIP (apps.core.geoip, команда build_geoip_db)
+GEOIP_DATABASE_PATH = config('GEOIP_DATABASE_PATH', default=str(BASE_DIR / 'data' / 'geoip.dat'))
+GEOIP_PREFIX_CACHE_SIZE = 65536  # число кэшируемых подсетей /24
+
+# Дедупликация просмотров (apps.core.view_dedup)
+# BACKEND: cache - общее окно в Redis, bloom - фильтр Блума в памяти воркера
+VIEW_DEDUP = {
+    'BACKEND': config('VIEW_DEDUP_BACKEND', default='cache'),
+    'CACHE_ALIAS': 'default',
+    'WINDOW': config('VIEW_DEDUP_WINDOW', default=1800, cast=int),  # секунды
+    'BLOOM_CAPACITY': 1000000,
+    'BLOOM_ERROR_RATE': 0.001,
+}
+
+# Уникальные посетители на HyperLogLog (apps.core.unique_visitors)
+# BACKEND: db - скетчи в БД с буфером воркера, cache - PFADD/PFCOUNT в Redis
+UNIQUE_VISITORS = {
+    'BACKEND': config('UNIQUE_VISITORS_BACKEND', default='db'),
+    'CACHE_ALIAS': 'default',
+    'PRECISION': 13,  # 8 КБ на скетч, ошибка ~1.15%
+    'FLUSH_INTERVAL': 60,  # секунды
+    'MAX_BUFFER_SIZE': 500,
+}
+
+# Рейтинг "в тренде" (apps.core.trending)
+TRENDING = {
+    'HALF_LIFE_HOURS': config('TRENDING_HALF_LIFE_HOURS', default=48, cast=int),
+    'EPOCH': '2024-01-01',  # точка отсчета затухания; не менять без пересчета
+}
+
+# Автодополнение по префиксу (apps.core.autocomplete, команда build_autocomplete)
+AUTOCOMPLETE = {
+    'SNAPSHOT_PATH': config('AUTOCOMPLETE_SNAPSHOT_PATH', default=str(BASE_DIR / 'data' / 'autocomplete.idx')),
+    'SHORT_PREFIX_LENGTH': 2,  # для префиксов до 2 символов подсказки посчитаны заранее
+    'TOP_K': 20,
+    'UPDATE_DELAY': 2,  # секунды накопления изменений перед записью снимка
+    'RELOAD_CHECK_INTERVAL': 1,  # секунды между проверками замены файла
+}
+
+# Кэш результатов поиска (apps.core.search_cache, команда warm_search_cache)
+SEARCH_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': config('SEARCH_CACHE_TIMEOUT', default=600, cast=int),  # секунды
+    'RECORD_QUERIES': True,  # события Analytics с типом search
+}
+
+# Кластеры маркеров карты (apps.core.map_clusters, команда build_map_clusters)
+MAP_CLUSTERS = {
+    'CACHE_ALIAS': 'default',
+    'MAX_PRECISION': 7,  # самая мелкая ячейка geohash (~150 м)
+    'SHARD_DEPTH': 2,  # шард сетки - префикс ячейки на 2 символа короче
+    'MAX_SHARDS': 64,
+    'SAMPLE_SIZE': 5,  # примеров pk в кластере
+}
+
+# Дерево категорий в памяти воркеров (apps.exhibitions.category_tree)
+CATEGORY_TREE = {
+    'CACHE_ALIAS': 'default',  # здесь хранится версия дерева
+    'CHECK_INTERVAL': 1,  # секунды между проверками версии
+}
+
+# Производные изображения (apps.core.images, команда build_image_derivatives)
+# BACKEND: thread - пул фоновых потоков после коммита, sync - сразу
+IMAGE_DERIVATIVES = {
+    'BACKEND': config('IMAGE_DERIVATIVES_BACKEND', default='thread'),
+    'WORKERS': config('IMAGE_DERIVATIVES_WORKERS', default=2, cast=int),
+    'CACHE_ALIAS': 'default',  # имя оригинала -> хэш содержимого
+    'ROOT': 'derivatives',  # каталог в MEDIA_ROOT
+    'VARIANTS': {
+        'thumbnail': (300, 300),
+        'card': (600, 400),
+        'banner': (1600, 600),
+    },
+    'JPEG_QUALITY': 85,
+    'WEBP_QUALITY': 80,
+}
+
+# Превью по запросу /media/thumb/<w>x<h>/<путь> (apps.core.thumbnails)
+THUMBNAILS = {
+    'CACHE_DIR': config('THUMBNAILS_CACHE_DIR', default=str(BASE_DIR / 'data' / 'thumbnails')),
+    'MAX_SIZE': config('THUMBNAILS_MAX_SIZE', default=512 * 1024 * 1024, cast=int),  # байт
+    'LOW_WATER_MARK': 0.9,  # после вытеснения остается 90% MAX_SIZE
+    'TOUCH_INTERVAL': 3600,  # секунды между отметками использования варианта
+    'RESCAN_INTERVAL': 300,  # секунды между пересчетами объема кэша
+    'SIZES': [(150, 150), (300, 300), (600, 400), (1200, 400)],  # допустимые размеры превью
+    'MAX_DIMENSION': 2000,  # при SIZES = None
+    'MAX_RENDERS': 2,  # одновременных декодирований в процессе
+    'JPEG_QUALITY': 85,
+    'WEBP_QUALITY': 80,
+}